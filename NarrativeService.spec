@@ -319,16 +319,45 @@ module NarrativeService {
         object_info nar;
     } Narrative;
 
+    /*
+        narratives - the list of narratives
+        total - only returned if sort_by, offset, or limit were given. The total number of
+            narratives of the requested type, over all pages.
+        categories - only returned if types was given. Maps each requested type to the list
+            of workspace ids of its narratives (newest first), which are all in narratives.
+    */
     typedef structure {
         list <Narrative> narratives;
+        int total;
+        mapping<string, list<int>> categories;
     } NarrativeList;
 
     /* List narratives
         type parameter indicates which narratives to return.
         Supported options are for now 'mine', 'public', or 'shared'
+        sort_by - (optional) one of 'moddate' (newest first), 'name', or 'owner'. Defaults to
+            'moddate' if offset or limit is given. Without any of sort_by, offset, or limit,
+            all narratives are returned in no particular order.
+        offset - (default 0) the number of sorted narratives to skip
+        limit - (optional) the maximum number of narratives to return. Must be > 0 if present.
+            Narratives that can't be fetched are left out, so a page may be shorter than this.
+        types - (optional) a list of any of 'mine', 'shared', 'public', and 'narratorials'.
+            If given, type is ignored, and all of these are returned at once, with each
+            narrative only listed once - see NarrativeList.categories. Can't be used with
+            sort_by, offset, or limit.
+
+        Lists are kept up to date between calls by only listing the workspaces modified since
+        the last call. Sharing a narrative, or making it public or private, doesn't change
+        its modification date, so those changes can take a while to show up - up to the
+        narrative-list-user-full-refresh-interval for 'mine' and 'shared', and the
+        narrative-list-full-refresh-interval for 'public'.
     */
     typedef structure {
         string type;
+        string sort_by;
+        int offset;
+        int limit;
+        list<string> types;
     } ListNarrativeParams;
 
     funcdef list_narratives(ListNarrativeParams params)
@@ -682,6 +711,41 @@ module NarrativeService {
     */
     funcdef get_narrative_doc(SearchDocNarrativeParams params) returns (SearchDocResult result) authentication required;
 
+    /*
+        narrative_upas - UPAs of the narratives to be requested in search doc format. At most
+            narrative-docs-max-upas (set in the service config, 100 by default) can be requested
+            in one call.
+    */
+    typedef structure {
+        list<string> narrative_upas;
+    } SearchDocNarrativesParams;
+
+    /*
+        narrative_upa - the requested UPA.
+        doc - the narrative in search doc format, if it could be made.
+        error - otherwise, why the doc couldn't be made.
+    */
+    typedef structure {
+        string narrative_upa;
+        SearchDocResult doc;
+        string error;
+    } SearchDocNarrativeResult;
+
+    /*
+        docs - one result for each requested UPA, in the same order.
+    */
+    typedef structure {
+        list<SearchDocNarrativeResult> docs;
+    } SearchDocNarrativesResult;
+
+    /*
+        A batch version of get_narrative_doc, meant for the search indexer. The narratives are
+        grouped by workspace, so a batch needs only a few workspace calls in total.
+        Instead of raising an error for a bad UPA, or a narrative that can't be read, that
+        UPA's result has an error message and no doc.
+    */
+    funcdef get_narrative_docs(SearchDocNarrativesParams params) returns (SearchDocNarrativesResult result) authentication required;
+
     /*
         An object identifier. All fields are required
         int wsid - the numerical ID of the workspace.
@@ -704,6 +768,35 @@ module NarrativeService {
         As search takes some time to index, this method takes that time into account and won't return until completed. ObjectIdentity
         version is required to specify which version of an object to revert to; wsid and objid fields must be integers
         representing the workspace id and object id.
+        To return without waiting for search, use revert_narrative_object_no_wait.
     */
     funcdef revert_narrative_object(ObjectIdentity object) returns(object_info reverted) authentication required;
+
+    /*
+        reverted - the object_info tuple received from the call to Workspace.revert_object.
+        new_version - the new version made by the revert, to pass to is_narrative_version_indexed.
+    */
+    typedef structure {
+        object_info reverted;
+        ObjectIdentity new_version;
+    } RevertNoWaitResult;
+
+    /*
+        Does the same as revert_narrative_object, but returns as soon as the object is reverted, without waiting for
+        the new version to be indexed in search. Poll is_narrative_version_indexed with new_version to find out when it is.
+    */
+    funcdef revert_narrative_object_no_wait(ObjectIdentity object) returns (RevertNoWaitResult result) authentication required;
+
+    /*
+        indexed - whether the object version is in search yet.
+    */
+    typedef structure {
+        boolean indexed;
+    } VersionIndexedResult;
+
+    /*
+        Checks (once) whether the given object version is indexed in search yet, e.g. the new version made by
+        revert_narrative_object_no_wait. All ObjectIdentity fields are required.
+    */
+    funcdef is_narrative_version_indexed(ObjectIdentity object) returns (VersionIndexedResult result) authentication required;
 };
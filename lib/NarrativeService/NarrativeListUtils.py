@@ -1,4 +1,17 @@
+import json
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http import HTTPStatus
+
 import pylru
+import requests
+from installed_clients.baseclient import ServerError
+
+from NarrativeService.ServiceUtils import ServiceUtils
+from NarrativeService.util.backoff import backoff_delays
 
 # For reference:
 #   workspace_info:
@@ -13,10 +26,55 @@ import pylru
 #     8 usermeta metadata
 
 
-class NarrativeInfoCache:
+# A compact, immutable Narrative object_info. It's a tuple, so it serializes to the same
+# JSON list as the object_info list it's made from.
+NarrativeObjectInfo = namedtuple("NarrativeObjectInfo", [
+    "objid", "name", "type", "save_date", "version", "saved_by", "wsid", "workspace",
+    "chsum", "size", "meta"
+])
+
+
+def _compact_object_info(obj_info):
+    """
+        Makes a NarrativeObjectInfo from an object_info list. Strings that repeat across
+        Narratives (the type, the saving user, and metadata keys) are interned, so every
+        cached entry shares one copy of them. Values like names are unique, and aren't.
+    """
+    meta = obj_info[10]
+    if meta:
+        meta = {sys.intern(key): value for key, value in meta.items()}
+    return NarrativeObjectInfo(
+        obj_info[0], obj_info[1], sys.intern(obj_info[2]), obj_info[3], obj_info[4],
+        sys.intern(obj_info[5]), obj_info[6], obj_info[7], obj_info[8], obj_info[9], meta
+    )
 
-    def __init__(self, cache_size):
+
+class NarrativeInfoCache:
+    """
+        Caches Narrative object infos, keyed on workspace id and moddate, as
+        NarrativeObjectInfo tuples. These are shared between requests, as are their
+        metadata dicts, so callers must treat them as read-only.
+    """
+
+    def __init__(self, cache_size, chunk_size=1000, max_workers=1, chunk_retries=1,
+                 shared_store=None):
+        """
+            cache_size - the number of Narrative object infos to cache
+            chunk_size - the max number of Narratives looked up in one get_object_info3 call
+            max_workers - the max number of get_object_info3 calls to run at once
+            chunk_retries - the number of times to retry a get_object_info3 call that failed
+            shared_store - an optional MmapKeyValueStore shared with the other worker
+                processes. Infos missing from this cache are looked for there before they're
+                fetched, and fetched infos are added to it. Infos found there aren't added to
+                this cache, so each worker only keeps a private copy of what it fetched.
+        """
         self.cache = pylru.lrucache(int(cache_size))
+        self.shared_store = shared_store
+        self.chunk_size = int(chunk_size)
+        self.max_workers = int(max_workers)
+        self.chunk_retries = int(chunk_retries)
+        if self.chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
 
     def clear_cache(self):
         self.cache.clear()
@@ -24,6 +82,25 @@ class NarrativeInfoCache:
     def check_cache_size(self):
         return len(self.cache)
 
+    def dump_entries(self):
+        """
+            Returns the cached entries as a list of [key, object_info] pairs, least
+            recently used first, ready to be saved as JSON and given to load_entries.
+        """
+        # pylru iterates from most to least recently used. Skip any node that another
+        # thread emptied out while this was running.
+        entries = [[key, list(nar)] for key, nar in list(self.cache.items())
+                   if key is not None and nar is not None]
+        entries.reverse()
+        return entries
+
+    def load_entries(self, entries):
+        """
+            Adds entries made by dump_entries to the cache, keeping their LRU order.
+        """
+        for key, nar in entries:
+            self.cache[key] = _compact_object_info(nar)
+
     def get_info_list(self, ws_lookup_table, wsClient):
         """
             Given a set of WS info, lookup the corresponding Narrative
@@ -60,10 +137,22 @@ class NarrativeInfoCache:
             key = self._get_cache_key(ws_info)
             if key in self.cache:
                 items.append({"ws": ws_info, "nar": self.cache[key]})
+                continue
+            nar = self._search_shared_store(key)
+            if nar is not None:
+                items.append({"ws": ws_info, "nar": nar})
             else:
                 missed.append(ws_info)
         return {"items": items, "missed": missed}
 
+    def _search_shared_store(self, key):
+        if self.shared_store is None:
+            return None
+        value = self.shared_store.get(key)
+        if value is None:
+            return None
+        return _compact_object_info(json.loads(value))
+
     def _fetch_objects_and_cache(self, ws_list, full_ws_lookup_table, wsClient):
         """ Fetches narrative objects (if possible) for everything in ws_list """
         obj_ref_list = []
@@ -78,36 +167,289 @@ class NarrativeInfoCache:
         if len(obj_ref_list) == 0:
             return []
 
+        chunks = [obj_ref_list[i:i + self.chunk_size]
+                  for i in range(0, len(obj_ref_list), self.chunk_size)]
+        chunk_items = [None] * len(chunks)
+        num_workers = min(self.max_workers, len(chunks))
+        if num_workers <= 1:
+            for idx, chunk in enumerate(chunks):
+                chunk_items[idx] = self._cache_chunk(
+                    self._fetch_chunk(chunk, wsClient), full_ws_lookup_table
+                )
+        else:
+            executor = ThreadPoolExecutor(max_workers=num_workers)
+            try:
+                futures = {executor.submit(self._fetch_chunk, chunk, wsClient): idx
+                           for idx, chunk in enumerate(chunks)}
+                # cache each chunk as it arrives, but keep the results in the original order
+                for future in as_completed(futures):
+                    chunk_items[futures[future]] = self._cache_chunk(
+                        future.result(), full_ws_lookup_table
+                    )
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+        items = []
+        for chunk in chunk_items:
+            items += chunk
+        return items
+
+    def _fetch_chunk(self, obj_ref_list, wsClient):
+        """
+            Looks up one chunk of Narrative object infos, retrying (after a short, growing
+            wait) if the call couldn't connect or the server failed
+        """
         # ignore errors
         get_obj_params = {"objects": obj_ref_list, "includeMetadata": 1, "ignoreErrors": 1}
-        narrative_list = wsClient.get_object_info3(get_obj_params)["infos"]
-
+        delays = backoff_delays()
+        attempt = 0
+        while True:
+            try:
+                return wsClient.get_object_info3(get_obj_params)["infos"]
+            except Exception as e:
+                attempt += 1
+                if attempt > self.chunk_retries or not _is_transient_error(e):
+                    raise
+            time.sleep(next(delays))
+
+    def _cache_chunk(self, narrative_list, full_ws_lookup_table):
         items = []
         for nar in narrative_list:
             if nar:
+                nar = _compact_object_info(nar)
                 ws_info = full_ws_lookup_table[nar[6]]
                 items.append({"ws": ws_info, "nar": nar})
-                self.cache[self._get_cache_key(ws_info)] = nar
+                key = self._get_cache_key(ws_info)
+                self.cache[key] = nar
+                if self.shared_store is not None:
+                    self.shared_store.put(key, json.dumps(nar).encode("utf-8"))
         return items
 
     def _get_cache_key(self, ws_info):
         return str(ws_info[0]) + "__" + str(ws_info[3])
 
 
+class WorkspaceListSnapshot:
+    """
+        A snapshot of the results of a list_workspace_info call, kept up to date
+        incrementally.
 
-class NarrativeListUtils:
-
-    def __init__(self, cache_size):
-        self.narrativeInfo = NarrativeInfoCache(cache_size)
+        The first refresh lists everything. After that, a refresh only asks for the
+        workspaces modified since the newest moddate in the snapshot (less a few
+        seconds, to catch writes that landed out of order), and merges them in by
+        workspace id. Deleted workspaces, or ones the user lost access to, don't
+        show up in a delta listing. Nor do sharing changes or workspaces being made
+        public or private, since they don't change the moddate. So everything is
+        re-listed once the snapshot is more than full_refresh_interval seconds old.
+    """
+    # milliseconds to overlap delta listings with the newest moddate already seen
+    DELTA_OVERLAP_MS = 5000
 
+    def __init__(self, list_params, full_refresh_interval, keep=None, transform=None):
+        """
+            list_params - the list_workspace_info params to list with
+            full_refresh_interval - seconds between full listings
+            keep - optional function of a workspace info, only infos it returns True for
+                are kept
+            transform - optional function applied to each kept workspace info before
+                it's stored
+        """
+        self.list_params = list_params
+        self.full_refresh_interval = float(full_refresh_interval)
+        self.keep = keep
+        self.transform = transform
+        self.infos = None
+        self.version = 0
+        self._sorted_views = {}
+        self._last_full_refresh = 0
+        self._max_moddate = None
+        self._lock = threading.Lock()
+
+    def refresh(self, wsClient):
+        """
+            Brings the snapshot up to date and returns a list of its workspace infos.
+            The infos themselves are shared, and must be treated as read-only.
+        """
+        with self._lock:
+            now = time.monotonic()
+            after = self._get_delta_start()
+            if self.infos is None or after is None or \
+               now - self._last_full_refresh >= self.full_refresh_interval:
+                self.infos = {}
+                self._merge(wsClient.list_workspace_info(self.list_params))
+                self._last_full_refresh = now
+                self.version += 1
+            else:
+                delta_params = dict(self.list_params)
+                delta_params["after_epoch"] = after
+                if self._merge(wsClient.list_workspace_info(delta_params)):
+                    self.version += 1
+            return list(self.infos.values())
 
-    def list_public_narratives(self, wsClient):
-        # get all the workspaces marked as narratorials
-        ws_list = wsClient.list_workspace_info({})
-        ws_global_list = []
+    def get_sorted(self, view_name, keep, sort_by):
+        """
+            Returns the snapshot's workspace infos that keep returns True for, sorted by
+            sort_by (one of SORT_KEYS). The sorted list is cached until the snapshot
+            changes, so view_name must always name the same keep function. The list is
+            shared, and must be treated as read-only.
+        """
+        sort_key, reverse = SORT_KEYS[sort_by]
+        with self._lock:
+            cached = self._sorted_views.get((view_name, sort_by))
+            if cached is not None and cached[0] == self.version:
+                return cached[1]
+            ws_list = [ws_info for ws_info in (self.infos or {}).values() if keep(ws_info)]
+            ws_list.sort(key=sort_key, reverse=reverse)
+            self._sorted_views[(view_name, sort_by)] = (self.version, ws_list)
+            return ws_list
+
+    def _merge(self, ws_list):
+        """ Merges the listed infos into the snapshot, returns True if anything changed """
+        changed = False
         for ws_info in ws_list:
-            if ws_info[6] == "r":  # indicates that this ws is globally readable
-                ws_global_list.append(ws_info)
+            if self._max_moddate is None or ws_info[3] > self._max_moddate:
+                self._max_moddate = ws_info[3]
+            if self.keep is not None and not self.keep(ws_info):
+                if self.infos.pop(ws_info[0], None) is not None:
+                    changed = True
+                continue
+            if self.transform is not None:
+                ws_info = self.transform(ws_info)
+            if self.infos.get(ws_info[0]) != ws_info:
+                self.infos[ws_info[0]] = ws_info
+                changed = True
+        return changed
+
+    def _get_delta_start(self):
+        """ epoch millis to list changes after, or None if a full listing is needed """
+        if self._max_moddate is None:
+            return None
+        try:
+            moddate_ms = ServiceUtils.iso8601_to_millis_since_epoch(self._max_moddate)
+        except (ValueError, OverflowError):
+            return None
+        return max(0, moddate_ms - self.DELTA_OVERLAP_MS)
+
+
+def _is_transient_error(error):
+    """
+        Whether a failed call is worth trying again: it couldn't connect or timed out, or the
+        server (or a proxy in front of it) failed with a 5xx error that isn't a JSON-RPC error.
+    """
+    if isinstance(error, ConnectionError | requests.ConnectionError | requests.Timeout):
+        return True
+    if isinstance(error, requests.HTTPError):
+        response = error.response
+        return response is not None and response.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR
+    # the clients raise an "Unknown" ServerError for a 500 response without a JSON-RPC error
+    return isinstance(error, ServerError) and error.name == "Unknown"
+
+
+def _has_narrative(ws_info):
+    narrative = ws_info[8].get("narrative")
+    return narrative is not None and narrative.isdigit() and int(narrative) > 0
+
+
+def _narrative_name_key(ws_info):
+    return (ws_info[8].get("narrative_nice_name", ws_info[1]).lower(), ws_info[0])
+
+
+# sort_by option -> (sort key function, reverse)
+SORT_KEYS = {
+    "moddate": (lambda ws_info: (ws_info[3], ws_info[0]), True),
+    "name": (_narrative_name_key, False),
+    "owner": (lambda ws_info: (ws_info[2], ws_info[0]), False),
+}
+
+
+def _is_public(ws_info):
+    return ws_info[6] == "r"
+
+
+def _without_user_permission(ws_info):
+    ws_info = list(ws_info)
+    ws_info[5] = "n"
+    return ws_info
+
+
+class NarrativeListUtils:
+
+    def __init__(self, cache_size, snapshot_cache_size=1000, full_refresh_interval=300,
+                 user_full_refresh_interval=30, info_chunk_size=1000, info_max_workers=1,
+                 info_chunk_retries=1, shared_info_store=None):
+        """
+            cache_size - the number of Narrative object infos to cache
+            snapshot_cache_size - the number of per-user workspace list snapshots to keep
+            full_refresh_interval - seconds between full re-listings of the public
+                workspace snapshot, with incremental listings in between
+            user_full_refresh_interval - the same, for each user's snapshot. Sharing changes
+                only show up on a full re-listing, and a user expects to see a narrative
+                that was just shared with them, so this should be much shorter.
+            info_chunk_size, info_max_workers, info_chunk_retries, shared_info_store - how
+                Narrative object infos that aren't cached are looked up, see NarrativeInfoCache
+        """
+        self.narrativeInfo = NarrativeInfoCache(cache_size, chunk_size=info_chunk_size,
+                                                max_workers=info_max_workers,
+                                                chunk_retries=info_chunk_retries,
+                                                shared_store=shared_info_store)
+        self.full_refresh_interval = full_refresh_interval
+        self.user_full_refresh_interval = user_full_refresh_interval
+        self.userSnapshots = pylru.lrucache(int(snapshot_cache_size))
+        self._snapshot_lock = threading.Lock()
+        # every public workspace, with the user permission set to "n" so the snapshot
+        # can be shared between users
+        self.publicSnapshot = WorkspaceListSnapshot(
+            {}, full_refresh_interval, keep=_is_public, transform=_without_user_permission
+        )
+
+    def _get_user_snapshot(self, user_id):
+        """ the snapshot of workspaces the user has explicit permissions to """
+        with self._snapshot_lock:
+            snapshot = self.userSnapshots.get(user_id)
+            if snapshot is None:
+                snapshot = WorkspaceListSnapshot({"excludeGlobal": 1},
+                                                 self.user_full_refresh_interval)
+                self.userSnapshots[user_id] = snapshot
+        return snapshot
+
+    def _list_user_workspaces(self, my_user_id, wsClient):
+        return self._get_user_snapshot(my_user_id).refresh(wsClient)
+
+    def _list_public_workspaces(self, my_user_id, wsClient):
+        """
+            Lists all public workspaces, with the user's own permissions put back on the
+            ones they have explicit permissions to.
+        """
+        return self._add_user_permissions(my_user_id, self.publicSnapshot.refresh(wsClient),
+                                          wsClient)
+
+    def _add_user_permissions(self, my_user_id, ws_list, wsClient):
+        """
+            Puts the user's own permissions on a list of infos from the public snapshot.
+            Infos that change are copied, and ws_list is updated in place and returned.
+        """
+        if my_user_id is None:
+            return ws_list
+        user_perms = {ws_info[0]: ws_info[5] for ws_info in
+                      self._list_user_workspaces(my_user_id, wsClient)}
+        for idx, ws_info in enumerate(ws_list):
+            perm = user_perms.get(ws_info[0], "n")
+            if perm != "n":
+                ws_list[idx] = list(ws_info)
+                ws_list[idx][5] = perm
+        return ws_list
+
+    def clear_snapshots(self):
+        with self._snapshot_lock:
+            self.userSnapshots.clear()
+        self.publicSnapshot = WorkspaceListSnapshot(
+            {}, self.full_refresh_interval, keep=_is_public, transform=_without_user_permission
+        )
+
+
+    def list_public_narratives(self, wsClient, my_user_id=None):
+        # get all the globally readable workspaces
+        ws_global_list = self._list_public_workspaces(my_user_id, wsClient)
         # build a ws_list lookup table
         ws_lookup_table = self._build_ws_lookup_table(ws_global_list)
         # based on the WS lookup table, lookup the narratives
@@ -115,8 +457,9 @@ class NarrativeListUtils:
 
 
     def list_my_narratives(self, my_user_id, wsClient):
-        # get all the workspaces marked as narratorials
-        ws_list = wsClient.list_workspace_info({"owners": [my_user_id]})
+        # get all the workspaces owned by the user
+        ws_list = [ws_info for ws_info in self._list_user_workspaces(my_user_id, wsClient)
+                   if ws_info[2] == my_user_id]
         # build a ws_list lookup table
         ws_lookup_table = self._build_ws_lookup_table(ws_list)
         # based on the WS lookup table, lookup the narratives
@@ -124,8 +467,8 @@ class NarrativeListUtils:
 
 
     def list_shared_narratives(self, my_user_id, wsClient):
-        # get all the workspaces marked as narratorials
-        ws_list = wsClient.list_workspace_info({})
+        # get all the workspaces shared with the user
+        ws_list = self._list_user_workspaces(my_user_id, wsClient)
         ws_shared_list = []
         for ws_info in ws_list:
             if ws_info[2] == my_user_id:
@@ -139,6 +482,106 @@ class NarrativeListUtils:
         return self.narrativeInfo.get_info_list(ws_lookup_table, wsClient)
 
 
+    def get_narrative_page(self, nar_type, my_user_id, wsClient, sort_by="moddate", offset=0,
+                           limit=None):
+        """
+            Returns one page of the user's narratives of the given type ("mine", "shared",
+            or "public"), sorted by sort_by ("moddate" - newest first, "name", or "owner").
+
+            The workspace list is sorted (and the sorted list cached, until the list
+            changes) before any narrative infos are looked up, so only the ones on the
+            requested page are fetched. Narratives that can't be fetched are left out,
+            so a page can be shorter than limit.
+
+            output:
+                {
+                    'narratives': [{'ws': workspace_info, 'nar': narrative_info}, ...],
+                    'total': number of narrative workspaces of that type, over all pages
+                }
+        """
+        if nar_type == "public":
+            self.publicSnapshot.refresh(wsClient)
+            ws_list = self.publicSnapshot.get_sorted("public", _has_narrative, sort_by)
+        else:
+            snapshot = self._get_user_snapshot(my_user_id)
+            snapshot.refresh(wsClient)
+
+            def keep(ws_info):
+                if not _has_narrative(ws_info):
+                    return False
+                if nar_type == "mine":
+                    return ws_info[2] == my_user_id
+                return ws_info[2] != my_user_id and ws_info[5] != "n"
+
+            ws_list = snapshot.get_sorted(nar_type, keep, sort_by)
+
+        end = None if limit is None else offset + limit
+        page = ws_list[offset:end]
+        if nar_type == "public":
+            page = self._add_user_permissions(my_user_id, page, wsClient)
+        ws_lookup_table = {ws_info[0]: ws_info for ws_info in page}
+        items = self.narrativeInfo.get_info_list(ws_lookup_table, wsClient)
+        page_order = {ws_info[0]: idx for idx, ws_info in enumerate(page)}
+        items.sort(key=lambda item: page_order[item["ws"][0]])
+        return {"narratives": items, "total": len(ws_list)}
+
+
+    def list_narrative_categories(self, categories, my_user_id, wsClient):
+        """
+            Lists several categories of narratives at once: any of "mine", "shared",
+            "public", and "narratorials". They're all made from the same workspace
+            listings, with a single narrative info lookup for the lot, and each
+            narrative is returned once, however many categories it's in.
+
+            output:
+                {
+                    'narratives': [{'ws': workspace_info, 'nar': narrative_info}, ...],
+                    'categories': {category: [ws_id, ...], ...}
+                }
+            where each category lists the workspace ids of its narratives, newest first.
+        """
+        user_list = []
+        if my_user_id is not None:
+            user_list = self._list_user_workspaces(my_user_id, wsClient)
+        public_list = []
+        if "public" in categories or "narratorials" in categories:
+            public_list = self.publicSnapshot.refresh(wsClient)
+
+        # every workspace the user can see, with their own permissions on it
+        all_workspaces = {ws_info[0]: ws_info for ws_info in public_list}
+        all_workspaces.update((ws_info[0], ws_info) for ws_info in user_list)
+
+        category_ws = {}
+        for category in categories:
+            if category == "mine":
+                ws_list = [ws_info for ws_info in user_list if ws_info[2] == my_user_id]
+            elif category == "shared":
+                ws_list = [ws_info for ws_info in user_list
+                           if ws_info[2] != my_user_id and ws_info[5] != "n"]
+            elif category == "public":
+                ws_list = [all_workspaces[ws_info[0]] for ws_info in public_list]
+            else:
+                ws_list = [ws_info for ws_info in all_workspaces.values()
+                           if ws_info[8].get("narratorial") == "1"]
+            category_ws[category] = [ws_info for ws_info in ws_list if _has_narrative(ws_info)]
+
+        ws_lookup_table = {}
+        for ws_list in category_ws.values():
+            ws_lookup_table.update((ws_info[0], ws_info) for ws_info in ws_list)
+        items = self.narrativeInfo.get_info_list(ws_lookup_table, wsClient)
+
+        found = {item["ws"][0] for item in items}
+        sort_key, reverse = SORT_KEYS["moddate"]
+        return {
+            "narratives": items,
+            "categories": {
+                category: [ws_info[0] for ws_info in sorted(ws_list, key=sort_key, reverse=reverse)
+                           if ws_info[0] in found]
+                for category, ws_list in category_ws.items()
+            }
+        }
+
+
     def list_narratorials(self, wsClient):
         # get all the workspaces marked as narratorials
         ws_list = wsClient.list_workspace_info({"meta": {"narratorial": "1"}})
@@ -152,9 +595,8 @@ class NarrativeListUtils:
         """ builds a lookup table, skips anything without a 'narrative' metadata field set """
         ws_lookup_table = {}
         for ws_info in ws_list:
-            if "narrative" in ws_info[8]:
-                if ws_info[8]["narrative"].isdigit() and int(ws_info[8]["narrative"]) > 0:
-                    ws_lookup_table[ws_info[0]] = ws_info
+            if _has_narrative(ws_info):
+                ws_lookup_table[ws_info[0]] = ws_info
         return ws_lookup_table
 
 
@@ -1,16 +1,25 @@
 #BEGIN_HEADER
+from installed_clients import baseclient as installed_baseclient
 from installed_clients.CatalogClient import Catalog
 from installed_clients.NarrativeMethodStoreClient import NarrativeMethodStore
 from installed_clients.WorkspaceClient import Workspace
+from NarrativeService import baseclient
 from NarrativeService.apps.appinfo import get_all_app_info, get_ignore_categories
 from NarrativeService.data.fetcher import DataFetcher
+from NarrativeService.data.objectcache import WorkspaceObjectCache
 from NarrativeService.data.objectswithsets import ObjectsWithSets
+from NarrativeService.data.speccache import SpecCache
 from NarrativeService.DynamicServiceCache import DynamicServiceClient
 from NarrativeService.NarrativeListUtils import NarrativeListUtils, NarratorialUtils
+from NarrativeService.narrativecachekeeper import NarrativeCacheKeeper
 from NarrativeService.narrativemanager import NarrativeManager
 from NarrativeService.reportfetcher import ReportFetcher
 from NarrativeService.SearchServiceClient import SearchServiceClient
 from NarrativeService.sharing.sharemanager import ShareRequester
+from NarrativeService.util.aio import configure_executor
+from NarrativeService.util.clientcache import ClientCache
+from NarrativeService.util.mmapstore import MmapKeyValueStore
+from NarrativeService.util.session import configure_session, use_session_in
 
 #END_HEADER
 
@@ -30,7 +39,7 @@ class NarrativeService:
     # state. A method could easily clobber the state set by another while
     # the latter method is running.
     ########################################
-    VERSION = "0.4.1"
+    VERSION = "0.6.0"
     GIT_URL = "git@github.com:charleshtrenholm/NarrativeService.git"
     GIT_COMMIT_HASH = "e46b93c7fba3e7630e4965cf55ab27b8288c5cbe"
 
@@ -42,7 +51,8 @@ class NarrativeService:
         return NarrativeManager(self.config,
                                 ctx["user_id"],
                                 self._get_workspace_client(ctx["token"]),
-                                self._get_search_client(ctx["token"]))
+                                self._get_search_client(ctx["token"]),
+                                spec_cache=self.specCache)
 
     def _get_data_palette_client(self, token):
         return DynamicServiceClient(self.serviceWizardURL,
@@ -57,6 +67,9 @@ class NarrativeService:
                                     token)
 
     def _get_workspace_client(self, token):
+        return self.wsClientCache.get_client(token)
+
+    def _make_workspace_client(self, token):
         return Workspace(self.workspaceURL, token=token)
 
     def _get_search_client(self, token):
@@ -69,12 +82,50 @@ class NarrativeService:
     def __init__(self, config):
         #BEGIN_CONSTRUCTOR
         self.config = config
+        configure_session(config)
+        use_session_in(installed_baseclient, baseclient)
+        configure_executor(config)
         self.workspaceURL = config["workspace-url"]
         self.serviceWizardURL = config["service-wizard"]
         self.searchServiceURL = config["search-service-url"]
         self.narrativeMethodStoreURL = config["narrative-method-store"]
         self.catalogURL = config["catalog-url"]
-        self.narListUtils = NarrativeListUtils(config["narrative-list-cache-size"])
+        shared_info_store = None
+        if config.get("narrative-info-shared-cache-file"):
+            shared_info_store = MmapKeyValueStore(
+                config["narrative-info-shared-cache-file"],
+                int(config.get("narrative-info-shared-cache-max-mb", 256)) * 1024 * 1024
+            )
+        self.narListUtils = NarrativeListUtils(
+            config["narrative-list-cache-size"],
+            snapshot_cache_size=config.get("narrative-list-snapshot-cache-size", 1000),
+            full_refresh_interval=config.get("narrative-list-full-refresh-interval", 300),
+            user_full_refresh_interval=config.get(
+                "narrative-list-user-full-refresh-interval", 30
+            ),
+            info_chunk_size=config.get("narrative-info-chunk-size", 1000),
+            info_max_workers=config.get("narrative-info-max-workers", 1),
+            info_chunk_retries=config.get("narrative-info-chunk-retries", 1),
+            shared_info_store=shared_info_store
+        )
+        self.narCacheKeeper = NarrativeCacheKeeper(
+            self.narListUtils,
+            cache_file=config.get("narrative-list-cache-file") or None,
+            save_interval=config.get("narrative-list-cache-save-interval", 0)
+        )
+        self.narCacheKeeper.start(
+            ws_client=self._make_workspace_client(None),
+            warm_up=config.get("narrative-list-warm-up", "off")
+        )
+        self.wsClientCache = ClientCache(self._make_workspace_client,
+                                         config.get("workspace-client-cache-size", 500),
+                                         config.get("workspace-client-cache-ttl", 300))
+        self.listObjectsWorkers = int(config.get("list-objects-max-workers", 1))
+        self.wsObjectCache = WorkspaceObjectCache(config.get("workspace-object-cache-size", 1000))
+        self.narrativeDocsMaxUpas = int(config.get("narrative-docs-max-upas", 100))
+        self.specCache = SpecCache(config.get("nms-spec-cache-size", 500),
+                                   config.get("nms-spec-cache-ttl", 300),
+                                   prepare=NarrativeManager.compile_cell_template)
         #END_CONSTRUCTOR
 
 
@@ -162,7 +213,9 @@ class NarrativeService:
         ows = ObjectsWithSets(
             self._get_set_api_client(ctx["token"]),
             self._get_data_palette_client(ctx["token"]),
-            self._get_workspace_client(ctx["token"])
+            self._get_workspace_client(ctx["token"]),
+            list_objects_workers=self.listObjectsWorkers,
+            object_cache=self.wsObjectCache
         )
         returnVal = ows.list_objects_with_sets(
             ws_id=ws_id, ws_name=ws_name, workspaces=workspaces, types=types,
@@ -358,7 +411,9 @@ class NarrativeService:
         ows = ObjectsWithSets(
             self._get_set_api_client(ctx["token"]),
             self._get_data_palette_client(ctx["token"]),
-            self._get_workspace_client(ctx["token"]))
+            self._get_workspace_client(ctx["token"]),
+            list_objects_workers=self.listObjectsWorkers,
+            object_cache=self.wsObjectCache)
         returnVal = ows.list_available_types(workspaces)
         #END list_available_types
 
@@ -434,10 +489,35 @@ class NarrativeService:
         """
         :param params: instance of type "ListNarrativeParams" (List
            narratives type parameter indicates which narratives to return.
-           Supported options are for now 'mine', 'public', or 'shared') ->
-           structure: parameter "type" of String
-        :returns: instance of type "NarrativeList" -> structure: parameter
-           "narratives" of list of type "Narrative" -> structure: parameter
+           Supported options are for now 'mine', 'public', or 'shared'
+           sort_by - (optional) one of 'moddate' (newest first), 'name', or
+           'owner'. Defaults to 'moddate' if offset or limit is given.
+           Without any of sort_by, offset, or limit, all narratives are
+           returned in no particular order. offset - (default 0) the number
+           of sorted narratives to skip limit - (optional) the maximum number
+           of narratives to return. Must be > 0 if present. Narratives that
+           can't be fetched are left out, so a page may be shorter than
+           this. types - (optional) a list of any of 'mine', 'shared',
+           'public', and 'narratorials'. If given, type is ignored, and all of
+           these are returned at once, with each narrative only listed once -
+           see NarrativeList.categories. Can't be used with sort_by, offset,
+           or limit. Lists are kept up to date between calls by only listing
+           the workspaces modified since the last call. Sharing a narrative,
+           or making it public or private, doesn't change its modification
+           date, so those changes can take a while to show up - up to the
+           narrative-list-user-full-refresh-interval for 'mine' and 'shared',
+           and the narrative-list-full-refresh-interval for 'public'.) ->
+           structure: parameter "type" of String, parameter
+           "sort_by" of String, parameter "offset" of Long, parameter "limit"
+           of Long, parameter "types" of list of String
+        :returns: instance of type "NarrativeList" (narratives - the list of
+           narratives total - only returned if sort_by, offset, or limit were
+           given. The total number of narratives of the requested type, over
+           all pages. categories - only returned if types was given. Maps each
+           requested type to the list of workspace ids of its narratives
+           (newest first), which are all in narratives.) -> structure:
+           parameter "narratives" of list of type
+           "Narrative" -> structure: parameter
            "ws" of type "workspace_info" (Information about a workspace.
            ws_id id - the numerical ID of the workspace. ws_name workspace -
            name of the workspace. username owner - name of the user who owns
@@ -475,7 +555,8 @@ class NarrativeService:
            time)), parameter "version" of Long, parameter "saved_by" of
            String, parameter "wsid" of Long, parameter "workspace" of String,
            parameter "chsum" of String, parameter "size" of Long, parameter
-           "meta" of mapping from String to String
+           "meta" of mapping from String to String, parameter "total" of
+           Long, parameter "categories" of mapping from String to list of Long
         """
         # ctx is the context object
         # return variables are: returnVal
@@ -487,12 +568,41 @@ class NarrativeService:
             nar_type = params["type"]
 
         returnVal = {"narratives": []}
-        if nar_type == "mine":
+        paging = "sort_by" in params or "offset" in params or "limit" in params
+        if "types" in params:
+            valid_categories = valid_types + ["narratorials"]
+            if not isinstance(params["types"], list) or len(params["types"]) == 0 or \
+               any(t not in valid_categories for t in params["types"]):
+                raise ValueError('"types" parameter must be a list of any of: ' +
+                                 str(valid_categories))
+            if paging:
+                raise ValueError('"types" parameter can\'t be used with "sort_by", "offset", ' +
+                                 'or "limit"')
+            returnVal = self.narListUtils.list_narrative_categories(
+                list(dict.fromkeys(params["types"])), ctx["user_id"], ws
+            )
+        elif nar_type in valid_types and paging:
+            sort_by = params.get("sort_by", "moddate")
+            valid_sorts = ["moddate", "name", "owner"]
+            if sort_by not in valid_sorts:
+                raise ValueError('"sort_by" parameter must be set to one of: ' + str(valid_sorts))
+            offset = params.get("offset", 0)
+            if isinstance(offset, bool) or not isinstance(offset, int) or offset < 0:
+                raise ValueError('"offset" parameter must be an integer >= 0')
+            limit = params.get("limit")
+            if limit is not None and (
+                isinstance(limit, bool) or not isinstance(limit, int) or limit < 1
+            ):
+                raise ValueError('"limit" parameter must be an integer > 0')
+            returnVal = self.narListUtils.get_narrative_page(
+                nar_type, ctx["user_id"], ws, sort_by=sort_by, offset=offset, limit=limit
+            )
+        elif nar_type == "mine":
             returnVal["narratives"] = self.narListUtils.list_my_narratives(ctx["user_id"], ws)
         elif nar_type == "shared":
             returnVal["narratives"] = self.narListUtils.list_shared_narratives(ctx["user_id"], ws)
         elif nar_type == "public":
-            returnVal["narratives"] = self.narListUtils.list_public_narratives(ws)
+            returnVal["narratives"] = self.narListUtils.list_public_narratives(ws, ctx["user_id"])
         else:
             raise ValueError('"type" parameter must be set to one of: ' + str(valid_types))
         #END list_narratives
@@ -619,7 +729,7 @@ class NarrativeService:
         # ctx is the context object
         # return variables are: returnVal
         #BEGIN request_narrative_share
-        sm = ShareRequester(params, self.config)
+        sm = ShareRequester(params, self.config, ws_client_cache=self.wsClientCache)
         returnVal = sm.request_share()
         #END request_narrative_share
 
@@ -744,7 +854,11 @@ class NarrativeService:
         # return variables are: result
         #BEGIN list_all_data
         auth_url = self.config["auth-service-url"]
-        fetcher = DataFetcher(self.workspaceURL, auth_url, ctx["token"])
+        fetcher = DataFetcher(self.workspaceURL, auth_url, ctx["token"],
+                              list_objects_workers=self.listObjectsWorkers,
+                              object_cache=self.wsObjectCache,
+                              ws_client=self._get_workspace_client(ctx["token"]),
+                              user_id=ctx["user_id"])
         result = fetcher.fetch_accessible_data(params)
         #END list_all_data
 
@@ -809,7 +923,11 @@ class NarrativeService:
         # return variables are: result
         #BEGIN list_workspace_data
         auth_url = self.config["auth-service-url"]
-        fetcher = DataFetcher(self.workspaceURL, auth_url, ctx["token"])
+        fetcher = DataFetcher(self.workspaceURL, auth_url, ctx["token"],
+                              list_objects_workers=self.listObjectsWorkers,
+                              object_cache=self.wsObjectCache,
+                              ws_client=self._get_workspace_client(ctx["token"]),
+                              user_id=ctx["user_id"])
         result = fetcher.fetch_specific_workspace_data(params)
         #END list_workspace_data
 
@@ -914,6 +1032,75 @@ class NarrativeService:
         # return the results
         return [result]
 
+    def get_narrative_docs(self, ctx, params):
+        """
+        A batch version of get_narrative_doc, meant for the search indexer. The narratives are
+        grouped by workspace, so a batch needs only a few workspace calls in total.
+        Instead of raising an error for a bad UPA, or a narrative that can't be read, that
+        UPA's result has an error message and no doc.
+        :param params: instance of type "SearchDocNarrativesParams"
+           (narrative_upas - UPAs of the narratives to be requested in
+           search doc format. At most narrative-docs-max-upas (set in the
+           service config, 100 by default) can be requested in one call.) ->
+           structure: parameter "narrative_upas" of list of String
+        :returns: instance of type "SearchDocNarrativesResult" (docs - one
+           result for each requested UPA, in the same order.) -> structure:
+           parameter "docs" of list of type "SearchDocNarrativeResult"
+           (narrative_upa - the requested UPA. doc - the narrative in search
+           doc format, if it could be made. error - otherwise, why the doc
+           couldn't be made.) -> structure: parameter "narrative_upa" of
+           String, parameter "doc" of type "SearchDocResult" (access_group -
+           A numeric ID which corresponds to the ownership group. cells - A
+           list of each cell's metadata within a given narrative.
+           creation_date - The date this narrative was created (ISO 8601).
+           creator - The username of the creator of a given narrative.
+           data_objects - A list of each data object used in a given
+           narrative. is_public - Whether or not a given narrative is
+           publicly shared. modified_at - The date a given narrative was last
+           updated according to the version provided in the UPA param (ms
+           since epoch). narrative_title - The title of a given narrative.
+           obj_id - The id of a given narrative shared_users - A list of
+           users who are allowed access to a given narrative. timestamp - The
+           time that a given narrative was last saved, regardless of version.
+           total_cells - The total number of cells in a given narrative.
+           version - The version of the narrative requested) -> structure:
+           parameter "access_group" of Long, parameter "cells" of list of
+           type "DocCell" (desc - a brief description of the narrative cell.
+           cell_type - the type of cell. Can be of type 'markdown', 'widget',
+           'data', 'kbase_app', 'code_cell', or '' if type is not
+           determined.) -> structure: parameter "desc" of String, parameter
+           "cell_type" of String, parameter "creation_date" of String,
+           parameter "creator" of String, parameter "data_objects" of list of
+           type "DocDataObject" (name - The name of the data object. obj_type
+           - The type of data object. readableType - The data object type in
+           a human readable format for displays.) -> structure: parameter
+           "name" of String, parameter "obj_type" of String, parameter
+           "readableType" of String, parameter "is_public" of type "boolean"
+           (@range [0,1]), parameter "modified_at" of Long, parameter
+           "narrative_title" of String, parameter "obj_id" of Long, parameter
+           "owner" of String, parameter "shared_users" of list of String,
+           parameter "timestamp" of Long, parameter "total_cells" of Long,
+           parameter "version" of Long, parameter "error" of String
+        """
+        # ctx is the context object
+        # return variables are: result
+        #BEGIN get_narrative_docs
+        upas = params.get("narrative_upas")
+        if not isinstance(upas, list):
+            raise ValueError("narrative_upas must be a list of narrative UPAs")
+        if len(upas) > self.narrativeDocsMaxUpas:
+            raise ValueError(f"At most {self.narrativeDocsMaxUpas} narrative_upas can be "
+                             f"requested at once, not {len(upas)}")
+        result = {"docs": self._nm(ctx).get_narrative_docs(upas)}
+        #END get_narrative_docs
+
+        # At some point might do deeper type checking...
+        if not isinstance(result, dict):
+            raise ValueError("Method get_narrative_docs return value " +
+                             "result is not type dict as required.")
+        # return the results
+        return [result]
+
     def revert_narrative_object(self, ctx, object):
         """
         One stop shop method for running all workspace methods related to reverting an object. sequentially runs
@@ -921,7 +1108,10 @@ class NarrativeService:
         a possible previous version name, then waits for the new version to be successfully indexed in search before
         returning the object_info tuple received from the call to Workspace.revert_object. This method is intended for
         UI, providing a seamless loading experience where the new version is actually indexed in search before finishing.
-        As search takes some time to index, this method takes that time into account and won't return until completed.
+        As search takes some time to index, this method takes that time into account and won't return until completed. ObjectIdentity
+        version is required to specify which version of an object to revert to; wsid and objid fields must be integers
+        representing the workspace id and object id.
+        To return without waiting for search, use revert_narrative_object_no_wait.
         :param object: instance of type "ObjectIdentity" (An object
            identifier. Select an object by either: One, and only one, of the
            numerical id or name of the workspace. int wsid - the numerical ID
@@ -967,6 +1157,90 @@ class NarrativeService:
                              "reverted is not type list as required.")
         # return the results
         return [reverted]
+
+    def revert_narrative_object_no_wait(self, ctx, object):
+        """
+        Does the same as revert_narrative_object, but returns as soon as the object is reverted, without waiting for
+        the new version to be indexed in search. Poll is_narrative_version_indexed with new_version to find out when it is.
+        :param object: instance of type "ObjectIdentity" (An object
+           identifier. All fields are required int wsid - the numerical ID
+           of the workspace. int objid - the numerical ID of the object. int
+           ver - the version of the object.) -> structure: parameter "wsid"
+           of Long, parameter "objid" of Long, parameter "ver" of Long
+        :returns: instance of type "RevertNoWaitResult" (reverted - the
+           object_info tuple received from the call to
+           Workspace.revert_object. new_version - the new version made by the
+           revert, to pass to is_narrative_version_indexed.) -> structure:
+           parameter "reverted" of type "object_info" (Information about an
+           object, including user provided metadata. obj_id objid - the
+           numerical id of the object. obj_name name - the name of the
+           object. type_string type - the type of the object. timestamp
+           save_date - the save date of the object. obj_ver ver - the version
+           of the object. username saved_by - the user that saved or copied
+           the object. ws_id wsid - the workspace containing the object.
+           ws_name workspace - the workspace containing the object. string
+           chsum - the md5 checksum of the object. int size - the size of the
+           object in bytes. usermeta meta - arbitrary user-supplied metadata
+           about the object.) -> tuple of size 11: parameter "objid" of Long,
+           parameter "name" of String, parameter "type" of String, parameter
+           "save_date" of type "timestamp" (A time in the format
+           YYYY-MM-DDThh:mm:ssZ, where Z is either the character Z
+           (representing the UTC timezone) or the difference in time to UTC
+           in the format +/-HHMM, eg: 2012-12-17T23:24:06-0500 (EST time)
+           2013-04-03T08:56:32+0000 (UTC time) 2013-04-03T08:56:32Z (UTC
+           time)), parameter "version" of Long, parameter "saved_by" of
+           String, parameter "wsid" of Long, parameter "workspace" of String,
+           parameter "chsum" of String, parameter "size" of Long, parameter
+           "meta" of mapping from String to String, parameter "new_version"
+           of type "ObjectIdentity" (An object identifier. All fields are
+           required int wsid - the numerical ID of the workspace. int objid -
+           the numerical ID of the object. int ver - the version of the
+           object.) -> structure: parameter "wsid" of Long, parameter "objid"
+           of Long, parameter "ver" of Long
+        """
+        # ctx is the context object
+        # return variables are: result
+        #BEGIN revert_narrative_object_no_wait
+        reverted = self._nm(ctx).revert_narrative_object(object, wait_for_index=False)
+        result = {
+            "reverted": reverted,
+            "new_version": {"wsid": reverted[6], "objid": reverted[0], "ver": reverted[4]}
+        }
+        #END revert_narrative_object_no_wait
+
+        # At some point might do deeper type checking...
+        if not isinstance(result, dict):
+            raise ValueError("Method revert_narrative_object_no_wait return value " +
+                             "result is not type dict as required.")
+        # return the results
+        return [result]
+
+    def is_narrative_version_indexed(self, ctx, object):
+        """
+        Checks (once) whether the given object version is indexed in search yet, e.g. the new version made by
+        revert_narrative_object_no_wait. All ObjectIdentity fields are required.
+        :param object: instance of type "ObjectIdentity" (An object
+           identifier. All fields are required int wsid - the numerical ID
+           of the workspace. int objid - the numerical ID of the object. int
+           ver - the version of the object.) -> structure: parameter "wsid"
+           of Long, parameter "objid" of Long, parameter "ver" of Long
+        :returns: instance of type "VersionIndexedResult" (indexed - whether
+           the object version is in search yet.) -> structure: parameter
+           "indexed" of type "boolean" (@range [0,1])
+        """
+        # ctx is the context object
+        # return variables are: result
+        #BEGIN is_narrative_version_indexed
+        result = {"indexed": int(self._nm(ctx).is_version_indexed(object))}
+        #END is_narrative_version_indexed
+
+        # At some point might do deeper type checking...
+        if not isinstance(result, dict):
+            raise ValueError("Method is_narrative_version_indexed return value " +
+                             "result is not type dict as required.")
+        # return the results
+        return [result]
+
     def status(self, ctx):
         #BEGIN_STATUS
         returnVal = {"state": "OK",
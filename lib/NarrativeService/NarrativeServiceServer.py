@@ -409,10 +409,22 @@ class Application:
                              name="NarrativeService.get_narrative_doc",
                              types=[dict])
         self.method_authentication['NarrativeService.get_narrative_doc'] = 'required'  # noqa
+        self.rpc_service.add(impl_NarrativeService.get_narrative_docs,
+                             name="NarrativeService.get_narrative_docs",
+                             types=[dict])
+        self.method_authentication['NarrativeService.get_narrative_docs'] = 'required'  # noqa
         self.rpc_service.add(impl_NarrativeService.revert_narrative_object,
                              name="NarrativeService.revert_narrative_object",
                              types=[dict])
         self.method_authentication['NarrativeService.revert_narrative_object'] = 'required'  # noqa
+        self.rpc_service.add(impl_NarrativeService.revert_narrative_object_no_wait,
+                             name="NarrativeService.revert_narrative_object_no_wait",
+                             types=[dict])
+        self.method_authentication['NarrativeService.revert_narrative_object_no_wait'] = 'required'  # noqa
+        self.rpc_service.add(impl_NarrativeService.is_narrative_version_indexed,
+                             name="NarrativeService.is_narrative_version_indexed",
+                             types=[dict])
+        self.method_authentication['NarrativeService.is_narrative_version_indexed'] = 'required'  # noqa
         self.rpc_service.add(impl_NarrativeService.status,
                              name="NarrativeService.status",
                              types=[dict])
@@ -1,7 +1,7 @@
 import json
 import time
 
-import requests
+from NarrativeService.util.session import get_session
 
 
 class SearchServiceClient:
@@ -45,7 +45,7 @@ class SearchServiceClient:
             "params": params
         }
 
-        ret = requests.post(self.url, data=json.dumps(body), headers=headers)
+        ret = get_session().post(self.url, data=json.dumps(body), headers=headers)
         if not ret.ok:
             try:
                 error = ret.json()
@@ -1,4 +1,5 @@
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 
 class WorkspaceListObjectsIterator:
@@ -10,21 +11,53 @@ class WorkspaceListObjectsIterator:
     # list_objects_params - optional structure with such Woskspace.ListObjectsParams
     #    as 'type' or 'before', 'after', 'showHidden', 'includeMetadata' and so on,
     #    wherein there is no need to set 'ids' or 'workspaces' or 'min/maxObjectID'.
+    # max_workers - number of list_objects calls to keep in flight at once. With the
+    #    default of 1 each block/window is fetched only when the previous one has been
+    #    consumed. Larger values prefetch upcoming windows on a thread pool; results are
+    #    still returned in the same order as the sequential mode.
+    # preserve_order - if True, workspaces are packed into blocks in the order they're
+    #    given, instead of being sorted by object count first.
+    # skip_block - optional function that gets each block (list of ws_info) right before
+    #    it would be requested. If it returns True, that block is not listed at all.
+    #    Each block is only checked once every object from the blocks before it has been
+    #    returned, so with max_workers > 1 prefetching doesn't run past the end of a block.
+    # object_cache - optional WorkspaceObjectCache. Workspaces found there are not listed
+    #    again, and every workspace that gets listed in full is added to it. Only used if
+    #    list_objects_params has nothing but 'includeMetadata' in it.
     def __init__(self, ws_client, ws_info_list=None, ws_id=None, ws_name=None,
-                 list_objects_params={}, part_size=10000, global_limit=100000):
+                 list_objects_params={}, part_size=10000, global_limit=100000,
+                 max_workers=1, preserve_order=False, skip_block=None, object_cache=None):
         self.ws = ws_client
         if ws_info_list is None:
             if ws_id is None and ws_name is None:
                 raise ValueError("In case ws_info_list is not set either ws_id or ws_name should be set")
             ws_info_list = [self.ws.get_workspace_info({"id": ws_id, "workspace": ws_name})]
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self.include_metadata = list_objects_params.get("includeMetadata", 0)
+        if not set(list_objects_params.keys()) <= {"includeMetadata"}:
+            object_cache = None
+        self.object_cache = object_cache
         # Let's split workspaces into blocks
         blocks = []  # Each block is array of ws_info
-        sorted_ws_info_deque = deque(sorted(ws_info_list, key=lambda x: x[4]))
+        self._cached_objects = {}  # ws_id -> cached object infos, each of these gets its own block
+        if preserve_order:
+            sorted_ws_info_deque = deque(ws_info_list)
+        else:
+            sorted_ws_info_deque = deque(sorted(ws_info_list, key=lambda x: x[4]))
         while sorted_ws_info_deque:
             block_size = 0
             block = []
             while sorted_ws_info_deque:
                 item = sorted_ws_info_deque.popleft()
+                cached = self._get_cached(item)
+                if cached is not None:
+                    if block:
+                        sorted_ws_info_deque.appendleft(item)
+                    else:
+                        self._cached_objects[item[0]] = cached
+                        block.append(item)
+                    break
                 if len(block) == 0 or block_size + item[4] <= part_size:
                     block.append(item)
                     block_size += item[4]
@@ -32,43 +65,121 @@ class WorkspaceListObjectsIterator:
                     sorted_ws_info_deque.appendleft(item)
                     break
             blocks.append(block)
-        self.block_iter = blocks.__iter__()
+        self.blocks = blocks
         self.list_objects_params = list_objects_params
-        self.min_obj_id = -1
-        self.max_obj_count = -1
         self.part_size = part_size
         self.global_limit = global_limit
+        self.max_workers = max_workers
+        self.skip_block = skip_block
         self.total_counter = 0
-        self.part_iter = self._load_next_part()
+        self._item_iter = self._iter_items()
 
     # iterator implementation
     def __iter__(self):
         return self
 
     def __next__(self):
-        while self.part_iter is not None:
-            try:
-                self.total_counter += 1
-                if self.global_limit is not None and self.total_counter > self.global_limit:
-                    raise StopIteration
-                return next(self.part_iter)
-            except StopIteration:
-                self.part_iter = self._load_next_part()
-        raise StopIteration
+        if self.global_limit is not None and self.total_counter >= self.global_limit:
+            self.close()
+            raise StopIteration
+        item = next(self._item_iter)
+        self.total_counter += 1
+        return item
+
+    # context manager implementation - makes sure prefetching stops if the caller
+    # leaves the loop early.
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Stops iteration and drops any list_objects calls that are still queued.
+        Safe to call more than once.
+        """
+        self._item_iter.close()
+
+    def _get_cached(self, ws_info):
+        if self.object_cache is None:
+            return None
+        return self.object_cache.get(ws_info, self.include_metadata)
+
+    def _iter_block_windows(self):
+        """
+        Yields the list of windows for every block that isn't skipped, in order. Each window is a
+        (block, list_objects parameters, is last window of the block) tuple. Parameters are None
+        for a cached block.
+        """
+        for block in self.blocks:
+            if self.skip_block is not None and self.skip_block(block):
+                continue
+            if block[0][0] in self._cached_objects:
+                yield [(block, None, True)]
+                continue
+            ids = [ws_info[0] for ws_info in block]
+            max_obj_count = max(ws_info[4] for ws_info in block)
+            windows = []
+            # every block gets at least one window, even if it looks empty
+            for min_obj_id in range(1, max(max_obj_count, 1) + 1, self.part_size):
+                params = dict(self.list_objects_params)
+                params["ids"] = ids
+                params["minObjectID"] = min_obj_id
+                params["maxObjectID"] = min_obj_id + self.part_size - 1
+                windows.append((block, params, min_obj_id + self.part_size > max_obj_count))
+            yield windows
+
+    def _list_window(self, window):
+        (block, params, _) = window
+        if params is None:
+            return self._cached_objects[block[0][0]]
+        return self.ws.list_objects(params)
+
+    def _iter_parts(self):
+        """
+        Yields the list of object infos for each window, in order.
+        """
+        block_windows = self._iter_block_windows()
+        if self.max_workers == 1:
+            for windows in block_windows:
+                for window in windows:
+                    yield (window, self._list_window(window))
+            return
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        in_flight = deque()
+        try:
+            for windows in block_windows:
+                for window in windows:
+                    in_flight.append((window, executor.submit(self._list_window, window)))
+                    if len(in_flight) == self.max_workers:
+                        (done_window, future) = in_flight.popleft()
+                        yield (done_window, future.result())
+                if self.skip_block is not None:
+                    # whether the next block gets skipped depends on everything before it
+                    while in_flight:
+                        (done_window, future) = in_flight.popleft()
+                        yield (done_window, future.result())
+            while in_flight:
+                (done_window, future) = in_flight.popleft()
+                yield (done_window, future.result())
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _iter_items(self):
+        block_objects = []  # objects from all windows of the current block, to be cached
+        for ((block, params, is_last), obj_infos) in self._iter_parts():
+            if self.object_cache is not None and params is not None:
+                block_objects.extend(obj_infos)
+                if is_last:
+                    self._add_to_cache(block, block_objects)
+                    block_objects = []
+            yield from obj_infos
 
-    def _load_next_part(self):
-        if self.min_obj_id < 0 or self.min_obj_id > self.max_obj_count:
-            try:
-                block = next(self.block_iter)
-                self.list_objects_params["ids"] = [ws_info[0] for ws_info in block]
-            except StopIteration:
-                return None
-            last_ws_info = block[len(block) - 1]
-            self.min_obj_id = 1
-            self.max_obj_count = last_ws_info[4]
-        max_obj_id = self.min_obj_id + self.part_size - 1
-        self.list_objects_params["minObjectID"] = self.min_obj_id
-        self.list_objects_params["maxObjectID"] = max_obj_id
-        self.min_obj_id += self.part_size  # For next load cycle
-        ret = self.ws.list_objects(self.list_objects_params)
-        return ret.__iter__()
+    def _add_to_cache(self, block, obj_infos):
+        ws_objects = {ws_info[0]: [] for ws_info in block}
+        for info in obj_infos:
+            ws_objects[info[6]].append(info)
+        for ws_info in block:
+            self.object_cache.add(ws_info, self.include_metadata, ws_objects[ws_info[0]])
@@ -8,49 +8,132 @@ A very basic KBase auth client for the Python server.
 import hashlib
 import threading as _threading
 import time as _time
+from collections import OrderedDict
 
-import requests as _requests
+from .util.session import get_session as _get_session
 
 
 class TokenCache:
-    """ A basic cache for tokens. """
-
-    _MAX_TIME_SEC = 5 * 60  # 5 min
+    """
+    A thread safe LRU cache for tokens, shared by every request into the server.
 
-    _lock = _threading.RLock()
+    Tokens are stored as their sha256 digests. Valid tokens are kept for ttl seconds, and
+    tokens the auth service rejected are kept (with the error) for invalid_ttl seconds, so
+    a client retrying with a bad token doesn't cost an auth call each time. Entries are
+    spread across a number of stripes, each with its own lock and LRU order, so concurrent
+    lookups rarely contend.
+    """
 
-    def __init__(self, maxsize=2000):
-        self._cache = {}
-        self._maxsize = maxsize
-        self._halfmax = maxsize / 2  # int division to round down
+    _MAX_TIME_SEC = 5 * 60  # 5 min
+    _INVALID_MAX_TIME_SEC = 30
+    _STRIPES = 16
+
+    def __init__(self, maxsize=2000, ttl=_MAX_TIME_SEC, invalid_ttl=_INVALID_MAX_TIME_SEC,
+                 stripes=_STRIPES):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        stripes = max(1, min(int(stripes), maxsize))
+        self._ttl = ttl
+        self._invalid_ttl = invalid_ttl
+        self._stripe_maxsize = -(-maxsize // stripes)  # round up
+        self._stripes = [_CacheStripe() for _ in range(stripes)]
+
+    def _get_stripe(self, token):
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        return key, self._stripes[key[0] % len(self._stripes)]
+
+    def lookup(self, token):
+        """
+        Returns a (user, error) tuple for a cached token - exactly one of these is set - or
+        None if the token isn't cached (or its entry has expired).
+        """
+        key, stripe = self._get_stripe(token)
+        now = _time.monotonic()
+        with stripe.lock:
+            entry = stripe.entries.get(key)
+            if entry is None:
+                stripe.misses += 1
+                return None
+            user, error, expires = entry
+            if expires <= now:
+                del stripe.entries[key]
+                stripe.misses += 1
+                return None
+            stripe.entries.move_to_end(key)
+            if error is None:
+                stripe.hits += 1
+            else:
+                stripe.invalid_hits += 1
+            return user, error
 
     def get_user(self, token):
-        token = hashlib.sha256(token).hexdigest()
-        with self._lock:
-            usertime = self._cache.get(token)
-        if not usertime:
-            return None
-
-        user, intime = usertime
-        if _time.time() - intime > self._MAX_TIME_SEC:
+        """
+        Returns the user for a cached valid token, or None.
+        """
+        entry = self.lookup(token)
+        if entry is None:
             return None
-        return user
+        return entry[0]
 
     def add_valid_token(self, token, user):
         if not token:
             raise ValueError("Must supply token")
         if not user:
             raise ValueError("Must supply user")
-        token = hashlib.sha256(token).hexdigest()
-        with self._lock:
-            self._cache[token] = [user, _time.time()]
-            if len(self._cache) > self._maxsize:
-                for i, (t, _) in enumerate(sorted(self._cache.items(),
-                                                  key=lambda v: v[1])):
-                    if i <= self._halfmax:
-                        del self._cache[t]
-                    else:
-                        break
+        self._add(token, user, None, self._ttl)
+
+    def add_invalid_token(self, token, error):
+        """
+        Remembers that the auth service rejected the token, with the given error message.
+        """
+        if not token:
+            raise ValueError("Must supply token")
+        self._add(token, None, str(error), self._invalid_ttl)
+
+    def _add(self, token, user, error, ttl):
+        key, stripe = self._get_stripe(token)
+        expires = _time.monotonic() + ttl
+        with stripe.lock:
+            stripe.entries[key] = (user, error, expires)
+            stripe.entries.move_to_end(key)
+            while len(stripe.entries) > self._stripe_maxsize:
+                stripe.entries.popitem(last=False)
+                stripe.evictions += 1
+
+    def clear(self):
+        for stripe in self._stripes:
+            with stripe.lock:
+                stripe.entries.clear()
+
+    def stats(self):
+        """
+        Returns a dict with the cache size and the hit, miss, invalid token hit, and
+        eviction counts since the cache was made.
+        """
+        stats = {"size": 0, "hits": 0, "misses": 0, "invalid_hits": 0, "evictions": 0}
+        for stripe in self._stripes:
+            with stripe.lock:
+                stats["size"] += len(stripe.entries)
+                stats["hits"] += stripe.hits
+                stats["misses"] += stripe.misses
+                stats["invalid_hits"] += stripe.invalid_hits
+                stats["evictions"] += stripe.evictions
+        return stats
+
+
+class _CacheStripe:
+    __slots__ = ("lock", "entries", "hits", "misses", "invalid_hits", "evictions")
+
+    def __init__(self):
+        self.lock = _threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalid_hits = 0
+        self.evictions = 0
+
+
+_SHARED_TOKEN_CACHE = TokenCache()
 
 
 class KBaseAuth:
@@ -59,33 +142,45 @@ class KBaseAuth:
     """
 
     _LOGIN_URL = "https://kbase.us/services/auth/api/legacy/KBase/Sessions/Login"
+    _INVALID_TOKEN_STATUS = 401
 
-    def __init__(self, auth_url=None):
+    def __init__(self, auth_url=None, cache=None):
         """
         Constructor
+
+        cache - an optional TokenCache. By default, all clients in the process share one
+        cache, so a token validated by the server isn't looked up again elsewhere.
         """
         self._authurl = auth_url
         if not self._authurl:
             self._authurl = self._LOGIN_URL
-        self._cache = TokenCache()
+        self._cache = cache
+        if self._cache is None:
+            self._cache = _SHARED_TOKEN_CACHE
 
     def get_user(self, token):
         if not token:
             raise ValueError("Must supply token")
-        user = self._cache.get_user(token)
-        if user:
+        cached = self._cache.lookup(token)
+        if cached:
+            user, error = cached
+            if error is not None:
+                raise ValueError(error)
             return user
 
         d = {"token": token, "fields": "user_id"}
-        ret = _requests.post(self._authurl, data=d)
+        ret = _get_session().post(self._authurl, data=d)
         if not ret.ok:
             try:
                 err = ret.json()
             except Exception:
                 ret.raise_for_status()
-            raise ValueError("Error connecting to auth service: {} {}\n{}"
-                             .format(ret.status_code, ret.reason,
-                                     err["error"]["message"]))
+            error = ("Error connecting to auth service: {} {}\n{}"
+                     .format(ret.status_code, ret.reason, err["error"]["message"]))
+            if ret.status_code == self._INVALID_TOKEN_STATUS:
+                # the token itself was rejected, rather than the service having trouble
+                self._cache.add_invalid_token(token, error)
+            raise ValueError(error)
 
         user = ret.json()["user_id"]
         self._cache.add_valid_token(token, user)
@@ -1,4 +1,6 @@
+import heapq
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 from installed_clients.WorkspaceClient import Workspace
 
@@ -9,20 +11,34 @@ DEFAULT_DATA_LIMIT = 30000
 
 
 class DataFetcher:
-    def __init__(self, ws_url, auth_url, token):
+    def __init__(self, ws_url, auth_url, token, list_objects_workers=1, object_cache=None,
+                 ws_client=None, user_id=None):
         """
-        The data fetcher needs a workspace client and auth client.
-        It needs Auth to get the current user id out of the token, so we know what workspaces
-        are actually shared as opposed to just visible.
+        The data fetcher needs a workspace client and the current user id, so we know what
+        workspaces are actually shared as opposed to just visible. If the user id isn't given,
+        it's looked up from the token with the Auth service.
 
         Args:
             ws_url (str): Workspace service URL
             auth_url (str): Auth service URL
             token (str): auth token
+            list_objects_workers (int, default 1): number of concurrent list_objects (and
+                get_workspace_info) calls used when combing workspaces for data
+            object_cache (WorkspaceObjectCache, optional): cache of per-workspace object
+                listings, so unchanged workspaces don't need to be listed again
+            ws_client (Workspace, optional): an existing Workspace client for this token to use,
+                instead of making a new one
+            user_id (str, optional): the user id that owns the token, if it's already known
+                (e.g. the server has already validated the token)
         """
-        self._ws = Workspace(url=ws_url, token=token)
-        auth = KBaseAuth(auth_url=auth_url)
-        self._user = auth.get_user(token)
+        self._ws = ws_client
+        if self._ws is None:
+            self._ws = Workspace(url=ws_url, token=token)
+        self._user = user_id
+        if self._user is None:
+            self._user = KBaseAuth(auth_url=auth_url).get_user(token)
+        self._list_objects_workers = list_objects_workers
+        self._object_cache = object_cache
 
     def fetch_accessible_data(self, params):
         """
@@ -129,7 +145,8 @@ class DataFetcher:
                                              the list. They should be of format "Module.Type"
                 include_type_counts (boolean (0, 1) def 0): if 1, return the counts of each type in
                                                             a dictionary keyed on the type.
-                limit (int): the maximum number of objects to return
+                limit (int): the maximum number of objects to return. The newest objects are
+                             the ones returned.
 
         Returns a dict with keys:
             workspace_display (dict): each key is a workspace id, values are smaller dicts
@@ -165,8 +182,11 @@ class DataFetcher:
         (data_objects, limit_reached) = self._fetch_all_objects(
             ws_info_list, include_metadata=include_metadata, types=type_set, ignore_narratives=ignore_narratives, limit=params["limit"]
         )
-        # now, post-process the data objects.
+        # now, post-process the data objects. They're already sorted newest first, so
+        # converting, counting per-workspace and counting types all happen in one pass.
         simple_types = params.get("simple_types", 0) == 1
+        include_type_counts = params.get("include_type_counts", 0) == 1
+        type_counts = defaultdict(lambda: 0)
         return_objects = list()
         for obj in data_objects:
             obj_type = self._parse_type(obj[2], simple_types)
@@ -181,17 +201,15 @@ class DataFetcher:
                 "timestamp": obj[3]
             })
             ws_display[ws_id]["count"] += 1  # gets initialized back in _get_non_temporary_workspaces
-        return_objects.sort(key=lambda obj: obj["timestamp"], reverse=True)
+            if include_type_counts:
+                type_counts[obj_type] += 1
         return_val = {
             "workspace_display": ws_display,
             "objects": return_objects,
             "ws_info": ws_info_list,
             "limit_reached": 1 if limit_reached else 0
         }
-        if params.get("include_type_counts", 0) == 1:
-            type_counts = defaultdict(lambda: 0)
-            for obj in return_objects:
-                type_counts[obj["type"]] += 1
+        if include_type_counts:
             return_val["type_counts"] = type_counts
         return return_val
 
@@ -321,7 +339,13 @@ class DataFetcher:
 
     def _fetch_all_objects(self, ws_info_list, ignore_narratives=True, types=None, include_metadata=False, limit=None):
         """
-        Returns all objects in the workspace info list, with or without metadata.
+        Returns the newest objects in the workspace info list, with or without metadata.
+
+        Objects are streamed from the Workspace and only the newest `limit` of them (by save
+        timestamp) are kept, in a bounded heap. Workspaces are listed in order of their
+        modification date, newest first. Since no object in a workspace can be newer than the
+        workspace itself, once the heap is full, any remaining workspace that was last modified
+        before the oldest kept object is skipped without being listed.
 
         Args:
             ws_info_list(list<list>):
@@ -333,31 +357,54 @@ class DataFetcher:
             include_metadata(truthy, default False):
                 if truthy, will return object metadata as well
             limit(int, default None):
-                if some value, then will stop returning objects after reaching the limit
+                if some value, then only the newest `limit` objects are returned
 
         Returns 2-tuple:
             items(list<list>):
-                list of Workspace object info tuples
+                list of Workspace object info tuples, sorted by timestamp, newest first
             limit_reached(boolean):
-                True if the limit was reached, and there are more items that weren't returned
+                True if the limit was reached, and there are (or may be) more items that weren't
+                returned
         """
-
-        items = list()
+        # heap entries are (timestamp, -counter, info). The counter keeps the order stable
+        # between objects with the same timestamp - the first one seen wins.
+        heap = list()
         limit_reached = False
-        for info in WorkspaceListObjectsIterator(
+
+        def heap_is_full():
+            return limit is not None and len(heap) >= limit
+
+        def skip_block(block):
+            nonlocal limit_reached
+            if heap_is_full() and max(ws_info[3] for ws_info in block) <= heap[0][0]:
+                if any(ws_info[4] > 0 for ws_info in block):
+                    limit_reached = True
+                return True
+            return False
+
+        # _get_non_temporary_workspaces already sorts by moddate, so this is cheap there
+        ws_by_moddate = sorted(ws_info_list, key=lambda ws: ws[3], reverse=True)
+        with WorkspaceListObjectsIterator(
             self._ws,
-            ws_info_list=ws_info_list,
-            list_objects_params={"includeMetadata": 1 if include_metadata else 0}
-        ):
-            if limit and len(items) == limit:
-                limit_reached = True
-                break
-            else:
+            ws_info_list=ws_by_moddate,
+            list_objects_params={"includeMetadata": 1 if include_metadata else 0},
+            max_workers=self._list_objects_workers,
+            preserve_order=True,
+            skip_block=skip_block,
+            object_cache=self._object_cache
+        ) as ws_objects:
+            for counter, info in enumerate(ws_objects):
                 if ignore_narratives and info[2].startswith("KBaseNarrative"):
                     continue
                 if types and info[2].split("-")[0] not in types:
                     continue
-                items.append(info)
+                if not heap_is_full():
+                    heapq.heappush(heap, (info[3], -counter, info))
+                    continue
+                limit_reached = True
+                if info[3] > heap[0][0]:
+                    heapq.heapreplace(heap, (info[3], -counter, info))
+        items = [entry[2] for entry in sorted(heap, reverse=True)]
         return (items, limit_reached)
 
     def _get_workspace_infos(self, ws_ids):
@@ -375,10 +422,38 @@ class DataFetcher:
             values are the display name for the workspace (later augmented with
             data object counts)
         """
-        ws_info_list = [self._ws.get_workspace_info({"id": ws_id}) for ws_id in ws_ids]
+        ws_info_list = self._lookup_workspace_infos(ws_ids)
         ws_display = self._get_ws_display(ws_info_list)
         return (ws_info_list, ws_display)
 
+    def _lookup_workspace_infos(self, ws_ids):
+        """
+        Returns the list of workspace infos for the list of workspace ids, in the same order.
+        Each workspace is looked up once, with concurrent get_workspace_info calls, and the
+        error from the first of those to fail, in the order given, gets raised.
+        """
+        unique_ids = list(dict.fromkeys(ws_ids))
+        infos = dict(zip(unique_ids, self._get_workspace_infos_concurrently(unique_ids),
+                         strict=True))
+        return [infos[ws_id] for ws_id in ws_ids]
+
+    def _get_workspace_infos_concurrently(self, ws_ids):
+        """
+        Runs get_workspace_info on each workspace id, with up to list_objects_workers calls at
+        once, and returns the infos in the same order. If any calls fail, the error from the
+        first failure in the list is raised, and any calls that haven't started are cancelled.
+        """
+        num_workers = min(self._list_objects_workers, len(ws_ids))
+        if num_workers <= 1:
+            return [self._ws.get_workspace_info({"id": ws_id}) for ws_id in ws_ids]
+        executor = ThreadPoolExecutor(max_workers=num_workers)
+        try:
+            futures = [executor.submit(self._ws.get_workspace_info, {"id": ws_id})
+                       for ws_id in ws_ids]
+            return [future.result() for future in futures]
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
     def _get_non_temporary_workspaces(self, get_info_params, ignore_workspaces):
         """
         Given a set of workspaces.list_workspace_info parameters, this runs the
@@ -0,0 +1,55 @@
+import threading
+
+import pylru
+
+DEFAULT_MAX_OBJECTS_PER_WORKSPACE = 10000
+
+
+class WorkspaceObjectCache:
+    """
+    A process-wide cache of the list_objects results for whole workspaces.
+
+    Entries are keyed on the workspace id, its modification date (ws_info[3]), and whether
+    object metadata was included. Any change to a workspace changes its moddate, so a stale
+    entry is never looked up again and just ages out of the LRU.
+
+    The cached object info lists are shared between requests, so callers must treat them as
+    read-only.
+    """
+
+    def __init__(self, cache_size, max_objects_per_workspace=DEFAULT_MAX_OBJECTS_PER_WORKSPACE):
+        """
+        cache_size - the maximum number of workspaces to keep listings for
+        max_objects_per_workspace - workspaces with more objects than this are never cached
+        """
+        self.cache = pylru.lrucache(int(cache_size))
+        self.max_objects_per_workspace = int(max_objects_per_workspace)
+        self._lock = threading.Lock()
+
+    def clear_cache(self):
+        with self._lock:
+            self.cache.clear()
+
+    def check_cache_size(self):
+        return len(self.cache)
+
+    def get(self, ws_info, include_metadata):
+        """
+        Returns the cached list of object infos for the workspace, or None if it's not cached.
+        """
+        key = self._get_cache_key(ws_info, include_metadata)
+        with self._lock:
+            return self.cache.get(key)
+
+    def add(self, ws_info, include_metadata, obj_infos):
+        """
+        Caches the complete list of object infos for the workspace.
+        """
+        if len(obj_infos) > self.max_objects_per_workspace:
+            return
+        key = self._get_cache_key(ws_info, include_metadata)
+        with self._lock:
+            self.cache[key] = obj_infos
+
+    def _get_cache_key(self, ws_info, include_metadata):
+        return (ws_info[0], ws_info[3], 1 if include_metadata else 0)
@@ -1,11 +1,17 @@
+import asyncio
+
+from ..util.aio import AsyncClient, run_blocking, run_sync
 from ..WorkspaceListObjectsIterator import WorkspaceListObjectsIterator
 
 
 class ObjectsWithSets:
-    def __init__(self, set_api_client, data_palette_client, workspace_client):
+    def __init__(self, set_api_client, data_palette_client, workspace_client,
+                 list_objects_workers=1, object_cache=None):
         self.set_api_client = set_api_client
         self.data_palette_client = data_palette_client
         self.workspace_client = workspace_client
+        self.list_objects_workers = list_objects_workers
+        self.object_cache = object_cache
 
     def list_objects_with_sets(self, ws_id: int = None, ws_name: str = None, workspaces: list = None,
                                types: list = None, include_metadata: int = 0,
@@ -33,13 +39,8 @@ class ObjectsWithSets:
 
         processed_refs = {}
         data = []
-        set_ret = self.set_api_client.call_method(
-            "list_sets",
-            [{
-                "workspaces": workspaces,
-                "include_set_item_info": 1,
-                "include_metadata": include_metadata
-            }]
+        (set_ret, ws_objects, dp_ret) = run_sync(
+            self._fetch_sources(workspaces, include_metadata, include_data_palettes)
         )
         sets = set_ret["sets"]
         for set_info in sets:
@@ -54,28 +55,7 @@ class ObjectsWithSets:
                 data.append(data_item)
                 processed_refs[set_info["ref"]] = data_item
 
-        ws_info_list = []
-        # for ws in workspaces:
-        if len(workspaces) == 1:
-            ws = workspaces[0]
-            ws_id = None
-            ws_name = None
-            if str(ws).isdigit():
-                ws_id = int(ws)
-            else:
-                ws_name = str(ws)
-            ws_info_list.append(self.workspace_client.get_workspace_info({"id": ws_id, "workspace": ws_name}))
-        else:
-            ws_map = {key: True for key in workspaces}
-            for ws_info in self.workspace_client.list_workspace_info({"perm": "r"}):
-                if ws_info[1] in ws_map or str(ws_info[0]) in ws_map:
-                    ws_info_list.append(ws_info)
-
-        for info in WorkspaceListObjectsIterator(self.workspace_client,
-                                                 ws_info_list=ws_info_list,
-                                                 list_objects_params={
-                                                     "includeMetadata": include_metadata
-                                                 }):
+        for info in ws_objects:
             item_ref = str(info[6]) + "/" + str(info[0]) + "/" + str(info[4])
             if item_ref not in processed_refs and self._check_info_type(info, type_map):
                 data_item = {"object_info": info}
@@ -87,10 +67,6 @@ class ObjectsWithSets:
         }
 
         if include_data_palettes == 1:
-            dp_ret = self.data_palette_client.call_method(
-                "list_data",
-                [{"workspaces": workspaces, "include_metadata": include_metadata}]
-            )
             for item in dp_ret["data"]:
                 ref = item["ref"]
                 if self._check_info_type(item["info"], type_map):
@@ -111,6 +87,63 @@ class ObjectsWithSets:
 
         return return_data
 
+    async def _fetch_sources(self, workspaces, include_metadata, include_data_palettes):
+        """
+        Gets the sets (from SetAPI), the workspace objects, and, if asked for, the data palette
+        contents (from DataPaletteService) all at once. Returns them as a 3-tuple, with None
+        for the data palettes if they weren't asked for. If any calls fail, the error raised is
+        the same one the calls would raise when made in that order.
+        """
+        calls = [
+            AsyncClient(self.set_api_client).call_method(
+                "list_sets",
+                [{
+                    "workspaces": workspaces,
+                    "include_set_item_info": 1,
+                    "include_metadata": include_metadata
+                }]
+            ),
+            run_blocking(self._list_workspace_objects, workspaces, include_metadata)
+        ]
+        if include_data_palettes == 1:
+            calls.append(AsyncClient(self.data_palette_client).call_method(
+                "list_data",
+                [{"workspaces": workspaces, "include_metadata": include_metadata}]
+            ))
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        if include_data_palettes != 1:
+            results.append(None)
+        return tuple(results)
+
+    def _list_workspace_objects(self, workspaces, include_metadata):
+        ws_info_list = []
+        # for ws in workspaces:
+        if len(workspaces) == 1:
+            ws = workspaces[0]
+            ws_id = None
+            ws_name = None
+            if str(ws).isdigit():
+                ws_id = int(ws)
+            else:
+                ws_name = str(ws)
+            ws_info_list.append(self.workspace_client.get_workspace_info({"id": ws_id, "workspace": ws_name}))
+        else:
+            ws_map = {key: True for key in workspaces}
+            for ws_info in self.workspace_client.list_workspace_info({"perm": "r"}):
+                if ws_info[1] in ws_map or str(ws_info[0]) in ws_map:
+                    ws_info_list.append(ws_info)
+
+        return list(WorkspaceListObjectsIterator(self.workspace_client,
+                                                 ws_info_list=ws_info_list,
+                                                 list_objects_params={
+                                                     "includeMetadata": include_metadata
+                                                 },
+                                                 max_workers=self.list_objects_workers,
+                                                 object_cache=self.object_cache))
+
     def list_available_types(self, workspaces):
         data = self.list_objects_with_sets(workspaces=workspaces)["data"]
         type_stat = {}
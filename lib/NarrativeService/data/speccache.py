@@ -0,0 +1,103 @@
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
+
+import pylru
+
+DEFAULT_CACHE_TTL = 300  # seconds
+
+
+class SpecCache:
+    """
+    A process-wide cache of app and method specs from the NarrativeMethodStore.
+
+    Entries are keyed on the kind of spec ("apps" or "methods"), its id, and the release tag
+    it came from (None for the NMS default). Specs only change when the catalog makes a
+    release, which nothing here can see, so entries expire after ttl seconds.
+
+    Specs that are missed by several requests at once are only fetched by the first of them.
+    The rest wait for that fetch, so a burst of narratives made from the same app makes one
+    NMS call.
+
+    What's cached for each spec is whatever prepare makes of it, e.g. a compiled narrative
+    cell template, so that work is also done once per spec. The cached values are shared
+    between requests, so callers must treat them as read-only.
+    """
+
+    def __init__(self, cache_size, ttl=DEFAULT_CACHE_TTL, prepare=None):
+        """
+        cache_size - the maximum number of specs to keep
+        ttl - the number of seconds a spec stays valid. If 0, nothing is cached, but
+            concurrent fetches of the same spec are still shared.
+        prepare - if given, a function called with the kind and spec of each fetched spec.
+            Its result is cached and handed out instead of the spec.
+        """
+        self.cache = pylru.lrucache(int(cache_size))
+        self.ttl = float(ttl)
+        self.prepare = prepare
+        self._lock = threading.Lock()
+        self._fetching = {}
+
+    def clear_cache(self):
+        with self._lock:
+            self.cache.clear()
+
+    def check_cache_size(self):
+        return len(self.cache)
+
+    def get_specs(self, kind, spec_ids, fetch: Callable[[list[str]], list[dict]], tag=None):
+        """
+        Returns a mapping from each of the spec ids to its (prepared) spec. Any that aren't
+        cached are fetched with one call to fetch, which gets the list of missing ids and
+        returns a list of specs (e.g. NarrativeMethodStore.get_app_spec). Ids that fetch
+        doesn't return a spec for are left out of the result. Errors from fetch are raised.
+        """
+        now = time.monotonic()
+        specs = {}
+        waiting = {}
+        to_fetch = {}
+        with self._lock:
+            for spec_id in dict.fromkeys(spec_ids):
+                key = (kind, spec_id, tag)
+                entry = self.cache.get(key)
+                if entry is not None and now - entry[1] < self.ttl:
+                    specs[spec_id] = entry[0]
+                elif key in self._fetching:
+                    waiting[spec_id] = self._fetching[key]
+                else:
+                    to_fetch[spec_id] = self._fetching[key] = Future()
+
+        if to_fetch:
+            self._fetch(kind, tag, to_fetch, fetch)
+        for spec_id, future in {**to_fetch, **waiting}.items():
+            spec = future.result()
+            if spec is not None:
+                specs[spec_id] = spec
+        return specs
+
+    def _fetch(self, kind, tag, futures, fetch):
+        """
+        Fetches the specs for the ids in futures, caches them, and resolves the futures for
+        any requests waiting on them.
+        """
+        try:
+            fetched = {spec["info"]["id"]: spec for spec in fetch(list(futures))}
+            if self.prepare is not None:
+                fetched = {spec_id: self.prepare(kind, spec) for spec_id, spec in fetched.items()}
+        except Exception as e:
+            with self._lock:
+                for spec_id in futures:
+                    del self._fetching[(kind, spec_id, tag)]
+            for future in futures.values():
+                future.set_exception(e)
+            raise
+        now = time.monotonic()
+        with self._lock:
+            for spec_id in futures:
+                key = (kind, spec_id, tag)
+                del self._fetching[key]
+                if spec_id in fetched and self.ttl > 0:
+                    self.cache[key] = (fetched[spec_id], now)
+        for spec_id, future in futures.items():
+            future.set_result(fetched.get(spec_id))
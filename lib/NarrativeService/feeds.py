@@ -1,4 +1,5 @@
 import requests
+from NarrativeService.util.session import get_session
 
 SERVICE_NAME = "narrativeservice"
 
@@ -6,7 +7,7 @@ def make_notification(note, feeds_url, auth_token):
     # calls the feeds service
     note["source"] = SERVICE_NAME
     headers = {"Authorization": auth_token}
-    r = requests.post(feeds_url + "/api/V1/notification", json=note, headers=headers)
+    r = get_session().post(feeds_url + "/api/V1/notification", json=note, headers=headers)
     if r.status_code != requests.codes.ok:
         raise RuntimeError(f"Unable to create notification: {r.text}")
     return r.json()["id"]
@@ -0,0 +1,136 @@
+import atexit
+import functools
+import json
+import multiprocessing
+import os
+import threading
+
+from NarrativeService.NarrativeListUtils import NarrativeListUtils
+
+WARM_UP_OFF = "off"
+WARM_UP_STARTUP = "startup"
+WARM_UP_BACKGROUND = "background"
+WARM_UP_MODES = [WARM_UP_OFF, WARM_UP_STARTUP, WARM_UP_BACKGROUND]
+
+
+class NarrativeCacheKeeper:
+    """
+    Keeps the Narrative info cache warm across restarts.
+
+    If there's a cache file, the cache is loaded from it on start, and saved to it every
+    save_interval seconds and when the process exits. Entries are keyed on the workspace
+    moddate, so saved entries never go stale - they just stop being looked up.
+
+    Only forked workers save the cache. The process that starts the keeper is the server's
+    master, which never serves a request after forking, so its cache never gets any fresher
+    than it was at startup and saving it would overwrite what the workers have learned.
+
+    The cache can also be warmed up by listing the public narratives and narratorials,
+    either at startup (before the server forks its workers, so they all start with a warm
+    cache) or in the background. A background warm-up is run once, by the first worker to
+    be forked, so it only warms that worker's cache and the shared narrative info store, if
+    there is one. Either way it's done anonymously, so it only ever sees public workspaces.
+
+    The per-worker saving and background warm-up are started by Python fork hooks, which
+    uwsgi only runs when started with --py-call-uwsgi-fork-hooks (as the start script does).
+    """
+
+    def __init__(self, nar_list_utils: NarrativeListUtils, cache_file: str | None = None,
+                 save_interval: float = 0) -> None:
+        """
+        nar_list_utils - the NarrativeListUtils whose cache to keep
+        cache_file - the file to save the cache to and load it from. If None, the cache
+            isn't saved.
+        save_interval - seconds between saves. If 0, the cache is only saved at exit.
+        """
+        self._nar_list_utils = nar_list_utils
+        self._cache_file = cache_file
+        self._save_interval = float(save_interval)
+        self._stop = threading.Event()
+        self._save_lock = threading.Lock()
+
+    def start(self, ws_client=None, warm_up: str = WARM_UP_OFF) -> None:
+        """
+        Loads the saved cache and starts keeping it.
+
+        ws_client - an anonymous Workspace client used to warm up the cache
+        warm_up - one of WARM_UP_MODES
+        """
+        if warm_up not in WARM_UP_MODES:
+            raise ValueError(f"warm_up must be one of {WARM_UP_MODES}, not '{warm_up}'")
+        self.load()
+        if warm_up == WARM_UP_STARTUP:
+            self.warm_up(ws_client)
+        elif warm_up == WARM_UP_BACKGROUND:
+            # shared with the forked workers, so only one of them runs the warm-up
+            self._warm_up_claimed = multiprocessing.Value("b", 0)
+            os.register_at_fork(
+                after_in_child=functools.partial(self._warm_up_in_background, ws_client)
+            )
+        if self._cache_file:
+            os.register_at_fork(after_in_child=self._start_saving)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def load(self) -> int:
+        """
+        Loads the cache file into the cache, and returns the number of entries loaded.
+        A missing or unreadable file is skipped - the cache just starts cold.
+        """
+        if not self._cache_file:
+            return 0
+        try:
+            with open(self._cache_file) as infile:
+                entries = json.load(infile)
+            self._nar_list_utils.narrativeInfo.load_entries(entries)
+        except (OSError, ValueError, TypeError, IndexError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Unable to load the narrative list cache from {self._cache_file}: {e}")
+            return 0
+        return len(entries)
+
+    def save(self) -> None:
+        """
+        Saves the cache to the cache file. The file is replaced in one step, so a reader
+        never sees a partial file.
+        """
+        if not self._cache_file:
+            return
+        entries = self._nar_list_utils.narrativeInfo.dump_entries()
+        tmp_file = f"{self._cache_file}.{os.getpid()}.tmp"
+        with self._save_lock:
+            with open(tmp_file, "w") as outfile:
+                json.dump(entries, outfile)
+            os.replace(tmp_file, self._cache_file)
+
+    def warm_up(self, ws_client) -> None:
+        """
+        Fills the cache with the public narratives and narratorials.
+        """
+        try:
+            self._nar_list_utils.list_public_narratives(ws_client)
+            self._nar_list_utils.list_narratorials(ws_client)
+        except Exception as e:
+            # a failed warm-up just leaves a colder cache, it shouldn't stop the service
+            print(f"Unable to warm up the narrative list cache: {e}")
+
+    def _warm_up_in_background(self, ws_client) -> None:
+        with self._warm_up_claimed.get_lock():
+            if self._warm_up_claimed.value:
+                return
+            self._warm_up_claimed.value = 1
+        threading.Thread(target=self.warm_up, args=(ws_client,), daemon=True).start()
+
+    def _start_saving(self) -> None:
+        atexit.register(self.save)
+        if self._save_interval > 0:
+            self._stop = threading.Event()
+            threading.Thread(target=self._save_loop, daemon=True).start()
+
+    def _save_loop(self) -> None:
+        while not self._stop.wait(self._save_interval):
+            try:
+                self.save()
+            except OSError as e:
+                print(f"Unable to save the narrative list cache to {self._cache_file}: {e}")
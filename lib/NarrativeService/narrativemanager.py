@@ -1,18 +1,144 @@
+import asyncio
 import contextlib
+import copy
 import json
+import os
+import threading
 import time
 import uuid
-from typing import Any
+from collections.abc import Callable
+from json.encoder import encode_basestring_ascii
+from typing import Any, NamedTuple
 
 from installed_clients.NarrativeMethodStoreClient import NarrativeMethodStore
 from installed_clients.WorkspaceClient import Workspace
 from jsonrpcbase import ServerError
+from NarrativeService.data.speccache import SpecCache
 from NarrativeService.SearchServiceClient import SearchServiceClient
 from NarrativeService.ServiceUtils import ServiceUtils
+from NarrativeService.util import backoff
+from NarrativeService.util.aio import AsyncClient, run_blocking, run_sync
 
 MAX_WS_METADATA_VALUE_SIZE = 900
+DEFAULT_INDEX_WAIT_TIMEOUT = 60  # seconds
+DEFAULT_COPY_MAX_WORKERS = 8
 NARRATIVE_TYPE = "KBaseNarrative.Narrative"
 
+# the parts of a new narrative's metadata that are the same for every narrative, with the
+# workspace metadata (string only) version encoded up front
+_NEW_JOB_IDS = {
+    "methods": [],
+    "apps": [],
+    "job_usage": {"queue_time": 0, "run_time": 0}
+}
+_NEW_METADATA_EXTERNAL = {
+    "job_ids": json.dumps(_NEW_JOB_IDS),
+    "format": "ipynb",
+    "creator": "",
+    "ws_name": "",
+    "name": "",
+    "type": NARRATIVE_TYPE,
+    "description": "",
+    "data_dependencies": json.dumps([])
+}
+
+
+def _safe_json_dumps(o: Any) -> str:
+    """
+    Returns the same JSON as json.dumps(o), except that every ' and " in a string value is
+    escaped as &apos; or &quot;, so the JSON can be put in a single-quoted javascript string.
+    Keys are left as they are. The escaping is done while encoding, in one pass, and o is
+    never changed.
+    """
+    chunks = []
+    _safe_json_encode(o, chunks.append)
+    return "".join(chunks)
+
+
+def _safe_json_encode(o: Any, out: Callable[[str], None]) -> None:
+    if isinstance(o, str):
+        out(encode_basestring_ascii(o.replace("'", "&apos;").replace('"', "&quot;")))
+    elif isinstance(o, dict):
+        if not o:
+            out("{}")
+            return
+        sep = "{"
+        for key, value in o.items():
+            if not isinstance(key, str):
+                key = _json_scalar(key)  # noqa: PLW2901
+            out(sep + encode_basestring_ascii(key) + ": ")
+            _safe_json_encode(value, out)
+            sep = ", "
+        out("}")
+    elif isinstance(o, list | tuple):
+        if not o:
+            out("[]")
+            return
+        sep = "["
+        for value in o:
+            out(sep)
+            _safe_json_encode(value, out)
+            sep = ", "
+        out("]")
+    elif o is None or isinstance(o, bool | int | float):
+        out(_json_scalar(o))
+    else:
+        raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def _json_scalar(o: Any) -> str:
+    # None, bools and numbers, the way json encodes them (including as keys)
+    if o is None:
+        return "null"
+    if o is True:
+        return "true"
+    if o is False:
+        return "false"
+    if isinstance(o, int):
+        return int.__repr__(o)
+    if isinstance(o, float):
+        if o != o:  # noqa: PLR0124
+            return "NaN"
+        if o in (float("inf"), float("-inf")):
+            return "Infinity" if o > 0 else "-Infinity"
+        return float.__repr__(o)
+    raise TypeError(f"keys must be str, int, float, bool or None, not {type(o).__name__}")
+
+
+class CellTemplate(NamedTuple):
+    """
+    An app or method spec, compiled once for building cells from. It's shared by every
+    narrative built from that spec, so it must be treated as read-only.
+    """
+    # the spec, escaped to be safe to embed in a cell's script
+    spec: dict[str, Any]
+    # the JSON of the escaped spec
+    spec_json: str
+
+
+# intro cell file path -> ((mtime, size), parsed intro cell)
+_intro_cells = {}
+_intro_cell_lock = threading.Lock()
+
+# the parts of a narrative's cells that get_narrative_doc uses
+_DOC_CELL_PATHS = [
+    "cell_type",
+    "source",
+    "metadata/kbase/type",
+    "metadata/kbase/attributes/title",
+    "metadata/kbase/outputCell/widget/name",
+    "metadata/kbase/dataCell/objectInfo/name",
+    "metadata/kbase/appCell/app/spec/info/name",
+]
+# workspace subset paths for the narrative object, so the cell outputs, job states, etc.
+# (which can be huge) are never fetched. Older narratives keep their cells in worksheets.
+DOC_INCLUDED_PATHS = [
+    "/metadata/name",
+    "/metadata/kbase/creator",
+    *[f"/cells/[*]/{path}" for path in _DOC_CELL_PATHS],
+    *[f"/worksheets/[*]/cells/[*]/{path}" for path in _DOC_CELL_PATHS],
+]
+
 
 class NarrativeManager:
 
@@ -30,53 +156,198 @@ class NarrativeManager:
         config: dict[str, Any],
         user_id: str,
         workspace_client: Workspace,
-        search_service_client: SearchServiceClient
+        search_service_client: SearchServiceClient,
+        spec_cache: SpecCache | None = None
     ) -> None:
         self.narrativeMethodStoreURL = config["narrative-method-store"]
+        self.spec_cache = spec_cache
         self.user_id = user_id
         self.ws = workspace_client
         self.search_client = search_service_client
         self.intro_cell_file = config["intro-cell-file"]
+        # how long revert_narrative_object waits for the new version to be searchable
+        self.index_wait_timeout = float(
+            config.get("search-index-wait-timeout", DEFAULT_INDEX_WAIT_TIMEOUT)
+        )
+        self.index_wait_first_delay = float(
+            config.get("search-index-wait-first-delay", backoff.DEFAULT_FIRST_DELAY)
+        )
+        self.index_wait_max_delay = float(
+            config.get("search-index-wait-max-delay", backoff.DEFAULT_MAX_DELAY)
+        )
+        # max number of objects copied at once into a new narrative
+        self.copy_max_workers = int(
+            config.get("narrative-copy-max-workers", DEFAULT_COPY_MAX_WORKERS)
+        )
 
     def get_narrative_doc(self: "NarrativeManager", narrative_upa: str) -> dict[str, Any]:
+        ws_id = self._get_doc_ws_id(narrative_upa)
+        (obj_data, data_objects, permissions) = run_sync(
+            self._fetch_doc_sources(narrative_upa, ws_id)
+        )
+        return self._make_doc(obj_data, ws_id, data_objects, permissions)
+
+    def get_narrative_docs(
+        self: "NarrativeManager",
+        narrative_upas: list[str]
+    ) -> list[dict[str, Any]]:
+        """
+        Builds the search docs for a batch of narratives, grouped by workspace, so the whole
+        batch takes one get_objects2 call, one get_permissions_mass call, and one list_objects
+        call per workspace (made concurrently).
+
+        Returns a result for each upa, in order, with the upa and either the doc, or an
+        error message saying why the doc couldn't be made.
+        """
+        results = [{"narrative_upa": upa} for upa in narrative_upas]
+        ws_ids = {}
+        for i, upa in enumerate(narrative_upas):
+            try:
+                ws_ids[i] = self._get_doc_ws_id(upa)
+            except ValueError as err:
+                results[i]["error"] = str(err)
+        if not ws_ids:
+            return results
+
+        (objects, ws_objects, ws_perms) = run_sync(self._fetch_docs_sources(
+            [narrative_upas[i] for i in ws_ids], list(ws_ids.values())
+        ))
+        for (i, ws_id), obj_data in zip(ws_ids.items(), objects, strict=True):
+            upa = narrative_upas[i]
+            if obj_data is None:
+                results[i]["error"] = f'Item with upa "{upa}" not found in workspace database.'
+                continue
+            for source in (ws_objects[ws_id], ws_perms[ws_id]):
+                if isinstance(source, BaseException):
+                    results[i]["error"] = str(source)
+                    break
+            else:
+                try:
+                    results[i]["doc"] = self._make_doc(
+                        obj_data, ws_id, ws_objects[ws_id], [ws_perms[ws_id]]
+                    )
+                except (KeyError, IndexError, TypeError, AttributeError) as err:
+                    results[i]["error"] = f'Unable to make a doc for "{upa}": {err!r}'
+        return results
+
+    def _get_doc_ws_id(self: "NarrativeManager", narrative_upa: str) -> int:
         try:
             # ensure correct upa format and get numerical ws_id
             ws_id, _, _, = (int(i) for i in narrative_upa.split("/"))
-            obj_data = self.ws.get_objects2({"objects": [{"ref": narrative_upa}]})["data"][0]
-        except ValueError as err:
+        except (ValueError, AttributeError) as err:
             raise ValueError(
                 "Incorrect upa format: required format is <workspace_id>/<object_id>/<version>"
             ) from err
-        except ServerError as err:
-            raise ValueError(
-                f'Item with upa "{narrative_upa}" not found in workspace database.'
-            ) from err
+        return ws_id
 
-        data_objects = self.ws.list_objects({"ids": [ws_id]})
-        permissions = self.ws.get_permissions_mass({"workspaces": [{"id": ws_id}]})["perms"]
+    def _make_doc(
+        self: "NarrativeManager",
+        obj_data: dict[str, Any],
+        ws_id: int,
+        data_objects: list[list[Any]],
+        permissions: list[dict[str, str]]
+    ) -> dict[str, Any]:
         shared_users, is_public = self._fmt_doc_permissions(permissions)
 
         # get cells (checking for older narratives)
         if "worksheets" in obj_data["data"]:
-            cells = obj_data["data"]["worksheets"][0]["cells"]
+            cells = obj_data["data"]["worksheets"][0].get("cells", [])
         else:
-            cells = obj_data["data"]["cells"]
+            cells = obj_data["data"].get("cells", [])
+        # a subset leaves out any maps that had none of the included paths
+        metadata = obj_data["data"].get("metadata", {})
 
         return {
             "access_group": obj_data.get("orig_wsid", ws_id),
             "cells": [self._get_doc_cell(c) for c in cells],
-            "total_cells": len(obj_data["data"]["cells"]),
+            "total_cells": len(cells),
             "data_objects": [{"name": o[1], "obj_type": o[2]}
                                 for o in data_objects if "KBaseNarrative.Narrative" not in o[2]],
-            "creator": obj_data["data"]["metadata"].get("kbase", {}).get("creator", ""),
+            "creator": metadata.get("kbase", {}).get("creator", ""),
             "shared_users": shared_users,
             "is_public": is_public,
             "timestamp": obj_data.get("epoch", 0),
             "creation_date": obj_data.get("created", ""),
-            "narrative_title": obj_data["data"]["metadata"].get("name", ""),
+            "narrative_title": metadata.get("name", ""),
             "version": obj_data["info"][4]
         }
 
+    async def _fetch_doc_sources(
+        self: "NarrativeManager",
+        narrative_upa: str,
+        ws_id: int
+    ) -> tuple[dict[str, Any], list[list[Any]], list[dict[str, str]]]:
+        """
+        Gets the narrative object, the object infos in its workspace, and the workspace
+        permissions all at once, since only the first depends on the upa. If the narrative
+        can't be fetched, that's the error raised, whatever happened to the other calls.
+        """
+        ws = AsyncClient(self.ws)
+        results = await asyncio.gather(
+            ws.get_objects2({
+                "objects": [{"ref": narrative_upa, "included": DOC_INCLUDED_PATHS}]
+            }),
+            # the doc only uses the object names and types
+            ws.list_objects({"ids": [ws_id], "includeMetadata": 0}),
+            ws.get_permissions_mass({"workspaces": [{"id": ws_id}]}),
+            return_exceptions=True
+        )
+        if isinstance(results[0], ServerError):
+            raise ValueError(
+                f'Item with upa "{narrative_upa}" not found in workspace database.'
+            ) from results[0]
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return (results[0]["data"][0], results[1], results[2]["perms"])
+
+    async def _fetch_docs_sources(
+        self: "NarrativeManager",
+        narrative_upas: list[str],
+        upa_ws_ids: list[int]
+    ) -> tuple[list[dict[str, Any] | None], dict[int, Any], dict[int, Any]]:
+        """
+        Gets the narrative objects, the object infos in each of their workspaces, and the
+        workspace permissions all at once. upa_ws_ids has the workspace id of each upa.
+
+        Returns the objects, in order, with None for any that couldn't be fetched, and
+        mappings from each workspace id to its object infos and permissions, or the error
+        raised while getting them.
+        """
+        ws = AsyncClient(self.ws)
+        ws_ids = list(dict.fromkeys(upa_ws_ids))
+        (objects, perms, *ws_objects) = await asyncio.gather(
+            ws.get_objects2({
+                "objects": [{"ref": upa, "included": DOC_INCLUDED_PATHS} for upa in narrative_upas],
+                "ignoreErrors": 1
+            }),
+            ws.get_permissions_mass({"workspaces": [{"id": ws_id} for ws_id in ws_ids]}),
+            *[ws.list_objects({"ids": [ws_id], "includeMetadata": 0}) for ws_id in ws_ids],
+            return_exceptions=True
+        )
+        if isinstance(objects, BaseException):
+            raise objects
+        objects = objects["data"]
+        ws_perms = dict.fromkeys(ws_ids, perms)
+        if isinstance(perms, BaseException):
+            # the call fails as a whole if any workspace can't be read, so try again with just
+            # the workspaces the narratives were fetched from
+            found_ws_ids = list(dict.fromkeys(
+                ws_id for (ws_id, obj_data) in zip(upa_ws_ids, objects, strict=True)
+                if obj_data is not None
+            ))
+            if found_ws_ids:
+                try:
+                    perms = await ws.get_permissions_mass(
+                        {"workspaces": [{"id": ws_id} for ws_id in found_ws_ids]}
+                    )
+                    ws_perms.update(zip(found_ws_ids, perms["perms"], strict=True))
+                except Exception as err:  # noqa: BLE001
+                    ws_perms.update(dict.fromkeys(found_ws_ids, err))
+        else:
+            ws_perms = dict(zip(ws_ids, perms["perms"], strict=True))
+        return (objects, dict(zip(ws_ids, ws_objects, strict=True)), ws_perms)
+
     def _fmt_doc_permissions(
         self: "NarrativeManager",
         permissions: dict[str, str]
@@ -85,7 +356,8 @@ class NarrativeManager:
         is_public = False
         shared_users = []
         for permission in permissions:
-            k, v = permission.popitem()
+            # the last entry, without changing the (possibly shared) dict
+            k, v = next(reversed(permission.items()))
             if k == "*":
                 is_public = (v != "n")
             elif v != "n":
@@ -122,7 +394,7 @@ class NarrativeManager:
             # type kbase_app
             return {
                 "cell_type": "kbase_app",
-                "desc": meta.get("appCell")
+                "desc": meta.get("appCell", {})
                             .get("app", {})
                             .get("spec", {})
                             .get("info", {})
@@ -139,7 +411,16 @@ class NarrativeManager:
             "desc": ""
         }
 
-    def revert_narrative_object(self: "NarrativeManager", obj: dict[str, Any]) -> list[Any]:
+    def revert_narrative_object(
+        self: "NarrativeManager",
+        obj: dict[str, Any],
+        wait_for_index: bool = True
+    ) -> list[Any]:
+        """
+        Reverts the object to the given version, and returns the object_info of the new
+        version that makes. Unless wait_for_index is False, this then waits for the new
+        version to be indexed in search - otherwise the caller can poll is_version_indexed.
+        """
         # check that there is a proper workspace id and object id
         if ("wsid" not in obj or "objid" not in obj):
             raise ValueError(
@@ -177,33 +458,47 @@ class NarrativeManager:
         })
 
         # wait until new version number is indexed in search so that UI can load new result
-        self._check_new_version_indexed(obj, revert_result[4])
+        if wait_for_index:
+            self._check_new_version_indexed(obj, revert_result[4])
 
         return revert_result
 
+    def is_version_indexed(self: "NarrativeManager", obj: dict[str, int]) -> bool:
+        """
+        Returns whether the given object version (wsid, objid, and ver) is in search yet.
+        This is how a caller polls for a revert made without waiting for the index.
+        """
+        for key in ("wsid", "objid", "ver"):
+            if not isinstance(obj.get(key), int):
+                raise ValueError(f"{key} must be an integer")
+        return self.search_client.search_workspace_by_id(
+            obj["wsid"], obj["objid"], version=obj["ver"]
+        ) is not None
+
     def _check_new_version_indexed(
         self: "NarrativeManager",
         obj: dict[str, int | str],
         new_version: int
     ) -> dict[str, Any]:
-        tries = 0
-        max_tries: int = 60
-        data = None
-        while tries < max_tries and data is None:
+        def probe() -> dict[str, Any] | None:
             try:
-                tries += 1
-                time.sleep(1)
-                data = self.search_client.search_workspace_by_id(
+                return self.search_client.search_workspace_by_id(
                     obj["wsid"], obj["objid"], version=new_version
                 )
-            except Exception:  # noqa: S112, BLE001
+            except Exception:  # noqa: BLE001
                 # try again, the connection may be faulty
-                continue
+                return None
 
+        data = backoff.poll_until(
+            probe,
+            self.index_wait_timeout,
+            first_delay=self.index_wait_first_delay,
+            max_delay=self.index_wait_max_delay
+        )
         if data is None:
             raise TimeoutError(
-                f"Max tries for workspace {obj['wsid']}/{obj['objid']}/{new_version} exceeded; "
-                "please try searching for new version later"
+                f"Timed out waiting for {obj['wsid']}/{obj['objid']}/{new_version} to be "
+                "indexed; please try searching for new version later"
             )
         return data
 
@@ -331,10 +626,20 @@ class NarrativeManager:
 
     def _get_intro_cell(self: "NarrativeManager") -> dict[str, Any]:
         """
-        Loads intro cell JSON from file
+        Returns the intro cell JSON from the file. It's only read again when the file changes,
+        and the cell is shared by every new narrative, so it must be treated as read-only.
         """
+        stat = os.stat(self.intro_cell_file)
+        file_version = (stat.st_mtime_ns, stat.st_size)
+        with _intro_cell_lock:
+            cached = _intro_cells.get(self.intro_cell_file)
+        if cached is not None and cached[0] == file_version:
+            return cached[1]
         with open(self.intro_cell_file) as intro_cell:
-            return json.load(intro_cell)
+            cell = json.load(intro_cell)
+        with _intro_cell_lock:
+            _intro_cells[self.intro_cell_file] = (file_version, cell)
+        return cell
 
     def _create_temp_narrative(
         self: "NarrativeManager",
@@ -397,38 +702,29 @@ class NarrativeManager:
         # fetchSpecs
         app_spec_ids = []
         method_spec_ids = []
-        spec_mapping = {"apps": {}, "methods": {}}
         for cell in cells:
             if "app" in cell:
                 app_spec_ids.append(cell["app"])
             elif "method" in cell:
                 method_spec_ids.append(cell["method"])
-        nms = NarrativeMethodStore(self.narrativeMethodStoreURL)
-        if len(app_spec_ids) > 0:
-            app_specs = nms.get_app_spec({"ids": app_spec_ids})
-            for spec in app_specs:
-                spec_id = spec["info"]["id"]
-                spec_mapping["apps"][spec_id] = spec
-        if len(method_spec_ids) > 0:
-            method_specs = nms.get_method_spec({"ids": method_spec_ids})
-            for spec in method_specs:
-                spec_id = spec["info"]["id"]
-                spec_mapping["methods"][spec_id] = spec
+        spec_mapping = {
+            "apps": self._get_cell_templates("apps", app_spec_ids),
+            "methods": self._get_cell_templates("methods", method_spec_ids)
+        }
         # end of fetchSpecs
 
-        metadata = {
-            "job_ids": {
-                "methods": [],
-                "apps": [],
-                "job_usage": {"queue_time": 0, "run_time": 0}
-            },
-            "format": "ipynb",
+        # only the per-narrative fields need filling in, the rest is already encoded
+        metadata_external = {
+            **_NEW_METADATA_EXTERNAL,
             "creator": self.user_id,
             "ws_name": ws_name,
-            "name": title,
-            "type": "KBaseNarrative.Narrative",
-            "description": "",
-            "data_dependencies": []
+            "name": title if isinstance(title, str) else json.dumps(title)
+        }
+        metadata = {
+            **metadata_external,
+            "job_ids": copy.deepcopy(_NEW_JOB_IDS),
+            "data_dependencies": [],
+            "name": title
         }
         cell_data = self._gather_cell_data(cells, spec_mapping, parameters, include_intro_cell)
         narrative_object = {
@@ -437,15 +733,31 @@ class NarrativeManager:
             "metadata": metadata,
             "nbformat": 4
         }
-        metadata_external = {}
-        for key in metadata:
-            value = metadata[key]
-            if isinstance(value, str):
-                metadata_external[key] = value
-            else:
-                metadata_external[key] = json.dumps(value)
         return [narrative_object, metadata_external]
 
+    def _get_cell_templates(
+        self: "NarrativeManager",
+        kind: str,
+        spec_ids: list[str]
+    ) -> dict[str, CellTemplate]:
+        """
+        Returns a mapping from spec id to compiled cell template for the given app ("apps")
+        or method ("methods") spec ids, from the spec cache when there is one.
+        """
+        if not spec_ids:
+            return {}
+
+        def fetch(ids: list[str]) -> list[dict[str, Any]]:
+            nms = NarrativeMethodStore(self.narrativeMethodStoreURL)
+            if kind == "apps":
+                return nms.get_app_spec({"ids": ids})
+            return nms.get_method_spec({"ids": ids})
+
+        if self.spec_cache is None:
+            return {spec["info"]["id"]: self.compile_cell_template(kind, spec)
+                    for spec in fetch(spec_ids)}
+        return self.spec_cache.get_specs(kind, spec_ids, fetch)
+
     def _gather_cell_data(
         self: "NarrativeManager",
         cells: list[dict[str, Any]],
@@ -479,7 +791,7 @@ class NarrativeManager:
     def _build_app_cell(
         self: "NarrativeManager",
         pos: int,
-        spec: dict[str, Any],
+        template: CellTemplate,
         params: list[list[Any]]
     ) -> dict[str, Any]:
         cell_id = "kb-cell-" + str(pos) + "-" + str(uuid.uuid4())
@@ -488,14 +800,14 @@ class NarrativeManager:
             "source": "<div id='" + cell_id + "'></div>" +
                       "\n<script>" +
                       "$('#" + cell_id + "').kbaseNarrativeAppCell({'appSpec' : '" +
-                      self._safe_json_stringify(spec) + "', 'cellId' : '" + cell_id + "'});" +
+                      template.spec_json + "', 'cellId' : '" + cell_id + "'});" +
                       "</script>",
             "metadata": {}
         }
         cell_info = {}
         widget_state = []
         cell_info[self.KB_TYPE] = self.KB_APP_CELL
-        cell_info["app"] = spec
+        cell_info["app"] = template.spec
         if params:
             steps = {}
             for param in params:
@@ -513,7 +825,7 @@ class NarrativeManager:
     def _build_method_cell(
         self: "NarrativeManager",
         pos: int,
-        spec: dict[str, Any],
+        template: CellTemplate,
         params: list[list[Any]]
     ) -> dict[str, Any]:
         cell_id = "kb-cell-" + str(pos) + "-" + str(uuid.uuid4())
@@ -521,11 +833,11 @@ class NarrativeManager:
                 "source": "<div id='" + cell_id + "'></div>" +
                           "\n<script>" +
                           "$('#" + cell_id + "').kbaseNarrativeMethodCell({'method' : '" +
-                          self._safe_json_stringify(spec) + "'});" +
+                          template.spec_json + "'});" +
                           "</script>",
                 "metadata": {}}
-        cell_info = {"method": spec,
-                    "widget": spec["widgets"]["input"]}
+        cell_info = {"method": template.spec,
+                    "widget": template.spec["widgets"]["input"]}
         cell_info[self.KB_TYPE] = self.KB_FUNCTION_CELL
         widget_state = []
         if params:
@@ -563,39 +875,53 @@ class NarrativeManager:
                                           "new": new_meta})
         # copy_to_narrative:
         if import_data:
-            objects_to_copy = [{"ref": x} for x in import_data]
-            info_list = self.ws.get_object_info_new({
-                "objects": objects_to_copy,
-                "includeMetadata": 0
-            })
-            for item in info_list:
-                obj_info = ServiceUtils.object_info_to_object(item)
-                self.copy_object(obj_info["ref"], ws_id, None, None, obj_info)
+            errors = run_sync(self._copy_import_data(import_data, ws_id))
+            if errors:
+                raise ValueError(
+                    f"Unable to copy {len(errors)} of {len(import_data)} objects into the new "
+                    "narrative:\n" + "\n".join(f"{ref}: {err}" for (ref, err) in errors)
+                )
 
         return self.ws.get_workspace_info({"id": ws_id})
 
-    def _safe_json_stringify(
+    async def _copy_import_data(
         self: "NarrativeManager",
-        obj: str | list[str] | dict[str, str]
-    ) -> str | list[str] | dict[str, str]:
-        return json.dumps(self._safe_json_stringify_prepare(obj))
+        import_data: list[str],
+        ws_id: str | int
+    ) -> list[tuple[str, Exception]]:
+        """
+        Copies the objects in import_data into the workspace, up to copy_max_workers at a time.
+        Every object is tried, whether or not others fail. Returns a (ref, error) pair for
+        each object that couldn't be copied, in import_data order.
+        """
+        ws = AsyncClient(self.ws)
+        info_list = await ws.get_object_info_new({
+            "objects": [{"ref": x} for x in import_data],
+            "includeMetadata": 0,
+            "ignoreErrors": 1
+        })
+        limit = asyncio.Semaphore(self.copy_max_workers)
 
-    def _safe_json_stringify_prepare(
-        self: "NarrativeManager",
-        obj: str | list[str] | dict[str, str]
-    ) -> str | list[str] | dict[str, str]:
-        if isinstance(obj, str):
-            return obj.replace("'", "&apos;").replace('"', "&quot;")
-        if isinstance(obj, list):
-            for pos in range(len(obj)):
-                obj[pos] = self._safe_json_stringify_prepare(obj[pos])
-        elif isinstance(obj, dict):
-            obj_keys = list(obj.keys())
-            for key in obj_keys:
-                obj[key] = self._safe_json_stringify_prepare(obj[key])
-        else:
-            pass  # it's boolean/int/float/None
-        return obj
+        async def copy_one(item: list[Any] | None) -> None:
+            if item is None:
+                raise ValueError("Object not found, or not accessible")
+            obj_info = ServiceUtils.object_info_to_object(item)
+            async with limit:
+                await run_blocking(self.copy_object, obj_info["ref"], ws_id, None, None, obj_info)
+
+        results = await asyncio.gather(*[copy_one(item) for item in info_list], return_exceptions=True)
+        return [(ref, result) for (ref, result) in zip(import_data, results, strict=True)
+                if isinstance(result, BaseException)]
+
+    @staticmethod
+    def compile_cell_template(kind: str, spec: dict[str, Any]) -> CellTemplate:
+        """
+        Compiles an app ("apps") or method ("methods") spec into the template its cells are
+        built from. The spec itself isn't changed.
+        """
+        spec_json = _safe_json_dumps(spec)
+        # the escaped spec is what goes in the cell metadata
+        return CellTemplate(json.loads(spec_json), spec_json)
 
     def copy_object(
         self: "NarrativeManager",
@@ -1,13 +1,19 @@
 import NarrativeService.util.workspace as ws
 from installed_clients.baseclient import ServerError
 from NarrativeService import feeds
+from NarrativeService.util.clientcache import ClientCache
 
 SERVICE_TOKEN_KEY = "service-token" # noqa: S105
 WS_TOKEN_KEY = "ws-admin-token" # noqa: S105
 
 
 class ShareRequester:
-    def __init__(self, params: dict[str, str], config: dict[str, str | int]) -> None:
+    def __init__(
+        self,
+        params: dict[str, str],
+        config: dict[str, str | int],
+        ws_client_cache: ClientCache | None = None
+    ) -> None:
         """This class handles requesting that a Narrative is shared with another
         user.
 
@@ -20,12 +26,16 @@ class ShareRequester:
         * SERVICE_TOKEN_KEY
         * WS_TOKEN_KEY
         * workspace-url
+
+        ws_client_cache is an optional ClientCache of Workspace clients, used to get the admin
+        Workspace client instead of making a new one for each request.
         """
         self.validate_request_params(params)
         self.ws_id = params["ws_id"]
         self.user = params["user"]
         self.share_level = params["share_level"]
         self.config = config
+        self.ws_client_cache = ws_client_cache
 
     def request_share(self) -> dict[str, str | int]:
         """
@@ -52,8 +62,13 @@ class ShareRequester:
         }
 
         # Make the request by firing a notification
+        ws_client = None
+        if self.ws_client_cache is not None:
+            ws_client = self.ws_client_cache.get_client(ws_token)
         try:
-            requestees = ws.get_ws_admins(self.ws_id, self.config["workspace-url"], ws_token)
+            requestees = ws.get_ws_admins(
+                self.ws_id, self.config["workspace-url"], ws_token, ws_client=ws_client
+            )
         except ServerError:
             return {
                 "ok": 0,
@@ -0,0 +1,107 @@
+"""
+An asyncio execution path for the service's I/O-bound work.
+
+The generated KBase clients (and the rest of the service) are synchronous, so rather than
+swapping in a different HTTP client, AsyncClient wraps any existing client and turns each of
+its methods into a coroutine that runs the blocking call on a shared, bounded thread pool.
+The calls still go through the shared HTTP session, so they keep its connection pooling.
+
+The impl methods stay synchronous, since the server is WSGI. run_sync is the bridge: it
+runs a coroutine to completion on a fresh event loop in the calling (request) thread.
+
+The pool size is set from deploy.cfg by configure_executor, when the impl is constructed:
+    async-max-workers - max number of blocking calls running at once, over all requests
+
+A forked worker doesn't get the pool threads of the process it was forked from, so the pool
+belongs to the process that made it, and a new one is made on first use in each worker.
+"""
+import asyncio
+import functools
+import os
+import threading
+from collections.abc import Awaitable, Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, TypeVar
+
+DEFAULT_MAX_WORKERS = 20
+
+T = TypeVar("T")
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_max_workers = DEFAULT_MAX_WORKERS
+
+
+def configure_executor(config: dict[str, str] | None = None) -> None:
+    """
+    Sets the size of the shared thread pool from the given config dict. Any existing pool is
+    shut down once its running calls finish, and a new one is made on next use.
+    """
+    global _executor, _max_workers
+    max_workers = int((config or {}).get("async-max-workers", DEFAULT_MAX_WORKERS))
+    if max_workers < 1:
+        raise ValueError("async-max-workers must be at least 1")
+    with _executor_lock:
+        old_executor = _executor
+        _executor = None
+        _max_workers = max_workers
+    if old_executor is not None:
+        old_executor.shutdown(wait=False)
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Returns the shared thread pool that blocking calls are run on.
+    """
+    global _executor, _executor_pid, _executor_lock
+    if _executor_pid != os.getpid():
+        # a lock held by another thread when the process forked is never released here
+        _executor_lock = threading.Lock()
+        _executor = None
+        _executor_pid = os.getpid()
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=_max_workers,
+                                               thread_name_prefix="aio")
+    return _executor
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Runs a blocking function on the shared thread pool, and returns its result.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+class AsyncClient:
+    """
+    Wraps a synchronous service client, so that every method call on it returns an awaitable
+    that runs the call on the shared thread pool. E.g.:
+
+        ws = AsyncClient(Workspace(url, token=token))
+        info, perms = await asyncio.gather(
+            ws.get_workspace_info({"id": 1}),
+            ws.get_permissions_mass({"workspaces": [{"id": 1}]})
+        )
+    """
+
+    def __init__(self, client: Any) -> None:
+        self.client = client
+
+    def __getattr__(self, name: str) -> Callable[..., Awaitable[Any]]:
+        method = getattr(self.client, name)
+
+        async def call(*args: Any, **kwargs: Any) -> Any:
+            return await run_blocking(method, *args, **kwargs)
+        return call
+
+
+def run_sync(coro: Awaitable[T]) -> T:
+    """
+    Runs a coroutine to completion from synchronous code, and returns its result. This is
+    meant for the request threads, which have no event loop of their own.
+    """
+    return asyncio.run(coro)
@@ -0,0 +1,62 @@
+"""
+Polling with adaptive waits, for things that become true at some unknown point soon, like a
+new object version showing up in search.
+
+The first probe is made right away, and the waits between probes then start small and
+double up to a cap, with some random jitter so many callers don't probe in lockstep. The
+whole wait is bounded by a deadline, rather than a number of tries.
+"""
+import random
+import time
+from collections.abc import Callable, Iterator
+from typing import TypeVar
+
+DEFAULT_FIRST_DELAY = 0.1
+DEFAULT_MAX_DELAY = 5.0
+DEFAULT_BACKOFF_FACTOR = 2.0
+DEFAULT_JITTER = 0.5
+
+T = TypeVar("T")
+
+
+def backoff_delays(
+    first_delay: float = DEFAULT_FIRST_DELAY,
+    max_delay: float = DEFAULT_MAX_DELAY,
+    factor: float = DEFAULT_BACKOFF_FACTOR,
+    jitter: float = DEFAULT_JITTER
+) -> Iterator[float]:
+    """
+    Yields the (endless) series of waits between probes. Each wait is the backoff delay,
+    less a random fraction of it up to jitter.
+    """
+    delay = first_delay
+    while True:
+        yield delay * (1 - random.uniform(0, jitter))  # noqa: S311
+        delay = min(delay * factor, max_delay)
+
+
+def poll_until(
+    probe: Callable[[], T | None],
+    timeout: float,
+    first_delay: float = DEFAULT_FIRST_DELAY,
+    max_delay: float = DEFAULT_MAX_DELAY,
+    sleep: Callable[[float], None] | None = None,
+    clock: Callable[[], float] | None = None
+) -> T | None:
+    """
+    Calls probe until it returns something other than None, and returns that. If that
+    doesn't happen within timeout seconds, returns None. Any error from probe is raised.
+    sleep and clock default to time.sleep and time.monotonic.
+    """
+    sleep = sleep or time.sleep
+    clock = clock or time.monotonic
+    deadline = clock() + timeout
+    delays = backoff_delays(first_delay, max_delay)
+    while True:
+        result = probe()
+        if result is not None:
+            return result
+        remaining = deadline - clock()
+        if remaining <= 0:
+            return None
+        sleep(min(next(delays), remaining))
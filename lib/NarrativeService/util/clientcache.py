@@ -0,0 +1,55 @@
+import hashlib
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+import pylru
+
+DEFAULT_CACHE_SIZE = 500
+DEFAULT_CACHE_TTL = 300  # seconds
+
+
+class ClientCache:
+    """
+    A cache of service clients, keyed on the auth token they were made with.
+
+    Clients are made with client_factory(token) on a miss, and are dropped once they're older
+    than ttl seconds, or pushed out by newer ones when there are more than cache_size. A token
+    of None (an anonymous caller) gets one shared unauthenticated client. The
+    clients here are shared between requests with the same token (and between threads), so
+    they must be stateless apart from the token - true for the generated KBase clients.
+    """
+
+    def __init__(
+        self: "ClientCache",
+        client_factory: Callable[[str], Any],
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        ttl: int = DEFAULT_CACHE_TTL
+    ) -> None:
+        self._client_factory = client_factory
+        self._cache = pylru.lrucache(int(cache_size))
+        self._ttl = int(ttl)
+        self._lock = threading.Lock()
+
+    def get_client(self: "ClientCache", token: str | None) -> Any:
+        """
+        Returns a client made with the given token, making a new one if needed.
+        """
+        key = None if token is None else hashlib.sha256(token.encode("utf-8")).hexdigest()
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is not None and now - cached[1] < self._ttl:
+            return cached[0]
+        client = self._client_factory(token)
+        with self._lock:
+            self._cache[key] = (client, now)
+        return client
+
+    def clear_cache(self: "ClientCache") -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def check_cache_size(self: "ClientCache") -> int:
+        return len(self._cache)
@@ -0,0 +1,236 @@
+"""
+An append-only key/value store in a local file, shared between processes through mmap.
+
+Every uwsgi worker opens the same file. Lookups read straight out of the memory-mapped file
+(shared page cache, so neither the data nor an index of it is copied into each worker) with
+no locking between processes. Writes take an exclusive flock on the file, append the record,
+point the key's hash table slot at it, and then bump the committed size in the file header.
+Readers never look at a record past the committed size, so they never see a half-written
+record.
+
+File layout:
+    header - 8 byte magic, then little-endian 8 byte committed size (including the header
+        and hash table), 8 byte number of keys, and 8 byte number of hash table slots
+    hash table - one 8 byte record offset per slot, 0 for an empty slot. Keys are placed by
+        the crc32 of the key, with linear probing.
+    records - 4 byte key length, 4 byte value length, 4 byte crc32 of key + value, key, value
+
+The file is made max_size bytes long up front (as a sparse file, so unused space doesn't
+take up disk) and mapped once, so it never needs remapping as it fills up. There's one hash
+table slot for every SLOT_SPACING bytes of the file. Keys are expected to never be rewritten
+with a different value (e.g. keyed on a moddate). If a key is appended twice, the last one
+wins. Once the file is full, or its hash table is MAX_LOAD full, the writer that finds it
+full swaps in a fresh, empty file. Other processes keep reading their mapping of the old file
+until they miss on a key, then switch over.
+
+A store made before the process forks (e.g. in the uwsgi master) reopens the file in each
+child before writing, since flocks are shared by processes that share an open file.
+"""
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+_MAGIC = b"NSKVSTR2"
+_HEADER = struct.Struct("<8sQQQ")
+_SLOT = struct.Struct("<Q")
+_RECORD = struct.Struct("<III")
+_MIN_SLOTS = 8
+SLOT_SPACING = 256
+MAX_LOAD = 0.75
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+
+class MmapKeyValueStore:
+    def __init__(self, path: str, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        """
+        path - the file to use. It's made if it doesn't exist.
+        max_size - the size in bytes the file may grow to before it's started over.
+        """
+        self._path = path
+        self._max_size = int(max_size)
+        self._num_slots = max(self._max_size // SLOT_SPACING, _MIN_SLOTS)
+        min_size = _HEADER.size + self._num_slots * _SLOT.size
+        if self._max_size <= min_size:
+            raise ValueError(f"max_size must be greater than {min_size}")
+        self._lock = threading.Lock()
+        self._fd = None
+        self._pid = None
+        self._ino = None
+        self._map = None
+        self._slots = 0
+        with self._lock:
+            self._open()
+
+    def get(self, key: str) -> bytes | None:
+        """
+        Returns the value stored for the key, or None.
+        """
+        key_bytes = key.encode("utf-8")
+        found = self._find(self._map, key_bytes)
+        if found is None:
+            with self._lock:
+                if self._check_rotated():
+                    found = self._find(self._map, key_bytes)
+            if found is None:
+                return None
+        (data, start, end) = found
+        return data[start:end]
+
+    def put(self, key: str, value: bytes) -> None:
+        """
+        Appends the key and value to the store. Values that can never fit are ignored.
+        """
+        key_bytes = key.encode("utf-8")
+        record = _RECORD.pack(len(key_bytes), len(value), zlib.crc32(key_bytes + value))
+        record += key_bytes + value
+        if _HEADER.size + self._num_slots * _SLOT.size + len(record) > self._max_size:
+            return
+        with self._lock:
+            self._check_rotated()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                if self._rotated():
+                    # another process started the file over while we waited for the lock
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+                    self._open()
+                    fcntl.flock(self._fd, fcntl.LOCK_EX)
+                (_, end, count, _) = _HEADER.unpack(os.pread(self._fd, _HEADER.size, 0))
+                (slot, exists) = self._find_slot(key_bytes)
+                if (end + len(record) > len(self._map)
+                        or (not exists and count + 1 > self._slots * MAX_LOAD)):
+                    self._start_over()
+                    (_, end, count, _) = _HEADER.unpack(os.pread(self._fd, _HEADER.size, 0))
+                    (slot, exists) = self._find_slot(key_bytes)
+                os.pwrite(self._fd, record, end)
+                os.pwrite(self._fd, _SLOT.pack(end), _HEADER.size + slot * _SLOT.size)
+                if not exists:
+                    count += 1
+                os.pwrite(self._fd, _HEADER.pack(_MAGIC, end + len(record), count, self._slots), 0)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def __len__(self) -> int:
+        data = self._map
+        if data is None:
+            return 0
+        return _HEADER.unpack_from(data, 0)[2]
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+            self._map = None
+
+    def _open(self) -> None:
+        """Opens (or makes) the file at the path, and maps it. Needs self._lock."""
+        self._close()
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(fd, _HEADER.size, 0)
+            if len(header) < _HEADER.size or _HEADER.unpack(header)[0] != _MAGIC:
+                os.ftruncate(fd, 0)
+                self._write_empty_header(fd)
+            if os.fstat(fd).st_size < self._max_size:
+                os.ftruncate(fd, self._max_size)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._set_file(fd)
+
+    def _write_empty_header(self, fd: int) -> None:
+        table_end = _HEADER.size + self._num_slots * _SLOT.size
+        os.pwrite(fd, _HEADER.pack(_MAGIC, table_end, 0, self._num_slots), 0)
+
+    def _set_file(self, fd: int) -> None:
+        self._fd = fd
+        self._pid = os.getpid()
+        stat = os.fstat(fd)
+        self._ino = stat.st_ino
+        data = mmap.mmap(fd, stat.st_size, prot=mmap.PROT_READ)
+        # the file's own slot count wins, in case it was made with a different max_size
+        self._slots = _HEADER.unpack_from(data, 0)[3]
+        self._map = data
+
+    def _close(self) -> None:
+        # the map isn't closed, since lookups in other threads may still be reading it.
+        # It's unmapped once nothing refers to it.
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _start_over(self) -> None:
+        """
+        Swaps in a new, empty file at the path. Needs self._lock and the flock on the
+        current file, which moves over to the new file.
+        """
+        tmp_path = f"{self._path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        self._write_empty_header(fd)
+        os.ftruncate(fd, self._max_size)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        os.replace(tmp_path, self._path)
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._close()
+        self._set_file(fd)
+
+    def _rotated(self) -> bool:
+        try:
+            return os.stat(self._path).st_ino != self._ino
+        except FileNotFoundError:
+            return True
+
+    def _check_rotated(self) -> bool:
+        """
+        Reopens the file if another process started it over, or this is a forked copy of
+        the process that opened it, and returns whether it did. Needs self._lock.
+        """
+        if self._pid != os.getpid() or self._rotated():
+            self._open()
+            return True
+        return False
+
+    def _find_slot(self, key_bytes: bytes) -> tuple[int, bool]:
+        """
+        Returns the hash table slot that holds the key, or the empty slot it would go in,
+        and whether the key is already there. Needs the flock, so the table can't change.
+        """
+        data = self._map
+        slot = zlib.crc32(key_bytes) % self._slots
+        while True:
+            (offset,) = _SLOT.unpack_from(data, _HEADER.size + slot * _SLOT.size)
+            if offset == 0:
+                return (slot, False)
+            (key_len, _, _) = _RECORD.unpack_from(data, offset)
+            key_start = offset + _RECORD.size
+            if data[key_start:key_start + key_len] == key_bytes:
+                return (slot, True)
+            slot = (slot + 1) % self._slots
+
+    @staticmethod
+    def _find(data: mmap.mmap | None, key_bytes: bytes) -> tuple[mmap.mmap, int, int] | None:
+        """
+        Looks up the key in a mapped file, and returns the map with the start and end of
+        its value, or None. Records that aren't committed yet, or don't check out, are
+        skipped.
+        """
+        if data is None:
+            return None
+        (_, committed, _, num_slots) = _HEADER.unpack_from(data, 0)
+        slot = zlib.crc32(key_bytes) % num_slots
+        for _ in range(num_slots):
+            (offset,) = _SLOT.unpack_from(data, _HEADER.size + slot * _SLOT.size)
+            if offset == 0:
+                return None
+            if offset + _RECORD.size <= committed:
+                (key_len, value_len, crc) = _RECORD.unpack_from(data, offset)
+                key_start = offset + _RECORD.size
+                value_start = key_start + key_len
+                value_end = value_start + value_len
+                if (value_end <= committed
+                        and data[key_start:value_start] == key_bytes
+                        and zlib.crc32(data[key_start:value_end]) == crc):
+                    return (data, value_start, value_end)
+            slot = (slot + 1) % num_slots
+        return None
@@ -0,0 +1,120 @@
+"""
+A process-wide HTTP session shared by every outbound service client (the generated KBase
+clients, the auth client, the search client, and the feeds notifier), so connections to the
+same host are kept alive and reused between calls instead of being opened for every RPC.
+
+The generated clients post with a bare requests.post, and get overwritten by `kb-sdk compile`,
+so rather than being edited, their base client modules are pointed at the session from
+outside with use_session_in. The provenance call to the SDK callback server, in the generated
+server, still makes its own connection.
+
+The session is configured from the deploy.cfg values below, by configure_session, when the
+NarrativeService impl is constructed:
+    http-pool-connections - number of per-host connection pools to keep
+    http-pool-maxsize - max number of connections kept open to a single host
+    http-keep-alive - if "false", connections are closed after each request
+    http-connect-retries - number of times to retry a request that couldn't connect
+    http-retry-backoff - backoff factor (seconds) between connection retries
+
+Only connection failures are retried. A request that reached the server is never retried,
+since most KBase RPC calls aren't idempotent.
+
+A forked worker gets a new session with the same settings on first use, rather than sharing
+the kept-alive connections of the process it was forked from. This is checked on use, rather
+than with a fork hook, since uwsgi doesn't run Python's fork hooks by default.
+"""
+import os
+import threading
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 25
+DEFAULT_CONNECT_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 0.2
+
+_session = None
+_session_pid = None
+_session_config = {}
+_session_lock = threading.Lock()
+
+
+def _make_session(config: dict[str, str]) -> requests.Session:
+    retries = Retry(
+        total=int(config.get("http-connect-retries", DEFAULT_CONNECT_RETRIES)),
+        read=0,
+        status=0,
+        other=0,
+        allowed_methods=None,
+        backoff_factor=float(config.get("http-retry-backoff", DEFAULT_RETRY_BACKOFF)),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=int(config.get("http-pool-connections", DEFAULT_POOL_CONNECTIONS)),
+        pool_maxsize=int(config.get("http-pool-maxsize", DEFAULT_POOL_MAXSIZE)),
+        max_retries=retries
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # the session is shared by every user's calls, so never hold on to cookies
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    if str(config.get("http-keep-alive", "true")).lower() == "false":
+        session.headers["Connection"] = "close"
+    return session
+
+
+def configure_session(config: dict[str, str] | None = None) -> requests.Session:
+    """
+    (Re)builds the shared session from the given config dict, and returns it. Any previous
+    session is closed.
+    """
+    global _session, _session_pid, _session_config
+    new_session = _make_session(config or {})
+    with _session_lock:
+        old_session = _session if _session_pid == os.getpid() else None
+        _session = new_session
+        _session_pid = os.getpid()
+        _session_config = config or {}
+    if old_session is not None:
+        old_session.close()
+    return new_session
+
+
+class _SessionRequests:
+    """
+    Stands in for the requests module in a generated client module, so that its posts go
+    through the shared session. Everything else comes from the requests module.
+    """
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+    def post(self, *args, **kwargs) -> requests.Response:
+        return get_session().post(*args, **kwargs)
+
+
+def use_session_in(*modules) -> None:
+    """
+    Makes the given generated KBase base client modules post through the shared session,
+    by swapping out their `_requests` module.
+    """
+    for module in modules:
+        module._requests = _SessionRequests()
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the shared session, making one with the configured settings if there isn't one
+    for this process yet.
+    """
+    global _session, _session_pid
+    if _session_pid != os.getpid():
+        # no lock, since one held by another thread when the process forked is never released.
+        # Racing threads just make a spare session. The parent's session is dropped rather
+        # than closed, since the parent may still be using its connections.
+        _session = _make_session(_session_config)
+        _session_pid = os.getpid()
+    return _session
@@ -1,8 +1,10 @@
 from installed_clients.WorkspaceClient import Workspace
 
 
-def get_ws_admins(ws_id, ws_url, admin_token):
-    ws = Workspace(url=ws_url, token=admin_token)
+def get_ws_admins(ws_id, ws_url, admin_token, ws_client=None):
+    ws = ws_client
+    if ws is None:
+        ws = Workspace(url=ws_url, token=admin_token)
     perms = ws.administer({
         "command": "getPermissionsMass",
         "params": {
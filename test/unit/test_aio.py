@@ -0,0 +1,69 @@
+"""
+Unit tests for the asyncio helpers.
+"""
+import asyncio
+import os
+import threading
+
+import pytest
+from NarrativeService.util import aio
+
+
+class BlockingClient:
+    """
+    Each call waits on a barrier, so the calls only finish if they all run at once.
+    """
+    def __init__(self, parties):
+        self.barrier = threading.Barrier(parties, timeout=5)
+
+    def echo(self, value, suffix=""):
+        self.barrier.wait()
+        return f"{value}{suffix}"
+
+    def fail(self):
+        raise ValueError("oops")
+
+
+def test_async_client_runs_concurrently():
+    client = aio.AsyncClient(BlockingClient(3))
+
+    async def run():
+        return await asyncio.gather(client.echo(1), client.echo(2), client.echo(3, suffix="!"))
+
+    assert aio.run_sync(run()) == ["1", "2", "3!"]
+
+
+def test_async_client_error():
+    client = aio.AsyncClient(BlockingClient(1))
+    with pytest.raises(ValueError, match="oops"):
+        aio.run_sync(client.fail())
+    with pytest.raises(AttributeError):
+        client.not_a_method  # noqa: B018
+
+
+def test_configure_executor():
+    old_executor = aio.get_executor()
+    try:
+        aio.configure_executor({"async-max-workers": "3"})
+        executor = aio.get_executor()
+        assert executor is not old_executor
+        assert executor._max_workers == 3  # noqa: PLR2004
+        assert aio.get_executor() is executor
+        with pytest.raises(ValueError, match="async-max-workers must be at least 1"):
+            aio.configure_executor({"async-max-workers": "0"})
+    finally:
+        aio.configure_executor()
+
+
+def test_executor_not_shared_after_fork():
+    executor = aio.get_executor()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            new_executor = aio.get_executor()
+            ok = new_executor is not executor and new_executor.submit(lambda: 1).result() == 1
+            os._exit(0 if ok else 1)
+        except BaseException:
+            os._exit(2)
+    assert os.waitpid(pid, 0)[1] == 0
+    assert aio.get_executor() is executor
@@ -0,0 +1,96 @@
+"""
+Unit tests for the auth client and its token cache.
+"""
+from unittest import mock
+
+import pytest
+from NarrativeService.authclient import KBaseAuth, TokenCache
+
+AUTH_URL = "https://ci.kbase.us/services/auth/api/legacy/KBase/Sessions/Login"
+
+
+def test_token_cache_valid_token():
+    cache = TokenCache()
+    assert cache.get_user("some_token") is None
+    cache.add_valid_token("some_token", "some_user")
+    assert cache.get_user("some_token") == "some_user"
+    assert cache.lookup("some_token") == ("some_user", None)
+    stats = cache.stats()
+    assert stats["size"] == 1
+    assert stats["hits"] == 2  # noqa: PLR2004
+    assert stats["misses"] == 1
+
+
+def test_token_cache_invalid_token():
+    cache = TokenCache()
+    cache.add_invalid_token("bad_token", "nope")
+    assert cache.get_user("bad_token") is None
+    assert cache.lookup("bad_token") == (None, "nope")
+    assert cache.stats()["invalid_hits"] == 2  # noqa: PLR2004
+
+
+def test_token_cache_ttl():
+    cache = TokenCache(ttl=300, invalid_ttl=30)
+    with mock.patch("NarrativeService.authclient._time.monotonic", return_value=1000):
+        cache.add_valid_token("some_token", "some_user")
+        cache.add_invalid_token("bad_token", "nope")
+    with mock.patch("NarrativeService.authclient._time.monotonic", return_value=1100):
+        assert cache.get_user("some_token") == "some_user"
+        assert cache.lookup("bad_token") is None
+    with mock.patch("NarrativeService.authclient._time.monotonic", return_value=1300):
+        assert cache.get_user("some_token") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_token_cache_lru():
+    cache = TokenCache(maxsize=3, stripes=1)
+    for i in range(3):
+        cache.add_valid_token(f"token{i}", f"user{i}")
+    # touch token0 so token1 is the least recently used
+    assert cache.get_user("token0") == "user0"
+    cache.add_valid_token("token3", "user3")
+    assert cache.get_user("token1") is None
+    assert [cache.get_user(f"token{i}") for i in (0, 2, 3)] == ["user0", "user2", "user3"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_token_cache_bad_input():
+    cache = TokenCache()
+    with pytest.raises(ValueError, match="Must supply token"):
+        cache.add_valid_token("", "some_user")
+    with pytest.raises(ValueError, match="Must supply user"):
+        cache.add_valid_token("some_token", None)
+    with pytest.raises(ValueError, match="maxsize must be at least 1"):
+        TokenCache(maxsize=0)
+
+
+def test_get_user_cached(requests_mock):
+    requests_mock.post(AUTH_URL, json={"user_id": "some_user"})
+    auth = KBaseAuth(AUTH_URL, cache=TokenCache())
+    assert auth.get_user("some_token") == "some_user"
+    assert auth.get_user("some_token") == "some_user"
+    assert requests_mock.call_count == 1
+
+
+def test_get_user_invalid_token_cached(requests_mock):
+    requests_mock.post(
+        AUTH_URL, status_code=401, reason="Unauthorized",
+        json={"error": {"message": "10020 Invalid token"}}
+    )
+    auth = KBaseAuth(AUTH_URL, cache=TokenCache())
+    for _ in range(3):
+        with pytest.raises(ValueError, match="10020 Invalid token"):
+            auth.get_user("bad_token")
+    assert requests_mock.call_count == 1
+
+
+def test_get_user_server_error_not_cached(requests_mock):
+    requests_mock.post(
+        AUTH_URL, status_code=500, reason="Internal Server Error",
+        json={"error": {"message": "oops"}}
+    )
+    auth = KBaseAuth(AUTH_URL, cache=TokenCache())
+    for _ in range(2):
+        with pytest.raises(ValueError, match="oops"):
+            auth.get_user("some_token")
+    assert requests_mock.call_count == 2  # noqa: PLR2004
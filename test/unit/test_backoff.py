@@ -0,0 +1,66 @@
+"""
+Unit tests for the adaptive polling helpers.
+"""
+from unittest import mock
+
+import pytest
+from NarrativeService.util import backoff
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, secs):
+        self.sleeps.append(secs)
+        self.now += secs
+
+
+def test_backoff_delays_no_jitter():
+    delays = backoff.backoff_delays(first_delay=0.1, max_delay=1, jitter=0)
+    assert [next(delays) for _ in range(6)] == pytest.approx([0.1, 0.2, 0.4, 0.8, 1, 1])
+
+
+def test_backoff_delays_jitter():
+    delays = backoff.backoff_delays(first_delay=1, max_delay=1, jitter=0.5)
+    for _ in range(100):
+        assert 0.5 <= next(delays) <= 1
+
+
+def test_poll_until_first_probe_immediate():
+    clock = FakeClock()
+    assert backoff.poll_until(lambda: "done", 10, sleep=clock.sleep, clock=clock) == "done"
+    assert clock.sleeps == []
+
+
+def test_poll_until_backs_off():
+    clock = FakeClock()
+    results = iter([None, None, None, "done"])
+    with mock.patch("NarrativeService.util.backoff.random.uniform", return_value=0):
+        result = backoff.poll_until(lambda: next(results), 10, first_delay=0.1,
+                                    sleep=clock.sleep, clock=clock)
+    assert result == "done"
+    assert clock.sleeps == pytest.approx([0.1, 0.2, 0.4])
+
+
+def test_poll_until_deadline():
+    clock = FakeClock()
+    probe = mock.MagicMock(return_value=None)
+    with mock.patch("NarrativeService.util.backoff.random.uniform", return_value=0):
+        result = backoff.poll_until(probe, 3, first_delay=1, max_delay=10,
+                                    sleep=clock.sleep, clock=clock)
+    assert result is None
+    # never sleeps past the deadline, and probes once more at it
+    assert clock.sleeps == pytest.approx([1, 2])
+    assert probe.call_count == 3  # noqa: PLR2004
+
+
+def test_poll_until_probe_error():
+    def probe():
+        raise ValueError("oops")
+    with pytest.raises(ValueError, match="oops"):
+        backoff.poll_until(probe, 3)
@@ -0,0 +1,53 @@
+"""
+Unit tests for the ClientCache module.
+"""
+from unittest import mock
+
+from NarrativeService.util.clientcache import ClientCache
+
+
+class FakeClient:
+    def __init__(self, token):
+        self.token = token
+
+
+def test_get_client_reuses_clients():
+    factory = mock.MagicMock(side_effect=FakeClient)
+    cache = ClientCache(factory)
+    client = cache.get_client("token1")
+    assert client.token == "token1"
+    assert cache.get_client("token1") is client
+    other = cache.get_client("token2")
+    assert other is not client
+    assert other.token == "token2"
+    assert factory.call_count == 2  # noqa: PLR2004
+    assert cache.check_cache_size() == 2  # noqa: PLR2004
+
+
+def test_get_client_ttl():
+    cache = ClientCache(FakeClient, ttl=60)
+    with mock.patch("NarrativeService.util.clientcache.time.time", return_value=1000):
+        client = cache.get_client("token1")
+    with mock.patch("NarrativeService.util.clientcache.time.time", return_value=1059):
+        assert cache.get_client("token1") is client
+    with mock.patch("NarrativeService.util.clientcache.time.time", return_value=1060):
+        assert cache.get_client("token1") is not client
+
+
+def test_get_client_size_bound():
+    cache = ClientCache(FakeClient, cache_size=2)
+    first = cache.get_client("token1")
+    cache.get_client("token2")
+    cache.get_client("token3")
+    assert cache.check_cache_size() == 2  # noqa: PLR2004
+    assert cache.get_client("token1") is not first
+    cache.clear_cache()
+    assert cache.check_cache_size() == 0
+
+
+def test_get_client_anonymous():
+    cache = ClientCache(FakeClient)
+    client = cache.get_client(None)
+    assert client.token is None
+    assert cache.get_client(None) is client
+    assert cache.get_client("token1") is not client
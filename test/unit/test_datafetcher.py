@@ -0,0 +1,153 @@
+"""
+Unit tests for the DataFetcher module.
+"""
+from unittest import mock
+
+import pytest
+from installed_clients.baseclient import ServerError
+from NarrativeService.data.fetcher import DataFetcher
+
+USER = "some_user"
+
+
+class TimestampedWorkspaceMock:
+    """
+    By default, each workspace N has N objects. Object i in workspace N was saved at
+    2020-01-0{N}T00:00:00.{i}, and the workspace moddate is the time of its newest object.
+    Every call to list_objects, list_workspace_info, and get_workspace_info is recorded.
+    Workspaces in public_ids can be looked up, but aren't listed by list_workspace_info.
+    """
+    def __init__(self, *args, **kwargs):
+        self.ws_ids = [1, 2, 3, 4, 5]
+        self.public_ids = []
+        self.obj_counts = {ws_id: ws_id for ws_id in self.ws_ids}
+        self.list_objects_calls = []
+        self.list_workspace_info_calls = []
+        self.get_workspace_info_calls = []
+
+    def _ts(self, ws_id, obj_id):
+        return f"2020-01-0{ws_id}T00:00:00.{obj_id:06d}+0000"
+
+    def _ws_info(self, ws_id):
+        num_objs = self.obj_counts[ws_id]
+        return [ws_id, f"ws_{ws_id}", USER, self._ts(ws_id, num_objs), num_objs, "a", "n",
+                "unlocked", {"narrative_nice_name": f"Narrative {ws_id}"}]
+
+    def list_workspace_info(self, params):
+        self.list_workspace_info_calls.append(params)
+        return [self._ws_info(ws_id) for ws_id in self.ws_ids]
+
+    def get_workspace_info(self, params):
+        self.get_workspace_info_calls.append(params["id"])
+        if params["id"] not in self.ws_ids and params["id"] not in self.public_ids:
+            raise ServerError("JSONRPCError", -32500, f"No workspace with id {params['id']} exists")
+        return self._ws_info(params["id"])
+
+    def list_objects(self, params):
+        self.list_objects_calls.append(params["ids"])
+        infos = []
+        for ws_id in params["ids"]:
+            last_id = min(params["maxObjectID"], self.obj_counts[ws_id])
+            for obj_id in range(params["minObjectID"], last_id + 1):
+                infos.append([obj_id, f"obj_{ws_id}_{obj_id}", f"Module.Type{obj_id % 2}-1.0",
+                              self._ts(ws_id, obj_id), 1, USER, ws_id, f"ws_{ws_id}", "", 0, None])
+        return infos
+
+
+@pytest.fixture
+def data_fetcher():
+    with mock.patch("NarrativeService.data.fetcher.Workspace", side_effect=TimestampedWorkspaceMock), \
+         mock.patch("NarrativeService.data.fetcher.KBaseAuth") as mock_auth:
+        yield DataFetcher("https://ws.kbase.us", "https://auth.kbase.us", "some_token", user_id=USER)
+        mock_auth.assert_not_called()
+
+
+def test_user_from_auth():
+    with mock.patch("NarrativeService.data.fetcher.Workspace", side_effect=TimestampedWorkspaceMock), \
+         mock.patch("NarrativeService.data.fetcher.KBaseAuth") as mock_auth:
+        mock_auth.return_value.get_user.return_value = "other_user"
+        df = DataFetcher("https://ws.kbase.us", "https://auth.kbase.us", "some_token")
+        mock_auth.return_value.get_user.assert_called_once_with("some_token")
+    assert df._user == "other_user"
+
+
+def test_fetch_all_sorted(data_fetcher):
+    data = data_fetcher.fetch_accessible_data({"data_set": "mine", "include_type_counts": 1})
+    assert len(data["objects"]) == 15  # noqa: PLR2004
+    assert data["limit_reached"] == 0
+    timestamps = [obj["timestamp"] for obj in data["objects"]]
+    assert timestamps == sorted(timestamps, reverse=True)
+    assert data["type_counts"] == {"Module.Type0-1.0": 6, "Module.Type1-1.0": 9}
+    assert {ws_id: disp["count"] for ws_id, disp in data["workspace_display"].items()} == {
+        1: 1, 2: 2, 3: 3, 4: 4, 5: 5
+    }
+
+
+def test_fetch_limit_keeps_newest(data_fetcher):
+    data = data_fetcher.fetch_accessible_data({
+        "data_set": "mine",
+        "limit": 7,
+        "include_type_counts": 1,
+        "simple_types": 1
+    })
+    assert data["limit_reached"] == 1
+    # workspaces 5 and 4 hold the 9 newest objects, the newest 7 of those come back
+    assert [(obj["ws_id"], obj["obj_id"]) for obj in data["objects"]] == [
+        (5, 5), (5, 4), (5, 3), (5, 2), (5, 1), (4, 4), (4, 3)
+    ]
+    assert data["type_counts"] == {"Type0": 3, "Type1": 4}
+    assert data["workspace_display"][5]["count"] == 5  # noqa: PLR2004
+    assert data["workspace_display"][4]["count"] == 2  # noqa: PLR2004
+    assert data["workspace_display"][1]["count"] == 0
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_fetch_limit_skips_old_workspaces(data_fetcher, workers):
+    data_fetcher._list_objects_workers = workers
+    # big enough that workspace 5 gets its own block of objects to list
+    data_fetcher._ws.obj_counts[5] = 10000
+    data = data_fetcher.fetch_specific_workspace_data({"workspace_ids": [1, 5], "limit": 5})
+    assert data["limit_reached"] == 1
+    assert [obj["obj_id"] for obj in data["objects"]] == [10000, 9999, 9998, 9997, 9996]
+    # workspace 5 fills the limit, workspace 1 is older than all of it, so it's never listed
+    assert data_fetcher._ws.list_objects_calls == [[5]]
+
+
+def _add_workspaces(ws, ws_ids, public=False):
+    for ws_id in ws_ids:
+        (ws.public_ids if public else ws.ws_ids).append(ws_id)
+        ws.obj_counts[ws_id] = 1
+
+
+def test_workspace_infos_few(data_fetcher):
+    ws = data_fetcher._ws
+    (ws_info_list, ws_display) = data_fetcher._get_workspace_infos([3, 1, 3])
+    assert [ws_info[0] for ws_info in ws_info_list] == [3, 1, 3]
+    assert set(ws_display.keys()) == {1, 3}
+    assert ws.list_workspace_info_calls == []
+    assert ws.get_workspace_info_calls == [3, 1]
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_workspace_infos_concurrent(data_fetcher, workers):
+    data_fetcher._list_objects_workers = workers
+    ws = data_fetcher._ws
+    _add_workspaces(ws, range(6, 16))
+    _add_workspaces(ws, [100, 101], public=True)
+    ws_ids = [101, *range(1, 16), 100, 1]
+    (ws_info_list, _) = data_fetcher._get_workspace_infos(ws_ids)
+    assert [ws_info[0] for ws_info in ws_info_list] == ws_ids
+    # no listing of every workspace the user can see, and each id is only looked up once
+    assert ws.list_workspace_info_calls == []
+    assert sorted(ws.get_workspace_info_calls) == [*range(1, 16), 100, 101]
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_workspace_infos_error(data_fetcher, workers):
+    data_fetcher._list_objects_workers = workers
+    _add_workspaces(data_fetcher._ws, range(6, 16))
+    ws_ids = [*range(1, 16), 500, 600]
+    with pytest.raises(ServerError, match="No workspace with id 500 exists"):
+        data_fetcher._get_workspace_infos(ws_ids)
+    with pytest.raises(ServerError, match="No workspace with id 700 exists"):
+        data_fetcher._get_workspace_infos([1, 700, 2, 600])
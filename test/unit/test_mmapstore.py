@@ -0,0 +1,93 @@
+"""
+Unit tests for the MmapKeyValueStore module.
+"""
+import os
+
+import pytest
+from NarrativeService.util.mmapstore import MmapKeyValueStore
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / "store.bin")
+
+
+def test_put_get(store_path):
+    store = MmapKeyValueStore(store_path, max_size=4096)
+    assert store.get("1__foo") is None
+    store.put("1__foo", b"some value")
+    store.put("2__bar", b"")
+    assert store.get("1__foo") == b"some value"
+    assert store.get("2__bar") == b""
+    assert len(store) == 2  # noqa: PLR2004
+    # the file is made full size up front
+    assert os.path.getsize(store_path) == 4096  # noqa: PLR2004
+
+
+def test_shared_between_stores(store_path):
+    writer = MmapKeyValueStore(store_path, max_size=4096)
+    reader = MmapKeyValueStore(store_path, max_size=4096)
+    writer.put("1__foo", b"some value")
+    assert reader.get("1__foo") == b"some value"
+    # the last value written wins
+    reader.put("1__foo", b"other value")
+    assert writer.get("1__foo") == b"other value"
+    # a new store picks up everything already written
+    assert MmapKeyValueStore(store_path, max_size=4096).get("1__foo") == b"other value"
+
+
+def test_start_over_when_full(store_path):
+    writer = MmapKeyValueStore(store_path, max_size=384)
+    reader = MmapKeyValueStore(store_path, max_size=384)
+    writer.put("first", b"x" * 100)
+    assert reader.get("first") == b"x" * 100
+    writer.put("second", b"y" * 100)
+    # no room for the third, so the file starts over
+    writer.put("third", b"z" * 100)
+    assert writer.get("first") is None
+    assert writer.get("third") == b"z" * 100
+    # the reader still has the old file mapped until it misses
+    assert reader.get("first") == b"x" * 100
+    assert reader.get("third") == b"z" * 100
+    assert reader.get("first") is None
+    # and a value that can never fit is just dropped
+    writer.put("huge", b"h" * 1000)
+    assert writer.get("huge") is None
+
+
+def test_many_keys(store_path):
+    store = MmapKeyValueStore(store_path, max_size=64 * 1024)
+    for i in range(150):
+        store.put(f"{i}__key", str(i).encode())
+    reader = MmapKeyValueStore(store_path, max_size=64 * 1024)
+    assert len(reader) == 150  # noqa: PLR2004
+    assert all(reader.get(f"{i}__key") == str(i).encode() for i in range(150))
+    assert reader.get("150__key") is None
+
+
+def test_start_over_when_table_full(store_path):
+    # 8 hash table slots, so room for 6 keys
+    store = MmapKeyValueStore(store_path, max_size=2048)
+    for i in range(6):
+        store.put(str(i), b"x")
+    assert len(store) == 6  # noqa: PLR2004
+    store.put("0", b"y")
+    assert len(store) == 6  # noqa: PLR2004
+    store.put("6", b"x")
+    assert len(store) == 1
+    assert store.get("0") is None
+    assert store.get("6") == b"x"
+
+
+def test_bad_file_is_replaced(store_path):
+    with open(store_path, "wb") as f:
+        f.write(b"not a store file")
+    store = MmapKeyValueStore(store_path, max_size=4096)
+    assert len(store) == 0
+    store.put("1__foo", b"some value")
+    assert store.get("1__foo") == b"some value"
+
+
+def test_bad_max_size(store_path):
+    with pytest.raises(ValueError, match="max_size must be greater than 96"):
+        MmapKeyValueStore(store_path, max_size=16)
@@ -0,0 +1,124 @@
+"""
+Unit tests for the NarrativeCacheKeeper module.
+"""
+import json
+import os
+import time
+from unittest import mock
+
+import pytest
+from NarrativeService.narrativecachekeeper import NarrativeCacheKeeper
+from NarrativeService.NarrativeListUtils import NarrativeListUtils, NarrativeObjectInfo
+
+from test.unit.test_narrativelistutils import SnapshotWorkspaceMock
+
+
+@pytest.fixture
+def ws():
+    ws = SnapshotWorkspaceMock()
+    for ws_id in range(1, 4):
+        ws.add_ws(ws_id, "some_user", "n", "r")
+    return ws
+
+
+def test_save_and_load(ws, tmp_path):
+    cache_file = str(tmp_path / "cache.json")
+    nlu = NarrativeListUtils(100)
+    keeper = NarrativeCacheKeeper(nlu, cache_file=cache_file)
+    keeper.warm_up(ws)
+    assert nlu.narrativeInfo.check_cache_size() == 3  # noqa: PLR2004
+    keeper.save()
+    with open(cache_file) as infile:
+        assert len(json.load(infile)) == 3  # noqa: PLR2004
+
+    new_nlu = NarrativeListUtils(100)
+    assert NarrativeCacheKeeper(new_nlu, cache_file=cache_file).load() == 3  # noqa: PLR2004
+    # keeps the LRU order
+    assert list(new_nlu.narrativeInfo.cache.keys()) == list(nlu.narrativeInfo.cache.keys())
+    ws.info_calls = []
+    items = new_nlu.list_public_narratives(ws)
+    assert ws.info_calls == []
+    assert len(items) == 3  # noqa: PLR2004
+    assert isinstance(items[0]["nar"], NarrativeObjectInfo)
+
+
+def test_load_bad_file(tmp_path):
+    nlu = NarrativeListUtils(100)
+    assert NarrativeCacheKeeper(nlu, cache_file=str(tmp_path / "nope.json")).load() == 0
+    bad_file = tmp_path / "bad.json"
+    bad_file.write_text("not json")
+    assert NarrativeCacheKeeper(nlu, cache_file=str(bad_file)).load() == 0
+    assert NarrativeCacheKeeper(nlu).load() == 0
+
+
+def test_start_warm_up(ws, tmp_path):
+    nlu = NarrativeListUtils(100)
+    keeper = NarrativeCacheKeeper(nlu, cache_file=str(tmp_path / "cache.json"))
+    with mock.patch("NarrativeService.narrativecachekeeper.os.register_at_fork") as at_fork:
+        keeper.start(ws_client=ws, warm_up="startup")
+        at_fork.assert_called_once_with(after_in_child=keeper._start_saving)
+    assert nlu.narrativeInfo.check_cache_size() == 3  # noqa: PLR2004
+    with pytest.raises(ValueError, match="warm_up must be one of"):
+        keeper.start(ws_client=ws, warm_up="sometimes")
+
+
+def test_warm_up_failure(ws):
+    ws.list_workspace_info = mock.MagicMock(side_effect=ConnectionError("oops"))
+    nlu = NarrativeListUtils(100)
+    NarrativeCacheKeeper(nlu).warm_up(ws)
+    assert nlu.narrativeInfo.check_cache_size() == 0
+
+
+def test_saving_starts_in_forked_workers(tmp_path):
+    cache_file = tmp_path / "cache.json"
+    keeper = NarrativeCacheKeeper(NarrativeListUtils(100), cache_file=str(cache_file),
+                                  save_interval=0.01)
+    with mock.patch("NarrativeService.narrativecachekeeper.os.register_at_fork"), \
+         mock.patch("NarrativeService.narrativecachekeeper.atexit.register") as register:
+        keeper.start()
+        register.assert_not_called()
+        assert not cache_file.exists()
+        keeper._start_saving()
+        register.assert_called_once_with(keeper.save)
+    try:
+        for _ in range(100):
+            if cache_file.exists():
+                break
+            time.sleep(0.01)
+        assert json.loads(cache_file.read_text()) == []
+    finally:
+        keeper.stop()
+
+
+def test_background_warm_up_in_one_worker(ws):
+    nlu = NarrativeListUtils(100)
+    keeper = NarrativeCacheKeeper(nlu)
+    with mock.patch("NarrativeService.narrativecachekeeper.os.register_at_fork") as at_fork:
+        keeper.start(ws_client=ws, warm_up="background")
+        at_fork.assert_called_once()
+    assert nlu.narrativeInfo.check_cache_size() == 0
+    with mock.patch("NarrativeService.narrativecachekeeper.threading.Thread") as thread:
+        # the first forked worker warms up, the rest don't
+        at_fork.call_args.kwargs["after_in_child"]()
+        thread.assert_called_once_with(target=keeper.warm_up, args=(ws,), daemon=True)
+        at_fork.call_args.kwargs["after_in_child"]()
+        thread.assert_called_once()
+
+
+def test_saving_starts_after_real_fork(tmp_path):
+    cache_file = tmp_path / "cache.json"
+    keeper = NarrativeCacheKeeper(NarrativeListUtils(100), cache_file=str(cache_file),
+                                  save_interval=0.01)
+    keeper.start()
+    pid = os.fork()
+    if pid == 0:
+        for _ in range(100):
+            if cache_file.exists():
+                os._exit(0)
+            time.sleep(0.01)
+        os._exit(1)
+    assert os.waitpid(pid, 0)[1] == 0
+    # the parent never saves
+    cache_file.unlink()
+    time.sleep(0.05)
+    assert not cache_file.exists()
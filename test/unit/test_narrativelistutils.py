@@ -0,0 +1,347 @@
+"""
+Unit tests for the incrementally refreshed narrative listings in NarrativeListUtils.
+"""
+import json
+from unittest import mock
+
+import pytest
+import requests
+from installed_clients.baseclient import ServerError
+from NarrativeService.NarrativeListUtils import (
+    NarrativeInfoCache,
+    NarrativeListUtils,
+    NarrativeObjectInfo,
+)
+from NarrativeService.ServiceUtils import ServiceUtils
+from NarrativeService.util.mmapstore import MmapKeyValueStore
+
+USER = "some_user"
+OTHER_USER = "other_user"
+
+
+class SnapshotWorkspaceMock:
+    """
+    Holds a set of workspaces, each with a Narrative as object 1, and answers
+    list_workspace_info like the Workspace would for USER - honoring excludeGlobal and
+    after_epoch. Every list_workspace_info call is recorded.
+    """
+    def __init__(self):
+        self.workspaces = {}
+        self.list_calls = []
+        self.info_calls = []
+        self.clock = 0
+
+    def add_ws(self, ws_id, owner, perm, globalread, name=None):
+        self.clock += 1
+        moddate = f"2024-01-01T00:{self.clock // 60:02d}:{self.clock % 60:02d}+0000"
+        meta = {"narrative": "1", "narrative_nice_name": name or f"Narrative {ws_id}"}
+        self.workspaces[ws_id] = [ws_id, f"ws_{ws_id}", owner, moddate, 1, perm, globalread,
+                                  "unlocked", meta]
+
+    def list_workspace_info(self, params):
+        self.list_calls.append(params)
+        infos = []
+        for ws_info in self.workspaces.values():
+            if params.get("excludeGlobal") and ws_info[5] == "n":
+                continue
+            if "after_epoch" in params and \
+               ServiceUtils.iso8601_to_millis_since_epoch(ws_info[3]) <= params["after_epoch"]:
+                continue
+            infos.append(ws_info)
+        return infos
+
+    def get_object_info3(self, params):
+        self.info_calls.append([obj["ref"] for obj in params["objects"]])
+        infos = []
+        for obj in params["objects"]:
+            ws_id = int(obj["ref"].split("/")[0])
+            infos.append([1, "Narrative", "KBaseNarrative.Narrative-4.0", "", 1, USER, ws_id,
+                          f"ws_{ws_id}", "", 0, {}])
+        return {"infos": infos}
+
+
+@pytest.fixture
+def ws():
+    ws = SnapshotWorkspaceMock()
+    ws.add_ws(1, USER, "a", "n")
+    ws.add_ws(2, OTHER_USER, "w", "n")
+    ws.add_ws(3, OTHER_USER, "n", "r")
+    ws.add_ws(4, USER, "a", "r")
+    return ws
+
+
+def _ws_ids(narratives):
+    return sorted(nar["ws"][0] for nar in narratives)
+
+
+def test_lists(ws):
+    nlu = NarrativeListUtils(100)
+    assert _ws_ids(nlu.list_my_narratives(USER, ws)) == [1, 4]
+    assert _ws_ids(nlu.list_shared_narratives(USER, ws)) == [2]
+    public = nlu.list_public_narratives(ws, USER)
+    assert _ws_ids(public) == [3, 4]
+    # the user's own permission is kept on public workspaces
+    assert {nar["ws"][0]: nar["ws"][5] for nar in public} == {3: "n", 4: "a"}
+    # anonymous users just see the public listing
+    assert {nar["ws"][0]: nar["ws"][5] for nar in nlu.list_public_narratives(ws)} == {
+        3: "n", 4: "n"
+    }
+
+
+def test_incremental_refresh(ws):
+    nlu = NarrativeListUtils(100)
+    nlu.list_my_narratives(USER, ws)
+    nlu.list_shared_narratives(USER, ws)
+    assert ws.list_calls[0] == {"excludeGlobal": 1}
+    assert "after_epoch" in ws.list_calls[1]
+    # the delta overlaps the newest moddate by a few seconds
+    assert ws.list_calls[1]["after_epoch"] == \
+        ServiceUtils.iso8601_to_millis_since_epoch(ws.workspaces[4][3]) - 5000
+
+    ws.add_ws(5, USER, "a", "n")
+    ws.add_ws(6, OTHER_USER, "r", "n")
+    assert _ws_ids(nlu.list_my_narratives(USER, ws)) == [1, 4, 5]
+    assert _ws_ids(nlu.list_shared_narratives(USER, ws)) == [2, 6]
+    assert all("after_epoch" in params for params in ws.list_calls[1:])
+
+
+def test_public_snapshot_drops_private(ws):
+    nlu = NarrativeListUtils(100)
+    assert _ws_ids(nlu.list_public_narratives(ws)) == [3, 4]
+    ws.add_ws(4, USER, "a", "n")
+    assert _ws_ids(nlu.list_public_narratives(ws)) == [3]
+    assert _ws_ids(nlu.list_my_narratives(USER, ws)) == [1, 4]
+
+
+def test_full_refresh(ws):
+    nlu = NarrativeListUtils(100, full_refresh_interval=300, user_full_refresh_interval=30)
+    with mock.patch("NarrativeService.NarrativeListUtils.time.monotonic", return_value=1000):
+        nlu.list_my_narratives(USER, ws)
+        assert _ws_ids(nlu.list_public_narratives(ws)) == [3, 4]
+    # deletes don't show up in a delta, only in the next full listing
+    del ws.workspaces[1]
+    del ws.workspaces[3]
+    with mock.patch("NarrativeService.NarrativeListUtils.time.monotonic", return_value=1020):
+        assert _ws_ids(nlu.list_my_narratives(USER, ws)) == [1, 4]
+    # user snapshots are fully re-listed much sooner than the public one
+    with mock.patch("NarrativeService.NarrativeListUtils.time.monotonic", return_value=1030):
+        assert _ws_ids(nlu.list_my_narratives(USER, ws)) == [4]
+        assert _ws_ids(nlu.list_public_narratives(ws)) == [3, 4]
+    with mock.patch("NarrativeService.NarrativeListUtils.time.monotonic", return_value=1300):
+        assert _ws_ids(nlu.list_public_narratives(ws)) == [4]
+    assert ["after_epoch" in params for params in ws.list_calls] == \
+        [False, False, True, False, True, False]
+
+
+def test_user_snapshots_are_separate(ws):
+    nlu = NarrativeListUtils(100)
+    nlu.list_my_narratives(USER, ws)
+    nlu.list_my_narratives(OTHER_USER, ws)
+    assert ws.list_calls == [{"excludeGlobal": 1}, {"excludeGlobal": 1}]
+    assert len(nlu.userSnapshots) == 2  # noqa: PLR2004
+
+
+@pytest.fixture
+def paging_ws():
+    ws = SnapshotWorkspaceMock()
+    ws.add_ws(1, USER, "a", "n", name="Banana")
+    ws.add_ws(2, "zed", "w", "r", name="apple")
+    ws.add_ws(3, USER, "a", "r", name="Cherry")
+    ws.add_ws(4, "amy", "r", "r", name="date")
+    ws.add_ws(5, USER, "a", "n", name="Elderberry")
+    ws.workspaces[6] = [6, "ws_6", USER, "2024-01-01T00:00:00+0000", 1, "a", "n", "unlocked", {}]
+    return ws
+
+
+def _page_ids(page):
+    return [nar["ws"][0] for nar in page["narratives"]]
+
+
+@pytest.mark.parametrize("sort_by,expected", [
+    ("moddate", [5, 3, 1]),
+    ("name", [1, 3, 5]),
+    ("owner", [1, 3, 5]),
+])
+def test_page_sorting(paging_ws, sort_by, expected):
+    nlu = NarrativeListUtils(100)
+    page = nlu.get_narrative_page("mine", USER, paging_ws, sort_by=sort_by)
+    assert _page_ids(page) == expected
+    assert page["total"] == 3  # noqa: PLR2004
+
+
+def test_page_public(paging_ws):
+    nlu = NarrativeListUtils(100)
+    page = nlu.get_narrative_page("public", USER, paging_ws, sort_by="owner")
+    assert _page_ids(page) == [4, 3, 2]
+    assert [nar["ws"][5] for nar in page["narratives"]] == ["r", "a", "w"]
+    page = nlu.get_narrative_page("shared", USER, paging_ws, sort_by="name")
+    assert _page_ids(page) == [2, 4]
+
+
+def test_page_only_fetches_page(paging_ws):
+    nlu = NarrativeListUtils(100)
+    page = nlu.get_narrative_page("mine", USER, paging_ws, offset=1, limit=1)
+    assert _page_ids(page) == [3]
+    assert page["total"] == 3  # noqa: PLR2004
+    assert paging_ws.info_calls == [["3/1"]]
+    page = nlu.get_narrative_page("mine", USER, paging_ws, offset=2, limit=5)
+    assert _page_ids(page) == [1]
+    page = nlu.get_narrative_page("mine", USER, paging_ws, offset=10, limit=5)
+    assert page == {"narratives": [], "total": 3}
+
+
+def test_page_index_cached(paging_ws):
+    nlu = NarrativeListUtils(100)
+    nlu.get_narrative_page("mine", USER, paging_ws)
+    snapshot = nlu.userSnapshots[USER]
+    index = snapshot.get_sorted("mine", None, "moddate")
+    # re-listing the same (overlapping) workspaces doesn't change the snapshot
+    nlu.get_narrative_page("mine", USER, paging_ws)
+    assert snapshot.get_sorted("mine", None, "moddate") is index
+    paging_ws.add_ws(7, USER, "a", "n")
+    page = nlu.get_narrative_page("mine", USER, paging_ws, limit=1)
+    assert _page_ids(page) == [7]
+
+
+def _many_ws(num):
+    ws = SnapshotWorkspaceMock()
+    for ws_id in range(1, num + 1):
+        ws.add_ws(ws_id, USER, "a", "n")
+    return ws
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_info_chunks(max_workers):
+    ws = _many_ws(10)
+    lookup = dict(ws.workspaces)
+    expected = NarrativeInfoCache(100).get_info_list(lookup, ws)
+    ws.info_calls = []
+    nic = NarrativeInfoCache(100, chunk_size=3, max_workers=max_workers)
+    assert nic.get_info_list(lookup, ws) == expected
+    assert sorted(len(refs) for refs in ws.info_calls) == [1, 3, 3, 3]
+    assert nic.check_cache_size() == 10  # noqa: PLR2004
+
+
+def _flaky_ws(failures, error):
+    ws = _many_ws(6)
+    real_get_info = ws.get_object_info3
+
+    def flaky_get_info(params):
+        first_ref = params["objects"][0]["ref"]
+        if failures.get(first_ref, 0) > 0:
+            failures[first_ref] -= 1
+            raise error
+        return real_get_info(params)
+
+    ws.get_object_info3 = flaky_get_info
+    return ws
+
+
+def _http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError("oops", response=response)
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+@pytest.mark.parametrize("error", [
+    ConnectionError("oops"),
+    requests.ConnectionError("oops"),
+    requests.ReadTimeout("oops"),
+    _http_error(503),
+    ServerError("Unknown", 0, "oops")
+])
+def test_info_chunk_retry(max_workers, error):
+    failures = {"4/1": 1}
+    ws = _flaky_ws(failures, error)
+    nic = NarrativeInfoCache(100, chunk_size=3, max_workers=max_workers)
+    with mock.patch("NarrativeService.NarrativeListUtils.time.sleep") as sleep:
+        items = nic.get_info_list(dict(ws.workspaces), ws)
+        assert [item["ws"][0] for item in items] == [1, 2, 3, 4, 5, 6]
+        # waits a little before trying again
+        sleep.assert_called_once()
+        assert 0 < sleep.call_args.args[0] <= 0.1  # noqa: PLR2004
+
+        # a chunk that keeps failing raises the error
+        nic.clear_cache()
+        failures["4/1"] = 2
+        with pytest.raises(type(error), match="oops"):
+            nic.get_info_list(dict(ws.workspaces), ws)
+
+
+@pytest.mark.parametrize("error", [
+    ServerError("JSONRPCError", -32500, "oops"),
+    _http_error(404),
+    ValueError("oops")
+])
+def test_info_chunk_no_retry(error):
+    failures = {"4/1": 1}
+    ws = _flaky_ws(failures, error)
+    nic = NarrativeInfoCache(100, chunk_size=3)
+    with mock.patch("NarrativeService.NarrativeListUtils.time.sleep") as sleep, \
+         pytest.raises(type(error), match="oops"):
+        nic.get_info_list(dict(ws.workspaces), ws)
+    sleep.assert_not_called()
+
+
+def test_info_entries_compact(ws):
+    nic = NarrativeInfoCache(100)
+    items = nic.get_info_list(dict(ws.workspaces), ws)
+    cached = nic.get_info_list(dict(ws.workspaces), ws)
+    for item, cached_item in zip(items, cached, strict=True):
+        assert isinstance(item["nar"], NarrativeObjectInfo)
+        assert cached_item["nar"] is item["nar"]
+    # the type string is shared between entries
+    assert items[0]["nar"].type is items[1]["nar"].type
+    # and they serialize the same as the object_info lists they came from
+    raw = ws.get_object_info3({"objects": [{"ref": "1/1"}]})["infos"][0]
+    assert json.dumps(items[0]["nar"]) == json.dumps(raw)
+
+
+def test_info_shared_store(ws, tmp_path):
+    store_path = str(tmp_path / "nar_info.bin")
+    first = NarrativeInfoCache(100, shared_store=MmapKeyValueStore(store_path))
+    items = first.get_info_list(dict(ws.workspaces), ws)
+    ws.info_calls = []
+    # another worker with its own store on the same file doesn't need to fetch anything
+    second = NarrativeInfoCache(100, shared_store=MmapKeyValueStore(store_path))
+    shared_items = second.get_info_list(dict(ws.workspaces), ws)
+    assert ws.info_calls == []
+    assert shared_items == items
+    assert isinstance(shared_items[0]["nar"], NarrativeObjectInfo)
+    # and doesn't copy them into its own cache
+    assert second.check_cache_size() == 0
+
+
+def test_list_categories(ws):
+    ws.add_ws(5, OTHER_USER, "n", "r")
+    ws.workspaces[5][8]["narratorial"] = "1"
+    ws.add_ws(6, USER, "a", "n")
+    ws.workspaces[6][8]["narratorial"] = "1"
+    nlu = NarrativeListUtils(100)
+    result = nlu.list_narrative_categories(["mine", "shared", "public", "narratorials"], USER, ws)
+    assert result["categories"] == {
+        "mine": [6, 4, 1],
+        "shared": [2],
+        "public": [5, 4, 3],
+        "narratorials": [6, 5],
+    }
+    # each narrative once, all in one lookup
+    assert _ws_ids(result["narratives"]) == [1, 2, 3, 4, 5, 6]
+    assert len(ws.info_calls) == 1
+    # the user's own permission is on the public ones
+    perms = {nar["ws"][0]: nar["ws"][5] for nar in result["narratives"]}
+    assert perms[4] == "a"
+    assert perms[5] == "n"
+
+    # the same as the separate listings
+    assert _ws_ids(nlu.list_my_narratives(USER, ws)) == [1, 4, 6]
+    assert _ws_ids(nlu.list_shared_narratives(USER, ws)) == [2]
+    assert _ws_ids(nlu.list_public_narratives(ws, USER)) == [3, 4, 5]
+
+
+def test_list_categories_anonymous(ws):
+    nlu = NarrativeListUtils(100)
+    result = nlu.list_narrative_categories(["mine", "public"], None, ws)
+    assert result["categories"] == {"mine": [], "public": [4, 3]}
+    assert ws.list_calls == [{}]
@@ -1,10 +1,19 @@
 """
 Unit tests for the NarrativeManager module.
 """
+import json
+import threading
+import time
 from unittest import mock
 
 import pytest
-from NarrativeService.narrativemanager import NARRATIVE_TYPE, NarrativeManager
+from NarrativeService.data.speccache import SpecCache
+from NarrativeService.narrativemanager import (
+    DOC_INCLUDED_PATHS,
+    NARRATIVE_TYPE,
+    NarrativeManager,
+    _safe_json_dumps,
+)
 
 
 def test_rename_narrative_ok_unit(config, mock_workspace_client, mock_user) -> None:
@@ -72,6 +81,112 @@ def test_get_narrative_doc_not_found(config, mock_workspace_client, mock_user):
         nm.get_narrative_doc(upa)
 
 
+def test_get_narrative_doc_concurrent(config, mock_workspace_client, mock_user):
+    narrative_ref = mock_workspace_client.make_fake_narrative("Doc Format Test", mock_user)
+    nm = NarrativeManager(config, mock_user, mock_workspace_client, mock.MagicMock())
+    # each call waits for the other two, so this only finishes if they're made at once
+    barrier = threading.Barrier(3, timeout=5)
+
+    def waits_for_others(method):
+        def call(params):
+            barrier.wait()
+            return method(params)
+        return call
+
+    calls = {}
+    for name in ["get_objects2", "list_objects", "get_permissions_mass"]:
+        calls[name] = mock.MagicMock(side_effect=waits_for_others(getattr(mock_workspace_client, name)))
+    with mock.patch.multiple(mock_workspace_client, **calls):
+        doc = nm.get_narrative_doc(narrative_ref + "/1")
+    assert len(doc["data_objects"]) == 9  # noqa: PLR2004
+    ws_id = int(narrative_ref.split("/")[0])
+    calls["list_objects"].assert_called_once_with({"ids": [ws_id], "includeMetadata": 0})
+
+
+def test_get_narrative_doc_not_found_error_first(config, mock_workspace_client, mock_user):
+    nm = NarrativeManager(config, mock_user, mock_workspace_client, mock.MagicMock())
+    # get_permissions_mass fails too, but the missing narrative is what gets reported
+    upa = "2000/2000/2000"
+    with mock.patch.object(mock_workspace_client, "get_permissions_mass",
+                           side_effect=ValueError("WS 2000 not found.")):
+        with pytest.raises(ValueError, match=f'Item with upa "{upa}" not found in workspace'):
+            nm.get_narrative_doc(upa)
+
+
+def test_get_narrative_doc_subset(config, mock_workspace_client, mock_user):
+    narrative_ref = mock_workspace_client.make_fake_narrative("Doc Format Test", mock_user)
+    ws_id = int(narrative_ref.split("/")[0])
+    # what the workspace returns for an older narrative, subset to the included paths
+    obj_data = {
+        "data": {"worksheets": [{"cells": [
+            {"cell_type": "markdown", "source": "# hi",
+             "metadata": {"kbase": {"attributes": {"title": "Intro"}}}},
+            {"cell_type": "code", "source": "print(1)", "metadata": {"kbase": {"type": "code"}}},
+            {"cell_type": "code", "metadata": {"kbase": {"type": "app"}}},
+            {"cell_type": "code", "metadata": {"kbase": {"type": "data", "dataCell": {
+                "objectInfo": {"name": "reads"}}}}},
+        ]}]},
+        "info": [1, "Narrative", NARRATIVE_TYPE, "", 3],
+    }
+    nm = NarrativeManager(config, mock_user, mock_workspace_client, mock.MagicMock())
+    with mock.patch.object(mock_workspace_client, "get_objects2",
+                           return_value={"data": [obj_data]}) as get_objects2:
+        doc = nm.get_narrative_doc(narrative_ref + "/3")
+    get_objects2.assert_called_once_with({"objects": [{
+        "ref": narrative_ref + "/3", "included": DOC_INCLUDED_PATHS
+    }]})
+    assert doc["cells"] == [
+        {"cell_type": "markdown", "desc": "Intro"},
+        {"cell_type": "code_cell", "desc": "print(1)"},
+        {"cell_type": "kbase_app", "desc": "KBase App"},
+        {"cell_type": "data", "desc": "reads"},
+    ]
+    assert doc["total_cells"] == 4  # noqa: PLR2004
+    assert doc["access_group"] == ws_id
+    assert doc["creator"] == ""
+    assert doc["narrative_title"] == ""
+    assert doc["version"] == 3  # noqa: PLR2004
+
+
+def test_get_narrative_docs(config, mock_workspace_client, mock_user):
+    refs = [mock_workspace_client.make_fake_narrative(f"Doc {i}", mock_user) + "/1"
+            for i in range(2)]
+    upas = [refs[0], "blah", "2000/1/1", refs[1], refs[0]]
+    nm = NarrativeManager(config, mock_user, mock_workspace_client, mock.MagicMock())
+    calls = {
+        name: mock.MagicMock(side_effect=getattr(mock_workspace_client, name))
+        for name in ["get_objects2", "list_objects", "get_permissions_mass"]
+    }
+    with mock.patch.multiple(mock_workspace_client, **calls):
+        results = nm.get_narrative_docs(upas)
+    assert [result["narrative_upa"] for result in results] == upas
+    for i in [0, 3, 4]:
+        assert "error" not in results[i]
+        assert results[i]["doc"] == nm.get_narrative_doc(upas[i])
+    assert "Incorrect upa format" in results[1]["error"]
+    assert results[2]["error"] == 'Item with upa "2000/1/1" not found in workspace database.'
+    assert "doc" not in results[1]
+    assert "doc" not in results[2]
+
+    assert calls["get_objects2"].call_count == 1
+    # one list_objects call per workspace, including the missing one
+    assert calls["list_objects"].call_count == 3  # noqa: PLR2004
+    # ws 2000 doesn't exist, so the first permissions call fails, and is made again without it
+    ws_ids = [int(ref.split("/")[0]) for ref in refs]
+    assert calls["get_permissions_mass"].call_args_list == [
+        mock.call({"workspaces": [{"id": ws_ids[0]}, {"id": 2000}, {"id": ws_ids[1]}]}),
+        mock.call({"workspaces": [{"id": ws_ids[0]}, {"id": ws_ids[1]}]}),
+    ]
+
+
+def test_get_narrative_docs_list_objects_error(config, mock_workspace_client, mock_user):
+    ref = mock_workspace_client.make_fake_narrative("Doc", mock_user) + "/1"
+    nm = NarrativeManager(config, mock_user, mock_workspace_client, mock.MagicMock())
+    with mock.patch.object(mock_workspace_client, "list_objects", side_effect=ValueError("nope")):
+        assert nm.get_narrative_docs([ref]) == [{"narrative_upa": ref, "error": "nope"}]
+    assert nm.get_narrative_docs([]) == []
+
+
 def test_revert_narrative_object(config, mock_workspace_client, mock_user):
     # set up narrative
     # simulate reverting fake narrative to version #2
@@ -104,6 +219,61 @@ def test_revert_narrative_object(config, mock_workspace_client, mock_user):
     assert revert_result[10]["name"] == new_name
 
 
+def test_revert_narrative_object_waits_for_index(config, mock_workspace_client, mock_user):
+    narrative_ref = mock_workspace_client.make_fake_narrative(
+        "SomeNiceName", mock_user, make_object_history=True
+    )
+    (ws_id, obj, _) = narrative_ref.split("/")
+    search_client = mock.MagicMock()
+    # a connection error, then not indexed, then found
+    search_client.search_workspace_by_id.side_effect = [ValueError("oops"), None, {"hit": 1}]
+    nm = NarrativeManager(config, mock_user, mock_workspace_client, search_client)
+    with mock.patch("NarrativeService.util.backoff.time.sleep") as sleep:
+        revert_result = nm.revert_narrative_object({"wsid": int(ws_id), "objid": int(obj), "ver": 2})
+    assert search_client.search_workspace_by_id.call_count == 3  # noqa: PLR2004
+    assert search_client.search_workspace_by_id.call_args == mock.call(
+        int(ws_id), int(obj), version=revert_result[4]
+    )
+    assert sleep.call_count == 2  # noqa: PLR2004
+    # short waits to start with, well under the old fixed second
+    assert sum(call.args[0] for call in sleep.call_args_list) < 1
+
+
+def test_revert_narrative_object_index_timeout(config, mock_workspace_client, mock_user):
+    narrative_ref = mock_workspace_client.make_fake_narrative(
+        "SomeNiceName", mock_user, make_object_history=True
+    )
+    (ws_id, obj, _) = narrative_ref.split("/")
+    search_client = mock.MagicMock()
+    search_client.search_workspace_by_id.return_value = None
+    nm = NarrativeManager({**config, "search-index-wait-timeout": "0.05"}, mock_user,
+                          mock_workspace_client, search_client)
+    with pytest.raises(TimeoutError, match=f"Timed out waiting for {ws_id}/{obj}/6 to be indexed"):
+        nm.revert_narrative_object({"wsid": int(ws_id), "objid": int(obj), "ver": 2})
+
+
+def test_revert_narrative_object_no_wait(config, mock_workspace_client, mock_user):
+    narrative_ref = mock_workspace_client.make_fake_narrative(
+        "SomeNiceName", mock_user, make_object_history=True
+    )
+    (ws_id, obj, _) = narrative_ref.split("/")
+    search_client = mock.MagicMock()
+    search_client.search_workspace_by_id.return_value = None
+    nm = NarrativeManager(config, mock_user, mock_workspace_client, search_client)
+    revert_result = nm.revert_narrative_object({"wsid": int(ws_id), "objid": int(obj), "ver": 2},
+                                               wait_for_index=False)
+    search_client.search_workspace_by_id.assert_not_called()
+
+    # the result identifies the version to poll for
+    new_version = {"wsid": revert_result[6], "objid": revert_result[0], "ver": revert_result[4]}
+    assert nm.is_version_indexed(new_version) is False
+    search_client.search_workspace_by_id.return_value = {"hit": 1}
+    assert nm.is_version_indexed(new_version) is True
+    search_client.search_workspace_by_id.assert_called_with(int(ws_id), int(obj), version=6)
+    with pytest.raises(ValueError, match="ver must be an integer"):
+        nm.is_version_indexed({"wsid": 1, "objid": 2})
+
+
 def test_revert_narrative_object_no_version(config, mock_workspace_client, mock_user):
     nm = NarrativeManager(config, mock_user, mock_workspace_client, mock.MagicMock())
     ws_id = 123
@@ -141,3 +311,185 @@ def test_revert_narrative_object_bad_version(config, mock_workspace_client, mock
             "objid": int(obj_id),
             "ver": ver_attempt
         })
+
+
+def _copy_src_info(obj_id):
+    return [obj_id, f"obj_{obj_id}", "KBaseModule.SomeType-1.0", "2024-01-01T00:00:00+0000",
+            1, "someone", 10, "src_ws", "", 0, None]
+
+
+class CopyWorkspaceMock(mock.MagicMock):
+    """
+    Copies objects slowly, keeping track of how many copies are running at once.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.copied = []
+
+    def copy_object(self, params):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+            self.copied.append(params["from"]["ref"])
+        if params["to"]["name"] == "obj_3":
+            raise ValueError("no room")
+        return _copy_src_info(len(self.copied))
+
+
+def test_complete_new_narrative_copies_concurrently(config, mock_user):
+    ws = CopyWorkspaceMock()
+    ws.get_object_info_new.return_value = [
+        _copy_src_info(1), _copy_src_info(2), None, _copy_src_info(3), _copy_src_info(4)
+    ]
+    ws.get_workspace_info.return_value = ["ws_info"]
+    nm = NarrativeManager({**config, "narrative-copy-max-workers": "2"}, mock_user, ws,
+                          mock.MagicMock())
+    import_data = ["10/1/1", "10/2/1", "missing/1", "10/3/1", "10/4/1"]
+    with pytest.raises(ValueError) as err:
+        nm._complete_new_narrative(5, 1, import_data, "false", "title", 1)
+    assert str(err.value) == (
+        "Unable to copy 2 of 5 objects into the new narrative:\n"
+        "missing/1: Object not found, or not accessible\n"
+        "10/3/1: no room"
+    )
+    # every object that exists is tried, no more than 2 at a time
+    assert sorted(ws.copied) == ["10/1/1", "10/2/1", "10/3/1", "10/4/1"]
+    assert ws.max_running == 2  # noqa: PLR2004
+    ws.get_object_info_new.assert_called_once_with({
+        "objects": [{"ref": ref} for ref in import_data], "includeMetadata": 0, "ignoreErrors": 1
+    })
+
+    ws.get_object_info_new.return_value = [_copy_src_info(1), _copy_src_info(2)]
+    assert nm._complete_new_narrative(5, 1, import_data[:2], "false", "title", 1) == ["ws_info"]
+    ws.get_workspace_info.assert_called_once_with({"id": 5})
+
+
+def test_fetch_narrative_objects_spec_cache(config, mock_user):
+    spec_cache = SpecCache(10, prepare=NarrativeManager.compile_cell_template)
+    cells = [{"app": "mod/app"}, {"method": "mod/method"}, {"markdown": "hi"}]
+    with mock.patch("NarrativeService.narrativemanager.NarrativeMethodStore") as nms_class:
+        nms = nms_class.return_value
+        nms.get_app_spec.return_value = [{"info": {"id": "mod/app"}}]
+        nms.get_method_spec.return_value = [
+            {"info": {"id": "mod/method"}, "widgets": {"input": "some_widget"}}
+        ]
+        for _ in range(3):
+            nm = NarrativeManager(config, mock_user, mock.MagicMock(), mock.MagicMock(),
+                                  spec_cache=spec_cache)
+            (narrative, _) = nm._fetch_narrative_objects("ws", cells, None, 0, "title")
+            assert narrative["cells"][0]["metadata"]["kb-cell"]["app"] == {"info": {"id": "mod/app"}}
+            assert narrative["cells"][1]["metadata"]["kb-cell"]["widget"] == "some_widget"
+    nms.get_app_spec.assert_called_once_with({"ids": ["mod/app"]})
+    nms.get_method_spec.assert_called_once_with({"ids": ["mod/method"]})
+
+
+def test_get_intro_cell_cached(config, mock_user, tmp_path):
+    intro_file = tmp_path / "intro-cell.json"
+    intro_file.write_text(json.dumps({"cell_type": "code", "source": "v1"}))
+    nm = NarrativeManager({**config, "intro-cell-file": str(intro_file)}, mock_user,
+                          mock.MagicMock(), mock.MagicMock())
+    cell = nm._get_intro_cell()
+    assert cell == {"cell_type": "code", "source": "v1"}
+    with mock.patch("builtins.open") as mock_open:
+        assert nm._get_intro_cell() is cell
+        mock_open.assert_not_called()
+
+    # a changed file is read again
+    intro_file.write_text(json.dumps({"cell_type": "code", "source": "version 2"}))
+    assert nm._get_intro_cell() == {"cell_type": "code", "source": "version 2"}
+
+
+def test_fetch_narrative_objects_metadata(config, mock_user):
+    nm = NarrativeManager(config, mock_user, mock.MagicMock(), mock.MagicMock())
+    (narrative, metadata_external) = nm._fetch_narrative_objects(
+        "some_ws", [{"markdown": "hi"}], None, 0, None
+    )
+    job_ids = {"methods": [], "apps": [], "job_usage": {"queue_time": 0, "run_time": 0}}
+    metadata = {
+        "job_ids": job_ids,
+        "format": "ipynb",
+        "creator": mock_user,
+        "ws_name": "some_ws",
+        "name": "Untitled",
+        "type": NARRATIVE_TYPE,
+        "description": "",
+        "data_dependencies": []
+    }
+    assert narrative["metadata"] == metadata
+    assert metadata_external == {
+        **metadata, "job_ids": json.dumps(job_ids), "data_dependencies": "[]"
+    }
+    assert list(metadata_external) == list(metadata)
+    # each narrative gets its own metadata to change
+    narrative["metadata"]["job_ids"]["apps"].append("job")
+    (narrative, _) = nm._fetch_narrative_objects("some_ws", [], None, 0, "title")
+    assert narrative["metadata"]["job_ids"] == job_ids
+    assert narrative["metadata"]["name"] == "title"
+
+
+def test_compile_cell_template(config, mock_user):
+    spec = {"info": {"id": "mod/app", "name": "Bob's \"App\""}, "widgets": {"input": "w"},
+            "parameters": [{"id": "x", "default_values": ["'"]}, 1, None, True]}
+    original = json.loads(json.dumps(spec))
+    template = NarrativeManager.compile_cell_template("apps", spec)
+    assert spec == original
+    escaped = {"info": {"id": "mod/app", "name": "Bob&apos;s &quot;App&quot;"},
+               "widgets": {"input": "w"},
+               "parameters": [{"id": "x", "default_values": ["&apos;"]}, 1, None, True]}
+    assert template.spec == escaped
+    assert template.spec_json == json.dumps(escaped)
+
+    nm = NarrativeManager(config, mock_user, mock.MagicMock(), mock.MagicMock())
+    params = [[1, "x", "y"]]
+    with mock.patch("NarrativeService.narrativemanager.uuid.uuid4", return_value="some-uuid"):
+        app_cell = nm._build_app_cell(2, template, params)
+        method_cell = nm._build_method_cell(3, template, params)
+    assert app_cell == {
+        "cell_type": "markdown",
+        "source": "<div id='kb-cell-2-some-uuid'></div>\n<script>"
+                  "$('#kb-cell-2-some-uuid').kbaseNarrativeAppCell({'appSpec' : '"
+                  + json.dumps(escaped) + "', 'cellId' : 'kb-cell-2-some-uuid'});</script>",
+        "metadata": {"kb-cell": {
+            "type": "kb_app",
+            "app": escaped,
+            "widget_state": [{"state": {"step": {"step_1": {"inputState": {"x": "y"}}}}}]
+        }}
+    }
+    assert method_cell["source"] == (
+        "<div id='kb-cell-3-some-uuid'></div>\n<script>"
+        "$('#kb-cell-3-some-uuid').kbaseNarrativeMethodCell({'method' : '"
+        + json.dumps(escaped) + "'});</script>"
+    )
+    assert method_cell["metadata"]["kb-cell"] == {
+        "type": "function_input",
+        "method": escaped,
+        "widget": "w",
+        "widget_state": [{"state": {"x": "y"}}]
+    }
+
+
+def test_safe_json_dumps():
+    obj = {
+        "it's": ["say \"hi\"", "it's", 1, 2.5, None, True, False, [], {}],
+        "nested": {"a": ("tuple's", ), "b": "\u00fc\n"},
+        1: float("inf"),
+        None: -0.5
+    }
+    original = json.loads(json.dumps(obj))
+    encoded = _safe_json_dumps(obj)
+    # string values are escaped, keys aren't, and the object is left alone
+    assert encoded == json.dumps({
+        "it's": ["say &quot;hi&quot;", "it&apos;s", 1, 2.5, None, True, False, [], {}],
+        "nested": {"a": ["tuple&apos;s"], "b": "\u00fc\n"},
+        1: float("inf"),
+        None: -0.5
+    })
+    assert json.loads(json.dumps(obj)) == original
+    with pytest.raises(TypeError, match="not JSON serializable"):
+        _safe_json_dumps({"a": object()})
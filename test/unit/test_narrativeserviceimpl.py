@@ -0,0 +1,128 @@
+"""
+Unit tests for the NarrativeService Impl methods, with a mocked Workspace.
+"""
+from unittest import mock
+
+import pytest
+from NarrativeService.NarrativeServiceImpl import NarrativeService
+from NarrativeService.NarrativeServiceServer import MethodContext
+
+from test.unit.test_narrativelistutils import OTHER_USER, USER, SnapshotWorkspaceMock
+
+
+@pytest.fixture
+def ws():
+    ws = SnapshotWorkspaceMock()
+    ws.add_ws(1, USER, "n", "r")
+    ws.add_ws(2, OTHER_USER, "n", "r")
+    ws.add_ws(3, OTHER_USER, "n", "n")
+    return ws
+
+
+@pytest.fixture
+def impl(config, ws):
+    with mock.patch("NarrativeService.NarrativeServiceImpl.Workspace", return_value=ws) as ws_cls:
+        yield NarrativeService(config)
+        # anonymous calls are made with an unauthenticated client
+        assert all(call.kwargs["token"] is None for call in ws_cls.call_args_list)
+
+
+def _anonymous_ctx():
+    ctx = MethodContext(None)
+    ctx.update({"token": None, "user_id": None, "authenticated": 0})
+    return ctx
+
+
+def _user_ctx():
+    ctx = MethodContext(None)
+    ctx.update({"token": "some_token", "user_id": USER, "authenticated": 1})
+    return ctx
+
+
+def test_list_narratives_anonymous(impl):
+    result = impl.list_narratives(_anonymous_ctx(), {"type": "public"})[0]
+    assert sorted(nar["ws"][0] for nar in result["narratives"]) == [1, 2]
+
+
+@pytest.mark.parametrize("params,error", [
+    ({"sort_by": "size"}, '"sort_by" parameter must be set to one of'),
+    ({"offset": -1}, '"offset" parameter must be an integer >= 0'),
+    ({"offset": "1"}, '"offset" parameter must be an integer >= 0'),
+    ({"offset": True}, '"offset" parameter must be an integer >= 0'),
+    ({"limit": 0}, '"limit" parameter must be an integer > 0'),
+    ({"limit": 1.5}, '"limit" parameter must be an integer > 0'),
+    ({"limit": True}, '"limit" parameter must be an integer > 0'),
+    ({"limit": False}, '"limit" parameter must be an integer > 0'),
+])
+def test_list_narratives_bad_paging(impl, params, error):
+    with pytest.raises(ValueError, match=error):
+        impl.list_narratives(_anonymous_ctx(), {"type": "public", **params})
+
+
+def test_list_narratorials_anonymous(impl):
+    result = impl.list_narratorials(_anonymous_ctx(), {})[0]
+    assert isinstance(result["narratorials"], list)
+
+
+def test_get_narrative_docs_max_upas(config):
+    impl = NarrativeService({**config, "narrative-docs-max-upas": "2"})
+    docs = [{"narrative_upa": "1/1/1", "error": "nope"}, {"narrative_upa": "2/1/1", "error": "nope"}]
+    with mock.patch("NarrativeService.NarrativeServiceImpl.NarrativeManager.get_narrative_docs",
+                    return_value=docs) as get_docs:
+        # at the limit is fine
+        result = impl.get_narrative_docs(_user_ctx(), {"narrative_upas": ["1/1/1", "2/1/1"]})[0]
+        assert result == {"docs": docs}
+        get_docs.assert_called_once_with(["1/1/1", "2/1/1"])
+        # over it isn't
+        with pytest.raises(ValueError,
+                           match="At most 2 narrative_upas can be requested at once, not 3"):
+            impl.get_narrative_docs(_user_ctx(), {"narrative_upas": ["1/1/1", "2/1/1", "3/1/1"]})
+        get_docs.assert_called_once()
+
+
+@pytest.fixture
+def revert_impl(config, mock_workspace_client):
+    search_client = mock.MagicMock()
+    with mock.patch("NarrativeService.NarrativeServiceImpl.Workspace",
+                    return_value=mock_workspace_client):
+        impl = NarrativeService(config)
+        impl._get_search_client = mock.MagicMock(return_value=search_client)
+        yield (impl, search_client)
+
+
+def _fake_narrative_version(mock_workspace_client, mock_user):
+    narrative_ref = mock_workspace_client.make_fake_narrative(
+        "SomeNiceName", mock_user, make_object_history=True
+    )
+    (ws_id, obj_id, _) = narrative_ref.split("/")
+    return {"wsid": int(ws_id), "objid": int(obj_id), "ver": 2}
+
+
+def test_revert_narrative_object_blocks(revert_impl, mock_workspace_client, mock_user):
+    (impl, search_client) = revert_impl
+    obj = _fake_narrative_version(mock_workspace_client, mock_user)
+    search_client.search_workspace_by_id.side_effect = [None, {"hit": 1}]
+    with mock.patch("NarrativeService.util.backoff.time.sleep") as sleep:
+        reverted = impl.revert_narrative_object(_user_ctx(), obj)[0]
+    # polled until the new version was indexed
+    assert search_client.search_workspace_by_id.call_count == 2  # noqa: PLR2004
+    search_client.search_workspace_by_id.assert_called_with(
+        obj["wsid"], obj["objid"], version=reverted[4]
+    )
+    sleep.assert_called_once()
+
+
+def test_revert_narrative_object_no_wait(revert_impl, mock_workspace_client, mock_user):
+    (impl, search_client) = revert_impl
+    obj = _fake_narrative_version(mock_workspace_client, mock_user)
+    search_client.search_workspace_by_id.return_value = None
+    result = impl.revert_narrative_object_no_wait(_user_ctx(), obj)[0]
+    search_client.search_workspace_by_id.assert_not_called()
+    reverted = result["reverted"]
+    new_version = {"wsid": obj["wsid"], "objid": obj["objid"], "ver": reverted[4]}
+    assert result["new_version"] == new_version
+
+    # the new version can then be polled for
+    assert impl.is_narrative_version_indexed(_user_ctx(), new_version) == [{"indexed": 0}]
+    search_client.search_workspace_by_id.return_value = {"hit": 1}
+    assert impl.is_narrative_version_indexed(_user_ctx(), new_version) == [{"indexed": 1}]
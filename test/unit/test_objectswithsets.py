@@ -0,0 +1,80 @@
+"""
+Unit tests for the ObjectsWithSets module.
+"""
+import threading
+
+import pytest
+from NarrativeService.data.objectswithsets import ObjectsWithSets
+
+WS_ID = 5
+
+
+def _obj_info(obj_id, obj_type="Some.Type-1.0"):
+    return [obj_id, f"obj_{obj_id}", obj_type, "", 1, "user", WS_ID, "ws", "", 0, {}]
+
+
+class ServiceMock:
+    """
+    Answers SetAPI list_sets and DataPalette list_data calls. If given a barrier, every call
+    waits on it, so the calls only finish if they're all made at once.
+    """
+    def __init__(self, barrier=None, error=None):
+        self.barrier = barrier
+        self.error = error
+
+    def call_method(self, method, params):
+        if self.barrier is not None:
+            self.barrier.wait()
+        if self.error is not None:
+            raise self.error
+        if method == "list_sets":
+            return {"sets": [{
+                "ref": f"{WS_ID}/1/1",
+                "info": _obj_info(1, "KBaseSets.ReadsSet-1.0"),
+                "items": [{"info": _obj_info(2)}]
+            }]}
+        return {
+            "data": [{"ref": f"{WS_ID}/2/1", "info": _obj_info(2), "dp_ref": "9/1/1"},
+                     {"ref": "8/1/1", "info": _obj_info(1), "dp_ref": "9/1/1"}],
+            "data_palette_refs": {str(WS_ID): "9/1/1"}
+        }
+
+
+class WorkspaceListMock:
+    def __init__(self, barrier=None):
+        self.barrier = barrier
+
+    def get_workspace_info(self, params):
+        if self.barrier is not None:
+            self.barrier.wait()
+        return [WS_ID, "ws", "user", "2024-01-01T00:00:00+0000", 3, "a", "n", "unlocked", {}]
+
+    def list_objects(self, params):
+        return [_obj_info(obj_id) for obj_id in range(1, 4)]
+
+
+def test_list_objects_with_sets_concurrent():
+    barrier = threading.Barrier(3, timeout=5)
+    ows = ObjectsWithSets(ServiceMock(barrier), ServiceMock(barrier), WorkspaceListMock(barrier))
+    result = ows.list_objects_with_sets(ws_id=WS_ID, include_data_palettes=1)
+    data = result["data"]
+    # the set first, then the other workspace objects, then the data palette object
+    assert [item["object_info"][0] for item in data] == [1, 2, 3, 1]
+    assert data[0]["set_items"] == {"set_items_info": [_obj_info(2)]}
+    assert data[1]["dp_info"] == {"ref": "9/1/1"}
+    assert data[3]["dp_info"] == {"ref": "9/1/1"}
+    assert result["data_palette_refs"] == {str(WS_ID): "9/1/1"}
+
+
+def test_list_objects_with_sets_no_palettes():
+    ows = ObjectsWithSets(ServiceMock(), None, WorkspaceListMock())
+    result = ows.list_objects_with_sets(ws_id=WS_ID, types=["KBaseSets.ReadsSet"])
+    assert [item["object_info"][0] for item in result["data"]] == [1]
+    assert "data_palette_refs" not in result
+
+
+def test_list_objects_with_sets_error_order():
+    ows = ObjectsWithSets(ServiceMock(error=ValueError("no sets")),
+                          ServiceMock(error=ValueError("no palettes")), WorkspaceListMock())
+    with pytest.raises(ValueError, match="no sets"):
+        ows.list_objects_with_sets(ws_id=WS_ID, include_data_palettes=1)
@@ -0,0 +1,102 @@
+"""
+Unit tests for the shared HTTP session.
+"""
+import os
+from unittest import mock
+
+import requests
+from installed_clients import baseclient
+from NarrativeService.util import session
+
+
+def test_get_session_is_shared():
+    assert session.get_session() is session.get_session()
+
+
+def test_configure_session():
+    config = {
+        "http-pool-connections": "3",
+        "http-pool-maxsize": "7",
+        "http-connect-retries": "2",
+        "http-retry-backoff": "0.5",
+        "http-keep-alive": "false"
+    }
+    old_session = session.get_session()
+    new_session = session.configure_session(config)
+    try:
+        assert new_session is not old_session
+        assert session.get_session() is new_session
+        adapter = new_session.get_adapter("https://ci.kbase.us/services/ws")
+        assert adapter._pool_connections == 3  # noqa: PLR2004
+        assert adapter._pool_maxsize == 7  # noqa: PLR2004
+        assert adapter.max_retries.total == 2  # noqa: PLR2004
+        assert adapter.max_retries.connect is None
+        assert adapter.max_retries.read == 0
+        assert adapter.max_retries.status == 0
+        assert adapter.max_retries.backoff_factor == 0.5  # noqa: PLR2004
+        assert new_session.headers["Connection"] == "close"
+    finally:
+        session.configure_session()
+
+
+def test_session_defaults():
+    default_session = session.configure_session()
+    adapter = default_session.get_adapter("http://localhost")
+    assert adapter._pool_maxsize == session.DEFAULT_POOL_MAXSIZE
+    assert default_session.headers["Connection"] == "keep-alive"
+
+
+def test_session_ignores_cookies(requests_mock):
+    url = "https://ci.kbase.us/services/ws"
+    requests_mock.post(url, json={}, headers={"Set-Cookie": "foo=bar; Path=/"})
+    s = session.configure_session()
+    s.post(url)
+    assert len(s.cookies) == 0
+
+
+def test_use_session_in():
+    orig_requests = baseclient._requests
+    s = session.configure_session()
+    try:
+        session.use_session_in(baseclient)
+        # the rest of the requests module is still there for the generated code
+        assert baseclient._requests.utils is requests.utils
+        with mock.patch.object(s, "post") as post:
+            post.return_value.status_code = 200
+            post.return_value.text = '{"token": "some_token"}'
+            assert baseclient._get_token("user", "pw", "https://auth.kbase.us") == "some_token"
+            post.return_value.ok = True
+            post.return_value.json.return_value = {"result": [{"x": 1}]}
+            client = baseclient.BaseClient("https://ci.kbase.us/services/ws", token="t")
+            assert client._call("https://ci.kbase.us/services/ws", "ws.m", []) == {"x": 1}
+        assert [c.args[0] for c in post.call_args_list] == [
+            "https://auth.kbase.us", "https://ci.kbase.us/services/ws"
+        ]
+    finally:
+        baseclient._requests = orig_requests
+        session.configure_session()
+
+
+def _in_child(check):
+    """Runs check in a forked child process, and returns whether it returned True."""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os._exit(0 if check() else 1)
+        except BaseException:
+            os._exit(2)
+    return os.waitpid(pid, 0)[1] == 0
+
+
+def test_session_not_shared_after_fork():
+    old_session = session.configure_session({"http-pool-maxsize": "7"})
+    try:
+        def check():
+            new_session = session.get_session()
+            return (new_session is not old_session
+                    and new_session.get_adapter("http://localhost")._pool_maxsize == 7  # noqa: PLR2004
+                    and session.get_session() is new_session)
+        assert _in_child(check)
+        assert session.get_session() is old_session
+    finally:
+        session.configure_session()
@@ -86,3 +86,17 @@ def test_make_notification_fail(mock_ws: MagicMock, config: dict[str, str]):
         "ok": 0,
         "error": "Unable to request share - couldn't get Narrative owners!"
     }
+
+
+@mock.patch("NarrativeService.sharing.sharemanager.feeds")
+@mock.patch("NarrativeService.sharing.sharemanager.ws.get_ws_admins", return_value=FAKE_ADMINS)
+def test_make_notification_cached_client(mock_ws, mock_feeds, config: dict[str, str]):  # noqa: ARG001
+    for key in REQUIRED_TOKEN_KEYS:
+        config[key] = "fake-token"
+    client_cache = MagicMock()
+    req = ShareRequester(
+        {"user": "kbasetest", "ws_id": 123, "share_level": "r"}, config, ws_client_cache=client_cache
+    )
+    assert req.request_share() == {"ok": 1}
+    client_cache.get_client.assert_called_once_with("fake-token")
+    assert mock_ws.call_args.kwargs["ws_client"] is client_cache.get_client.return_value
@@ -0,0 +1,107 @@
+"""
+Unit tests for the NMS spec cache.
+"""
+import threading
+from unittest import mock
+
+import pytest
+from NarrativeService.data.speccache import SpecCache
+
+
+def _spec(spec_id):
+    return {"info": {"id": spec_id, "name": f"name of {spec_id}"}}
+
+
+class SpecFetcher:
+    def __init__(self, missing=()):
+        self.calls = []
+        self.missing = missing
+
+    def __call__(self, ids):
+        self.calls.append(ids)
+        return [_spec(spec_id) for spec_id in ids if spec_id not in self.missing]
+
+
+def test_get_specs_cached():
+    cache = SpecCache(10)
+    fetch = SpecFetcher(missing=["nope"])
+    specs = cache.get_specs("apps", ["a/b", "c/d", "a/b", "nope"], fetch)
+    assert specs == {"a/b": _spec("a/b"), "c/d": _spec("c/d")}
+    assert fetch.calls == [["a/b", "c/d", "nope"]]
+    # only the missing ones are fetched, and apps and methods are cached apart
+    assert cache.get_specs("apps", ["c/d", "e/f"], fetch) == {"c/d": _spec("c/d"), "e/f": _spec("e/f")}
+    assert cache.get_specs("methods", ["a/b"], fetch) == {"a/b": _spec("a/b")}
+    assert cache.get_specs("apps", ["a/b"], fetch, tag="beta") == {"a/b": _spec("a/b")}
+    assert fetch.calls[1:] == [["e/f"], ["a/b"], ["a/b"]]
+    assert cache.check_cache_size() == 5  # noqa: PLR2004
+
+
+def test_get_specs_prepared():
+    cache = SpecCache(10, prepare=lambda kind, spec: (kind, spec["info"]["name"]))
+    fetch = SpecFetcher()
+    assert cache.get_specs("apps", ["a/b"], fetch) == {"a/b": ("apps", "name of a/b")}
+    assert cache.get_specs("methods", ["a/b"], fetch) == {"a/b": ("methods", "name of a/b")}
+    # prepared values are cached and shared
+    assert cache.get_specs("apps", ["a/b"], fetch)["a/b"] is cache.get_specs("apps", ["a/b"], fetch)["a/b"]
+    assert len(fetch.calls) == 2  # noqa: PLR2004
+
+
+def test_get_specs_ttl():
+    cache = SpecCache(10, ttl=300)
+    fetch = SpecFetcher()
+    with mock.patch("NarrativeService.data.speccache.time.monotonic", return_value=1000):
+        cache.get_specs("apps", ["a/b"], fetch)
+    with mock.patch("NarrativeService.data.speccache.time.monotonic", return_value=1299):
+        cache.get_specs("apps", ["a/b"], fetch)
+    assert len(fetch.calls) == 1
+    with mock.patch("NarrativeService.data.speccache.time.monotonic", return_value=1300):
+        cache.get_specs("apps", ["a/b"], fetch)
+    assert len(fetch.calls) == 2  # noqa: PLR2004
+
+
+def test_get_specs_lru():
+    cache = SpecCache(2)
+    fetch = SpecFetcher()
+    for spec_id in ["a/b", "c/d", "e/f"]:
+        cache.get_specs("apps", [spec_id], fetch)
+    cache.get_specs("apps", ["a/b"], fetch)
+    assert fetch.calls == [["a/b"], ["c/d"], ["e/f"], ["a/b"]]
+
+
+def test_get_specs_shared_fetch():
+    cache = SpecCache(10)
+    release = threading.Event()
+    fetch = SpecFetcher()
+    fetching = threading.Event()
+
+    def slow_fetch(ids):
+        fetching.set()
+        release.wait(5)
+        return fetch(ids)
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(
+        cache.get_specs("apps", ["a/b"], slow_fetch)))
+    first.start()
+    fetching.wait(5)
+    others = [threading.Thread(target=lambda: results.append(
+        cache.get_specs("apps", ["a/b"], slow_fetch))) for _ in range(5)]
+    for thread in others:
+        thread.start()
+    release.set()
+    for thread in [first, *others]:
+        thread.join(5)
+    assert results == [{"a/b": _spec("a/b")}] * 6
+    assert fetch.calls == [["a/b"]]
+
+
+def test_get_specs_error():
+    cache = SpecCache(10)
+
+    def fetch(ids):
+        raise ValueError("NMS is down")
+
+    with pytest.raises(ValueError, match="NMS is down"):
+        cache.get_specs("apps", ["a/b"], fetch)
+    # nothing is left waiting on the failed fetch
+    assert cache.get_specs("apps", ["a/b"], SpecFetcher()) == {"a/b": _spec("a/b")}
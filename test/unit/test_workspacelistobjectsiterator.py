@@ -0,0 +1,172 @@
+"""
+Unit tests for the WorkspaceListObjectsIterator module.
+"""
+import threading
+
+import pytest
+from NarrativeService.data.objectcache import WorkspaceObjectCache
+from NarrativeService.WorkspaceListObjectsIterator import WorkspaceListObjectsIterator
+
+
+class ListObjectsMock:
+    """
+    Answers list_objects with one object info per object id in the requested window,
+    for each of the requested workspaces. Keeps track of every call made.
+    """
+    def __init__(self, ws_info_list):
+        self.max_obj_ids = {ws_info[0]: ws_info[4] for ws_info in ws_info_list}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def list_objects(self, params):
+        with self._lock:
+            self.calls.append(params)
+        infos = []
+        for ws_id in params["ids"]:
+            last_id = min(params["maxObjectID"], self.max_obj_ids[ws_id])
+            for obj_id in range(params["minObjectID"], last_id + 1):
+                infos.append([obj_id, f"obj_{ws_id}_{obj_id}", "Some.Type-1.0", "", 1, "user", ws_id])
+        return infos
+
+
+def _ws_info(ws_id, max_obj_id):
+    return [ws_id, f"ws_{ws_id}", "user", "2024-01-01T00:00:00+0000", max_obj_id, "a", "n", "unlocked", {}]
+
+
+WS_INFO_LIST = [_ws_info(1, 25), _ws_info(2, 3), _ws_info(3, 7), _ws_info(4, 0)]
+
+
+def _list_all(max_workers, **kwargs):
+    ws = ListObjectsMock(WS_INFO_LIST)
+    iterator = WorkspaceListObjectsIterator(
+        ws, ws_info_list=WS_INFO_LIST, part_size=10, max_workers=max_workers, **kwargs
+    )
+    return [(info[6], info[0]) for info in iterator], ws.calls
+
+
+def test_sequential_lists_all_objects():
+    objects, calls = _list_all(1)
+    assert len(objects) == 35  # noqa: PLR2004
+    assert len(set(objects)) == len(objects)
+    # blocks: [4, 2, 3] (10 objects total), then [1] split into 3 windows
+    assert [c["ids"] for c in calls] == [[4, 2, 3], [1], [1], [1]]
+    assert [c["minObjectID"] for c in calls] == [1, 1, 11, 21]
+
+
+@pytest.mark.parametrize("max_workers", [2, 3, 8])
+def test_prefetch_keeps_order(max_workers):
+    expected, _ = _list_all(1)
+    objects, calls = _list_all(max_workers)
+    assert objects == expected
+    assert len(calls) == 4  # noqa: PLR2004
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_global_limit(max_workers):
+    objects, calls = _list_all(max_workers, global_limit=5)
+    assert len(objects) == 5  # noqa: PLR2004
+    if max_workers == 1:
+        # only the first block was ever requested
+        assert len(calls) == 1
+
+
+def test_early_close():
+    ws = ListObjectsMock(WS_INFO_LIST)
+    with WorkspaceListObjectsIterator(ws, ws_info_list=WS_INFO_LIST, part_size=10) as iterator:
+        next(iterator)
+    with pytest.raises(StopIteration):
+        next(iterator)
+    assert len(ws.calls) == 1
+
+
+def test_does_not_modify_params():
+    params = {"includeMetadata": 1}
+    ws = ListObjectsMock(WS_INFO_LIST)
+    list(WorkspaceListObjectsIterator(ws, ws_info_list=WS_INFO_LIST, list_objects_params=params,
+                                      part_size=10, max_workers=2))
+    assert params == {"includeMetadata": 1}
+    assert all(c["includeMetadata"] == 1 for c in ws.calls)
+
+
+def test_bad_max_workers():
+    with pytest.raises(ValueError, match="max_workers must be at least 1"):
+        WorkspaceListObjectsIterator(ListObjectsMock([]), ws_info_list=WS_INFO_LIST, max_workers=0)
+
+
+def test_preserve_order_and_skip_block():
+    ws = ListObjectsMock(WS_INFO_LIST)
+    skipped = []
+
+    def skip_block(block):
+        if block[0][0] == 1:
+            skipped.append(block)
+            return True
+        return False
+
+    objects = [(info[6], info[0]) for info in WorkspaceListObjectsIterator(
+        ws, ws_info_list=WS_INFO_LIST, part_size=10, preserve_order=True, skip_block=skip_block
+    )]
+    # blocks are made in the given order: [1], then [2, 3, 4]
+    assert [c["ids"] for c in ws.calls] == [[2, 3, 4]]
+    assert [[ws_info[0] for ws_info in block] for block in skipped] == [[1]]
+    assert len(objects) == 10  # noqa: PLR2004
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_skip_block_after_earlier_blocks(max_workers):
+    ws = ListObjectsMock(WS_INFO_LIST)
+    seen = []
+
+    def skip_block(block):
+        # skip everything once the first block's objects are all in
+        return len(seen) >= 25  # noqa: PLR2004
+
+    for info in WorkspaceListObjectsIterator(
+        ws, ws_info_list=WS_INFO_LIST, part_size=10, preserve_order=True,
+        max_workers=max_workers, skip_block=skip_block
+    ):
+        seen.append(info)
+    # block [1] is listed in 3 windows, block [2, 3, 4] is never listed
+    assert [(c["ids"], c["minObjectID"]) for c in ws.calls] == [([1], 1), ([1], 11), ([1], 21)]
+    assert len(seen) == 25  # noqa: PLR2004
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_object_cache(max_workers):
+    cache = WorkspaceObjectCache(10)
+    expected, first_calls = _list_all(max_workers, object_cache=cache)
+    assert cache.check_cache_size() == 4  # noqa: PLR2004
+    assert len(cache.get(WS_INFO_LIST[0], 0)) == 25  # noqa: PLR2004
+    assert cache.get(WS_INFO_LIST[0], 1) is None
+
+    # everything's cached, so no more calls
+    objects, calls = _list_all(max_workers, object_cache=cache)
+    assert calls == []
+    assert sorted(objects) == sorted(expected)
+
+    # a workspace with a new moddate gets listed again, on its own
+    changed_ws_info = list(WS_INFO_LIST)
+    changed_ws_info[2] = _ws_info(3, 8)
+    changed_ws_info[2][3] = "2024-02-01T00:00:00+0000"
+    ws = ListObjectsMock(changed_ws_info)
+    objects = list(WorkspaceListObjectsIterator(ws, ws_info_list=changed_ws_info, part_size=10,
+                                                max_workers=max_workers, object_cache=cache))
+    assert [c["ids"] for c in ws.calls] == [[3]]
+    assert len(objects) == 36  # noqa: PLR2004
+
+
+def test_object_cache_not_used_with_filters():
+    cache = WorkspaceObjectCache(10)
+    ws = ListObjectsMock(WS_INFO_LIST)
+    list(WorkspaceListObjectsIterator(ws, ws_info_list=WS_INFO_LIST, part_size=10,
+                                      list_objects_params={"type": "Some.Type"},
+                                      object_cache=cache))
+    assert cache.check_cache_size() == 0
+
+
+def test_object_cache_partial_listing():
+    # stopping early still caches blocks that were listed in full
+    cache = WorkspaceObjectCache(10)
+    _list_all(1, object_cache=cache, global_limit=5)
+    assert cache.check_cache_size() == 3  # noqa: PLR2004
+    assert cache.get(WS_INFO_LIST[0], 0) is None
@@ -237,15 +237,19 @@ class WorkspaceMock:
             ws_id = int(ws_id)
             obj_id = int(obj_id)
             if ws_id in self.internal_db and obj_id in self.internal_db[ws_id]["objects"]:
-                return_data["data"].append(self.internal_db[ws_id]["objects"][obj_id])
+                obj_data = self.internal_db[ws_id]["objects"][obj_id]
+                # for testing get_narrative_doc
+                obj_data["epoch"] = 0
+                obj_data["created"] = "1970-01-01T00:00:00+0000"
+                obj_data["orig_wsid"] = ws_id
+                return_data["data"].append(obj_data)
                 return_data["paths"].append(ref)
+            elif params.get("ignoreErrors"):
+                return_data["data"].append(None)
+                return_data["paths"].append(None)
             else:
                 # mock error from missing workspace or object
                 raise ServerError("JSONRPCError: -32500")
-        # for testing get_narrative_doc
-        return_data["data"][0]["epoch"] = 0
-        return_data["data"][0]["created"] = "1970-01-01T00:00:00+0000"
-        return_data["data"][0]["orig_wsid"] = ws_id
         return return_data
 
     def get_permissions_mass(self, params):